@@ -7,6 +7,7 @@ response.version = b'1.1'
 response.status = b'OK'
 response.status_code = 200
 response.headers[b'Content-Length'] = (1024 * 100)
+response.freeze()
 
 
 def handler(_):
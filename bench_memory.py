@@ -0,0 +1,64 @@
+import asyncio
+import gc
+import tracemalloc
+import stormhttp
+
+REQUEST = (
+    b'GET /index.html?page=1 HTTP/1.1\r\n'
+    b'Host: localhost:8080\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:50.0) Gecko/20100101 Firefox/50.0\r\n'
+    b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Accept-Encoding: gzip, deflate, br\r\n'
+    b'Cookie: session=0123456789abcdef; theme=dark\r\n'
+    b'Connection: keep-alive\r\n'
+    b'\r\n'
+)
+COUNT = 10000
+
+
+class IdleTransport(asyncio.WriteTransport):
+    def write(self, data: bytes):
+        pass
+
+    def writelines(self, list_of_data):
+        pass
+
+
+def measure(create) -> float:
+    """
+    Measures the memory that is kept alive by the objects that create() returns.
+    :param create: Function that creates one object.
+    :return: Average number of bytes per object.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [create() for _ in range(COUNT)]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return (total - COUNT * 8) / COUNT  # Minus the list holding the objects.
+
+
+def parsed_request() -> stormhttp.HttpRequest:
+    request = stormhttp.HttpRequest()
+    stormhttp.HttpParser(request).feed_data(REQUEST)
+    return request
+
+
+if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+    server = stormhttp.server.Server(loop=loop)
+    transports = iter([IdleTransport() for _ in range(COUNT)])
+
+    def idle_connection() -> stormhttp.server.ServerHttpProtocol:
+        protocol = stormhttp.server.ServerHttpProtocol(server)
+        protocol.connection_made(next(transports))
+        return protocol
+
+    print("Parsed request:  {:8.0f} bytes".format(measure(parsed_request)))
+    print("Idle connection: {:8.0f} bytes".format(measure(idle_connection)))
+    loop.close()
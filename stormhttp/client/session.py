@@ -140,7 +140,7 @@ class ClientSession:
 
         await self.open((host, port), ssl=ssl)
         async with self._lock:
-            self._writer.write(request.to_bytes())
+            self._writer.writelines(request.to_buffers())
             while True:
                 data = await self._reader.read(buffer_length)
                 if data:
@@ -1,4 +1,5 @@
 __all__ = [
+    "HttpPayloadTooLargeError",
     "SslError",
     "SslCertificateError",
     "SslCertificateVerificationError",
@@ -7,6 +8,10 @@ __all__ = [
 ]
 
 
+class HttpPayloadTooLargeError(Exception):
+    pass
+
+
 class SslError(Exception):
     pass
 
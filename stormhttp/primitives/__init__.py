@@ -4,6 +4,7 @@ from .headers import *
 from .parser import *
 from .request import *
 from .response import *
+from .stream import *
 from .url import *
 
 __all__ = message.__all__ + \
@@ -12,4 +13,5 @@ __all__ = message.__all__ + \
           parser.__all__ + \
           request.__all__ + \
           response.__all__ + \
+          stream.__all__ + \
           url.__all__
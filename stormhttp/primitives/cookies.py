@@ -11,6 +11,8 @@ _COOKIE_EXPIRE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
 
 
 class HttpCookie:
+    __slots__ = ("values", "domain", "path", "expires", "_max_age", "http_only", "secure", "_max_age_set")
+
     def __init__(self, domain: typing.Optional[bytes]=None, path: typing.Optional[bytes]=None,
                  expires: typing.Optional[datetime.datetime]=None, max_age: typing.Optional[int]=None,
                  http_only: bool=False, secure: bool=False):
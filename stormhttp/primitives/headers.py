@@ -1,4 +1,6 @@
+import collections.abc
 import datetime
+import functools
 import re
 import typing
 from .cookies import _COOKIE_EXPIRE_FORMAT
@@ -8,40 +10,125 @@ __all__ = [
 ]
 _QVALUE_REGEX = re.compile(b'\\s?([^,;]+)(?:;q=(-?[\\d\\.]+))?(?:,\\s?|$)')
 _QVALUE_DEFAULT = 1.0
-_HTTP_HEADER_KEY_CACHE = {}
+_HEADER_KEY_CACHE_SIZE = 1024
+_WELL_KNOWN_HEADERS = (
+    b'Accept', b'Accept-Charset', b'Accept-Encoding', b'Accept-Language', b'Accept-Ranges',
+    b'Access-Control-Allow-Credentials', b'Access-Control-Allow-Headers', b'Access-Control-Allow-Methods',
+    b'Access-Control-Allow-Origin', b'Access-Control-Expose-Headers', b'Access-Control-Max-Age',
+    b'Access-Control-Request-Headers', b'Access-Control-Request-Method', b'Age', b'Allow', b'Authorization',
+    b'Cache-Control', b'Connection', b'Content-Disposition', b'Content-Encoding', b'Content-Language',
+    b'Content-Length', b'Content-Location', b'Content-Range', b'Content-Type', b'Cookie', b'Date', b'DNT',
+    b'ETag', b'Expect', b'Expires', b'Forwarded', b'From', b'Host', b'If-Match', b'If-Modified-Since',
+    b'If-None-Match', b'If-Range', b'If-Unmodified-Since', b'Keep-Alive', b'Last-Modified', b'Link',
+    b'Location', b'Origin', b'Pragma', b'Proxy-Authorization', b'Range', b'Referer', b'Retry-After',
+    b'Sec-WebSocket-Accept', b'Sec-WebSocket-Extensions', b'Sec-WebSocket-Key', b'Sec-WebSocket-Protocol',
+    b'Sec-WebSocket-Version', b'Server', b'Set-Cookie', b'TE', b'Trailer', b'Transfer-Encoding', b'Upgrade',
+    b'Upgrade-Insecure-Requests', b'User-Agent', b'Vary', b'Via', b'WWW-Authenticate', b'X-Forwarded-For',
+    b'X-Forwarded-Host', b'X-Forwarded-Proto', b'X-Real-IP', b'X-Requested-With'
+)
 
+# Every common spelling of a well-known header maps to the same interned upper case key.
+_WELL_KNOWN_HEADER_KEYS = {}  # type: typing.Dict[bytes, bytes]
+for _name in _WELL_KNOWN_HEADERS:
+    for _spelling in (_name, _name.lower(), _name.upper(), _name.title()):
+        _WELL_KNOWN_HEADER_KEYS[_spelling] = _name.upper()
+
+# Other headers are upper cased through a bounded cache as clients can send any header name.
+_upper_header_key = functools.lru_cache(maxsize=_HEADER_KEY_CACHE_SIZE)(bytes.upper)
+
+
+def _header_key(key: bytes) -> bytes:
+    return _WELL_KNOWN_HEADER_KEYS.get(key, None) or _upper_header_key(key)
+
+
+class HttpHeaders(collections.abc.MutableMapping):
+    __slots__ = ("_index",)
 
-class HttpHeaders(dict):
     def __init__(self, *args, **kwargs):
-        self.update(*args, **kwargs)
+        """
+        Case-insensitive mapping of header keys to their list of values. A header with a
+        single value is stored without a list, the list is only created when it's accessed.
+        The lists returned by `headers[key]` and get() are copies, use add() to add a value.
+        :param args: Mapping or iterable of pairs of headers to add.
+        :param kwargs: Headers to add.
+        """
+        self._index = {}  # type: typing.Dict[bytes, typing.Union[bytes, typing.List[bytes]]]
+        if args or kwargs:
+            self.update(*args, **kwargs)
 
-    def __getitem__(self, key: bytes) -> bytes:
-        if key not in _HTTP_HEADER_KEY_CACHE:
-            _HTTP_HEADER_KEY_CACHE[key] = key.upper()
-        return dict.__getitem__(self, _HTTP_HEADER_KEY_CACHE[key])
+    def __getitem__(self, key: bytes) -> typing.List[bytes]:
+        val = self._index[_header_key(key)]
+        return list(val) if type(val) is list else [val]
 
     def __setitem__(self, key: bytes, val: typing.Union[bytes, typing.Iterable[bytes]]) -> None:
         if isinstance(val, int):
-            val = [b'%d' % val]
-        elif isinstance(val, bytes):
-            val = [val]
+            val = b'%d' % val
         elif isinstance(val, datetime.datetime):
-            val = [val.strftime(_COOKIE_EXPIRE_FORMAT).encode("utf-8")]
-        if key not in _HTTP_HEADER_KEY_CACHE:
-            _HTTP_HEADER_KEY_CACHE[key] = key.upper()
-        dict.__setitem__(self, _HTTP_HEADER_KEY_CACHE[key], val)
+            val = val.strftime(_COOKIE_EXPIRE_FORMAT).encode("utf-8")
+        elif not isinstance(val, (bytes, bytearray)):
+            val = list(val)
+            if len(val) == 1:
+                val = val[0]
+        self._index[_header_key(key)] = val
 
     def __delitem__(self, key: bytes) -> None:
-        dict.__delitem__(self, key.upper())
+        del self._index[_header_key(key)]
 
     def __contains__(self, key: bytes) -> bool:
-        return dict.__contains__(self, key.upper())
+        return _header_key(key) in self._index
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
 
     def __repr__(self):
         return "<HttpHeaders {}>".format(" ".join(["{}={}".format(key, val) for key, val in self.items()]))
 
     def get(self, key: bytes, default=None) -> typing.Union[None, typing.Iterable[bytes]]:
-        return dict.get(self, key.upper(), default)
+        val = self._index.get(_header_key(key), None)
+        if val is None:
+            return default
+        return list(val) if type(val) is list else [val]
+
+    def get_first(self, key: bytes, default: typing.Optional[bytes]=None) -> typing.Optional[bytes]:
+        """
+        Gets the first value of a header without creating a list.
+        :param key: Header to get the value of.
+        :param default: Returned if the header isn't set.
+        :return: First value of the header.
+        """
+        val = self._index.get(_header_key(key), None)
+        if val is None:
+            return default
+        return val[0] if type(val) is list else val
+
+    def add(self, key: bytes, val: bytes) -> None:
+        """
+        Adds a value to a header, keeping any values it already has.
+        This is how the parser adds every header it receives.
+        :param key: Header to add the value to.
+        :param val: Value to add.
+        :return: None
+        """
+        key = _WELL_KNOWN_HEADER_KEYS.get(key, None) or _upper_header_key(key)
+        index = self._index
+        current = index.get(key, None)
+        if current is None:
+            index[key] = val
+        elif type(current) is list:
+            current.append(val)
+        else:
+            index[key] = [current, val]
+
+    def clear(self) -> None:
+        self._index.clear()
+
+    def copy(self) -> 'HttpHeaders':
+        headers = HttpHeaders()
+        headers._index = {key: list(val) if type(val) is list else val for key, val in self._index.items()}
+        return headers
 
     def update(self, *args, **kwargs):
         for key, val in dict(*args, **kwargs).items():
@@ -64,6 +151,10 @@ class HttpHeaders(dict):
         return sorted(qlist, key=lambda k: k[1], reverse=True)
 
     def to_bytes(self) -> bytes:
-        return b'\r\n'.join((
-            b'\r\n'.join([b'%b: %b' % (key, val) for val in list_val])
-        ) for key, list_val in self.items())
+        lines = []
+        for key, val in self._index.items():
+            if type(val) is list:
+                lines.extend([b'%b: %b' % (key, item) for item in val])
+            else:
+                lines.append(b'%b: %b' % (key, val))
+        return b'\r\n'.join(lines)
@@ -4,12 +4,15 @@ import datetime
 import gzip
 import json
 import io
+import mmap
 import re
 import sys
+import tempfile
 import typing
 import zlib
 from .headers import HttpHeaders
 from .cookies import HttpCookies, HttpCookie, _COOKIE_EXPIRE_FORMAT
+from .stream import HttpBodyStream
 
 __all__ = [
     "HttpMessage"
@@ -18,66 +21,133 @@ _COOKIE_REGEX = re.compile(b'([^\\s=;]+)(?:=([^;]+))?(?:;|$)')
 _CHARSET_REGEX = re.compile(b'[^/]+/[^/]+;\s*charset=([^=;]+)')
 _COOKIE_META = {b'domain', b'path', b'expires', b'maxage', b'httponly', b'secure'}
 _SUPPORTED_ENCODINGS = {b'gzip', b'deflate', b'br', b'identity'}
+_BROTLI_MAX_QUALITY = 11
+_MAX_BODY_PREALLOCATION = 8388608
+
+
+def _transcode_body(body: bytes, current_encoding: bytes, encoding: bytes, level: typing.Optional[int]=None) -> bytes:
+    """
+    Decodes a body from its current Content-Encoding and encodes it with another.
+    This doesn't touch any HttpMessage so it can be run in an executor.
+    :param body: Body to transcode.
+    :param current_encoding: Current encoding of the body.
+    :param encoding: Encoding to encode the body with.
+    :param level: Compression level or None for the encoding's highest level.
+    :return: The transcoded body.
+    """
+    # Decoding the current encoding.
+    if current_encoding != b'identity':
+        if current_encoding == b'br':
+            body = brotli.decompress(body)
+        elif current_encoding == b'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body), mode="rb").read()
+        elif current_encoding == b'deflate':
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+
+    # Re-encoding with the desired encoding.
+    if encoding != b'identity':
+        if encoding == b'br':
+            body = brotli.compress(body, quality=_BROTLI_MAX_QUALITY if level is None else level)
+        elif encoding == b'gzip':
+            out = io.BytesIO()
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=9 if level is None else level) as compressor:
+                compressor.write(body)
+            body = out.getvalue()
+        elif encoding == b'deflate':
+            deflate = zlib.compressobj(9 if level is None else level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            body = deflate.compress(body) + deflate.flush()
+    return body
 
 
 class HttpMessage:
+    __slots__ = ("headers", "version", "body_stream", "body_spool_size", "_cookies", "_raw_cookies", "_body",
+                 "_body_len", "_body_expected", "_body_array", "_body_spool", "_is_header_complete", "_is_complete")
+
     def __init__(self):
         self.headers = HttpHeaders()
-        self.cookies = HttpCookies()
         self.version = b''
+        self.body_stream = None  # type: HttpBodyStream
+        self.body_spool_size = None  # type: typing.Optional[int]
+        self._cookies = HttpCookies()
+        self._raw_cookies = None  # type: typing.Optional[typing.Tuple[bool, typing.List[bytes]]]
 
         self._body = b''
         self._body_len = 0
-        self._body_buffer = []
-        self._header_buffer = []
+        self._body_expected = None  # type: typing.Optional[int]
+        self._body_array = None  # type: typing.Optional[bytearray]
+        self._body_spool = None  # type: typing.Optional[tempfile.SpooledTemporaryFile]
         self._is_header_complete = False
         self._is_complete = False
 
     def __len__(self) -> int:
         return self._body_len
 
+    def reset(self) -> None:
+        """
+        Clears the message so the object can be reused for another message.
+        :return: None
+        """
+        self.headers.clear()
+        self.version = b''
+        self.body_stream = None
+        self.body_spool_size = None
+        if self._cookies:
+            self._cookies = HttpCookies()  # The cookies may have been handed to someone else.
+        self._raw_cookies = None
+        self._body = b''
+        self._body_len = 0
+        self._body_expected = None
+        self._body_array = None
+        if self._body_spool is not None:
+            self._body_spool.close()
+            self._body_spool = None
+        self._is_header_complete = False
+        self._is_complete = False
+
     def is_complete(self) -> bool:
         return self._is_complete
 
     def is_header_complete(self) -> bool:
         return self._is_header_complete
 
-    def to_bytes(self) -> bytes:
-        raise NotImplementedError("HttpMessage.to_bytes() is not implemented.")
+    def to_head_bytes(self, extra_headers: bytes=b'') -> bytes:
+        """
+        Serializes the start line, headers and cookies of the message
+        including the blank line that separates them from the body.
+        :param extra_headers: Pre-serialized header lines separated by CRLF to add to the head.
+        :return: Head of the message.
+        """
+        raise NotImplementedError("HttpMessage.to_head_bytes() is not implemented.")
+
+    def to_bytes(self, extra_headers: bytes=b'') -> bytes:
+        return b''.join((self.to_head_bytes(extra_headers), self._body))
 
-    def set_encoding(self, encoding: bytes, set_headers: bool=True) -> None:
+    def to_buffers(self, extra_headers: bytes=b'') -> typing.Tuple[bytes, ...]:
+        """
+        Serializes the message as the head followed by the body without copying
+        the body, for writing with transport.writelines().
+        :param extra_headers: Pre-serialized header lines separated by CRLF to add to the head.
+        :return: Tuple of the head and the body if there is one.
+        """
+        if self._body_len:
+            return self.to_head_bytes(extra_headers), self._body
+        return self.to_head_bytes(extra_headers),
+
+    def set_encoding(self, encoding: bytes, set_headers: bool=True, level: typing.Optional[int]=None) -> None:
         """
         Sets the encoding of the body to be a certain Content-Encoding.
         Currently the only supported encodings are identity, gzip, delfate, and brotli.
         :param encoding: Encoding to set the body to be.
         :param set_headers: If True, modifies the headers to reflect the change.
+        :param level: Compression level or None for the encoding's highest level.
         :return: None
         """
         assert encoding in _SUPPORTED_ENCODINGS
-        current_encoding = self.headers.get(b'Content-Encoding', [b'identity'])[0]
+        current_encoding = self.headers.get_first(b'Content-Encoding', b'identity')
         if current_encoding == encoding or not self._body_len:
             return  # No-op if the encoding is already correct.
 
-        # Decoding the current encoding.
-        if current_encoding != b'identity':
-            if current_encoding == b'br':
-                self.body = brotli.decompress(self.body)
-            elif current_encoding == b'gzip':
-                self.body = gzip.GzipFile(fileobj=io.BytesIO(self.body), mode="rb").read()
-            elif current_encoding == b'deflate':
-                self.body = zlib.decompress(self.body, -zlib.MAX_WBITS)
-
-        # Re-encoding with the desired encoding.
-        if encoding != b'identity':
-            if encoding == b'br':
-                self.body = brotli.compress(self.body)
-            elif encoding == b'gzip':
-                out = io.BytesIO()
-                gzip.GzipFile(fileobj=out, mode="wb").write(self.body)
-                self.body = out.getvalue()
-            elif encoding == b'deflate':
-                deflate = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
-                self.body = deflate.compress(self.body) + deflate.flush()
+        self.body = _transcode_body(self.body, current_encoding, encoding, level)
 
         # Optionally set the headers.
         if set_headers:
@@ -93,26 +163,28 @@ class HttpMessage:
         :return: Body decoded as a string.
         """
         # If the body is encoded or compressed, need to decompress it before getting the string.
-        encoding = self.headers.get(b'Content-Encoding', [b'identity'])[0]
+        encoding = self.headers.get_first(b'Content-Encoding', b'identity')
         if encoding != b'identity':
             self.set_encoding(b'identity', set_headers=False)
         body = None
 
+        data = self.body
+
         # If the headers are giving us a hint, then try them first.
-        charset = _CHARSET_REGEX.match(self.headers.get(b'Content-Type', [b''])[0])
+        charset = _CHARSET_REGEX.match(self.headers.get_first(b'Content-Type', b''))
         if charset is not None:
             charset = charset.group(1).decode("utf-8")
             try:
-                body = self.body.decode(charset)
+                body = data.decode(charset)
             except UnicodeDecodeError:
                 pass
 
         # Otherwise try the system default encoding followed by cchardet attempting to detect encoding.
         if body is None:
             try:
-                body = self.body.decode(sys.getdefaultencoding())
+                body = data.decode(sys.getdefaultencoding())
             except UnicodeDecodeError:
-                body = self.body.decode(cchardet.detect(self.body)["encoding"])
+                body = data.decode(cchardet.detect(data)["encoding"])
 
         # Revert back to the old encoding.
         if encoding != b'identity':
@@ -128,65 +200,63 @@ class HttpMessage:
         """
         return loads(self.body_string(), *args, **kwargs)
 
+    @property
+    def content_length(self) -> typing.Optional[int]:
+        """
+        Length of the body announced by the Content-Length header of a parsed message.
+        :return: Announced length or None if the message has no Content-Length.
+        """
+        return self._body_expected
+
+    @property
+    def cookies(self) -> HttpCookies:
+        if self._raw_cookies is not None:
+            self._parse_cookies()
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, cookies: HttpCookies):
+        self._cookies = cookies
+        self._raw_cookies = None
+
     @property
     def body(self) -> bytes:
-        return self._body
+        body = self._body
+        if type(body) is not bytes:
+            # A body assembled in a buffer or spooled to a file is copied once, body_view avoids the copy.
+            body = self._body = bytes(body)
+            self._body_array = None
+        return body
+
+    @property
+    def body_view(self) -> memoryview:
+        """
+        Gets the body without copying it. A parsed body that arrived in several chunks
+        is a view of the buffer it was assembled in or of the file it was spooled to.
+        :return: memoryview of the body.
+        """
+        return memoryview(self._body)
 
     @body.setter
-    def body(self, body: bytes):
+    def body(self, body: typing.Union[bytes, bytearray, memoryview]):
         self._body = body
         self._body_len = len(body)
 
-    # httptools parser interface
-
-    def on_header(self, key: typing.Optional[bytes], val: typing.Optional[bytes]):
-        self._header_buffer.append((key, val))
-
-    def on_headers_complete(self) -> None:
-        _headers = {}
-        _key_buffer = []
-        _val_buffer = []
-        _key = None
-
-        for key, val in self._header_buffer:
-            if key is not None:
-                if _key_buffer is None:
-                    _key_buffer = [key]
-                    if _key is not None:
-                        if _key in _headers:
-                            _headers[_key].append(b''.join(_val_buffer))
-                        else:
-                            _headers[_key] = [b''.join(_val_buffer)]
-                    _key = None
-                else:
-                    _key_buffer.append(key)
-            if val is not None:
-                if _key is None:
-                    _key = b''.join(_key_buffer)
-                    _key_buffer = None
-                    _val_buffer = []
-                _val_buffer.append(val)
-        if _key is not None:
-            if _key in _headers:
-                _headers[_key].append(b''.join(_val_buffer))
-            else:
-                _headers[_key] = [b''.join(_val_buffer)]
-
-        self.headers.update(_headers)
-        if b'Cookie' in self.headers:
+    def _parse_cookies(self) -> None:
+        is_set_cookie, cookie_headers = self._raw_cookies
+        self._raw_cookies = None
+        cookies = self._cookies
+        if not is_set_cookie:
 
             # Add a single cookie for a b'Cookie' header.
-            cookie = HttpCookie(domain=_headers.get(b'Host', [None])[0])
+            cookie = HttpCookie(domain=self.headers.get_first(b'Host'))
 
-            for cookie_header in self.headers[b'Cookie']:
+            for cookie_header in cookie_headers:
                 for key, value in _COOKIE_REGEX.findall(cookie_header):
                     cookie.values[key] = value
-
-            self.cookies.add(cookie)
-            del self.headers[b'Cookie']
-
-        elif b'Set-Cookie' in self.headers:
-            for cookie_header in self.headers[b'Set-Cookie']:
+            cookies.add(cookie)
+        else:
+            for cookie_header in cookie_headers:
                 cookie = HttpCookie()
                 for key, value in _COOKIE_REGEX.findall(cookie_header):
                     key_lower = key.lower()
@@ -215,15 +285,79 @@ class HttpMessage:
                                 pass
                     else:
                         cookie.values[key] = value
-                self.cookies.add(cookie)
-            del self.headers[b'Set-Cookie']
+                cookies.add(cookie)
+
+    # httptools parser interface
 
+    def on_header(self, key: bytes, val: bytes):
+        self.headers.add(key, val)
+
+    def on_headers_complete(self) -> None:
+        # Cookies are only parsed once they're accessed, see HttpMessage.cookies.
+        headers = self.headers
+        if b'Cookie' in headers:
+            self._raw_cookies = (False, headers.pop(b'Cookie'))
+        elif b'Set-Cookie' in headers:
+            self._raw_cookies = (True, headers.pop(b'Set-Cookie'))
+        content_length = headers.get_first(b'Content-Length')
+        if content_length is not None:
+            try:
+                self._body_expected = int(content_length)
+            except ValueError:
+                pass
         self._is_header_complete = True
 
     def on_body(self, body: bytes) -> None:
-        self._body_buffer.append(body)
+        if self.body_stream is not None:
+            self._body_len += len(body)
+            self.body_stream.feed_data(body)
+            return
+        start = self._body_len
+        end = self._body_len = start + len(body)
+        expected = self._body_expected
+        if self._body_spool is not None:
+            self._body_spool.write(body)
+        elif self.body_spool_size is not None and max(end, expected or 0) > self.body_spool_size:
+            self._spill_body(start, body)
+        elif self._body_array is not None:
+            self._body_array[start:end] = body
+        elif start == 0:
+            # Chunks of a body of known length are copied into place instead of joined at the end.
+            if expected is not None and end < expected <= _MAX_BODY_PREALLOCATION:
+                self._body_array = bytearray(expected)
+                self._body_array[:end] = body
+            else:
+                self._body = body
+        else:
+            self._body_array = bytearray(self._body)
+            self._body_array += body
+            self._body = b''
 
     def on_message_complete(self) -> None:
-        self._body = b''.join(self._body_buffer)
-        self._body_len = len(self._body)
+        if self.body_stream is not None:
+            self.body_stream.feed_eof()
+        elif self._body_spool is not None:
+            spool = self._body_spool
+            spool.rollover()
+            spool.flush()
+            self._body = memoryview(mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ))
+        elif self._body_array is not None:
+            self._body = memoryview(self._body_array)[:self._body_len]
         self._is_complete = True
+
+    def _spill_body(self, start: int, body: bytes) -> None:
+        """
+        Moves the body received so far into a temporary file that the rest of
+        the body is written to. The complete body is memory-mapped from the file.
+        :param start: Number of bytes of the body received before this chunk.
+        :param body: Chunk of the body that pushed it over body_spool_size.
+        :return: None
+        """
+        spool = self._body_spool = tempfile.SpooledTemporaryFile(max_size=self.body_spool_size)
+        if self._body_array is not None:
+            spool.write(memoryview(self._body_array)[:start])
+            self._body_array = None
+        elif start:
+            spool.write(self._body)
+            self._body = b''
+        spool.write(body)
@@ -9,25 +9,39 @@ __all__ = [
 
 
 class HttpParser:
-    def __init__(self, message: typing.Optional[HttpMessage]=None):
+    def __init__(self, message: typing.Optional[HttpMessage]=None,
+                 on_message_complete: typing.Optional[typing.Callable[[HttpMessage], typing.Optional[HttpMessage]]]=None,
+                 on_headers_complete: typing.Optional[typing.Callable[[HttpMessage], None]]=None):
+        """
+        :param message: HttpMessage for the data to be parsed into.
+        :param on_message_complete: Optional callback that is called with every message that is
+                                    completely parsed. If it returns an HttpMessage then any data
+                                    following the completed message is parsed into that message
+                                    instead, this allows pipelined messages in a single chunk of data.
+        :param on_headers_complete: Optional callback that is called with every message once its
+                                    headers are parsed and before any of its body is parsed.
+        """
         self._message = None
         self._parser = None
-        self._headers_done = False
+        self._keep_alive = False
+        self._on_message_complete = on_message_complete
+        self._on_headers_complete = on_headers_complete
         if message is not None:
             self.set_target(message)
 
     def set_target(self, message: HttpMessage):
         """
-        Sets the HttpMessage for the data to be parsed into.
+        Sets the HttpMessage for the data to be parsed into. The underlying parser
+        is reused if the previous message was completely parsed and kept the connection alive.
         :param message: HttpRequest or HttpResponse to
         :return:
         """
-        if isinstance(message, HttpRequest):
-            self._parser = httptools.HttpRequestParser(message)
-        else:
-            self._parser = httptools.HttpResponseParser(message)
+        parser_type = httptools.HttpRequestParser if isinstance(message, HttpRequest) else httptools.HttpResponseParser
+        previous = self._message
+        if not (type(self._parser) is parser_type and self._keep_alive and previous is not None and previous.is_complete()):
+            self._parser = parser_type(self)
+        self._keep_alive = False
         self._message = message
-        self._headers_done = False
 
     def feed_data(self, data: bytes):
         """
@@ -36,10 +50,36 @@ class HttpParser:
         :return: None
         """
         self._parser.feed_data(data)
-        if not self._headers_done and self._message.is_header_complete():
-            self._headers_done = True
-            if isinstance(self._message, HttpRequest):
-                self._message.method = self._parser.get_method()
-            else:
-                self._message.status_code = self._parser.get_status_code()
-            self._message.version = self._parser.get_http_version().encode("utf-8")
+
+    # httptools parser interface, forwarded to the current HttpMessage.
+
+    def on_url(self, raw_url: bytes):
+        self._message.on_url(raw_url)
+
+    def on_status(self, status: bytes):
+        self._message.on_status(status)
+
+    def on_header(self, key: typing.Optional[bytes], val: typing.Optional[bytes]):
+        self._message.on_header(key, val)
+
+    def on_headers_complete(self):
+        message = self._message
+        message.on_headers_complete()
+        if isinstance(message, HttpRequest):
+            message.method = self._parser.get_method()
+        else:
+            message.status_code = self._parser.get_status_code()
+        message.version = self._parser.get_http_version().encode("utf-8")
+        self._keep_alive = self._parser.should_keep_alive()
+        if self._on_headers_complete is not None:
+            self._on_headers_complete(message)
+
+    def on_body(self, body: bytes):
+        self._message.on_body(body)
+
+    def on_message_complete(self):
+        self._message.on_message_complete()
+        if self._on_message_complete is not None:
+            message = self._on_message_complete(self._message)
+            if message is not None:
+                self._message = message
@@ -9,6 +9,8 @@ __all__ = [
 
 
 class HttpRequest(HttpMessage):
+    __slots__ = ("url", "method", "session", "connection", "cache_validators")
+
     def __init__(self, headers: typing.Dict[bytes, typing.Union[bytes, typing.Iterable[bytes]]]=None):
         HttpMessage.__init__(self)
         if headers is not None:
@@ -17,23 +19,42 @@ class HttpRequest(HttpMessage):
         self.url = None  # type: HttpUrl
         self.method = b''
         self.session = None  # type: ServerSession
+        self.connection = None  # type: ServerHttpProtocol
+        # ETag and Last-Modified that CacheControlMiddleware computed before the handler.
+        self.cache_validators = None  # type: typing.Optional[typing.Tuple[typing.Optional[bytes], typing.Any]]
+
+    def reset(self) -> None:
+        HttpMessage.reset(self)
+        self.url = None
+        self.method = b''
+        self.session = None
+        self.connection = None
+        self.cache_validators = None
+
+    @property
+    def is_disconnected(self) -> bool:
+        """
+        Checks whether the client that sent the request has disconnected.
+        Long-running handlers can check this to stop work nobody will receive.
+        :return: True if the connection the request was received on is lost.
+        """
+        return self.connection is not None and self.connection.is_disconnected
 
     def on_url(self, raw_url: bytes):
         if raw_url != b'':
             url = httptools.parse_url(raw_url)
             self.url = HttpUrl(raw_url, url.schema, url.host, url.port, url.path, url.query, url.fragment, url.userinfo)
-            if self.cookies:
-                for cookie in self.cookies.values():
-                    cookie.path = url.path
 
-    def to_bytes(self) -> bytes:
+    def to_head_bytes(self, extra_headers: bytes=b'') -> bytes:
         parts = [b'%b %b HTTP/%b' % (self.method, self.url.get(), self.version)]
         if self.headers:
             parts.append(self.headers.to_bytes())
         if self.cookies:
             parts.append(self.cookies.to_bytes())
+        if extra_headers:
+            parts.append(extra_headers)
+        parts.append(b'')
         parts.append(b'')
-        parts.append(self.body)
         return b'\r\n'.join(parts)
 
     def __repr__(self):
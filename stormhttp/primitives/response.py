@@ -1,13 +1,18 @@
+import copy
 import typing
 from .message import HttpMessage
 
 __all__ = [
+    "FileHttpResponse",
     "HttpResponse",
+    "StreamingHttpResponse",
     "TemplateHttpResponse"
 ]
 
 
 class HttpResponse(HttpMessage):
+    __slots__ = ("status_code", "status", "frozen_source", "_frozen")
+
     def __init__(self, headers: typing.Dict[bytes, typing.Union[bytes, typing.Iterable[bytes]]]=None,
                  status_code: int=0, status: bytes=b''):
         HttpMessage.__init__(self)
@@ -16,18 +21,83 @@ class HttpResponse(HttpMessage):
                 self.headers[key] = val
         self.status_code = status_code
         self.status = status
+        self.frozen_source = None  # type: typing.Optional[HttpResponse]
+        self._frozen = None  # type: typing.Optional[typing.Dict[typing.Tuple[bytes, typing.Optional[bytes]], typing.Tuple[bytes, bytes]]]
+
+    def reset(self) -> None:
+        HttpMessage.reset(self)
+        self.status_code = 0
+        self.status = b''
+        self.frozen_source = None
+        self._frozen = None
 
     def on_status(self, status: bytes):
         self.status = status
 
-    def to_bytes(self) -> bytes:
+    def freeze(self) -> 'HttpResponse':
+        """
+        Marks the response as constant so that its serialized head and body are
+        cached per HTTP version and Content-Encoding and reused every time the
+        response is written. A frozen response must not be modified afterwards,
+        middlewares with an after_handler() are given a copy of it instead.
+        :return: The response itself.
+        """
+        self._frozen = {}
+        return self
+
+    def is_frozen(self) -> bool:
+        return self._frozen is not None
+
+    def copy(self) -> 'HttpResponse':
+        """
+        Copies the status, headers, cookies and body of the response. The copy isn't frozen,
+        its frozen_source is the frozen response it was copied from, if any.
+        :return: The copy.
+        """
+        response = HttpResponse(status_code=self.status_code, status=self.status)
+        response.headers = self.headers.copy()
+        if self.cookies:
+            response.cookies = copy.deepcopy(self.cookies)
+        response.version = self.version
+        response.body = self._body
+        response.frozen_source = self if self._frozen is not None else self.frozen_source
+        return response
+
+    def frozen_buffers(self, version: bytes, encoding: typing.Optional[bytes]=None,
+                       level: typing.Optional[int]=None) -> typing.Tuple[bytes, bytes]:
+        """
+        Gets the cached serialization of a frozen response, serializing it on first use.
+        The head doesn't include the blank line that ends it so that more headers can be added.
+        :param version: HTTP version of the response.
+        :param encoding: Content-Encoding to encode the body with or None to leave it as is.
+        :param level: Compression level to use the first time the body is encoded.
+        :return: Tuple of the head and the body.
+        """
+        key = (version, encoding)
+        buffers = self._frozen.get(key, None)
+        if buffers is None:
+            response = HttpResponse(headers=self.headers, status_code=self.status_code, status=self.status)
+            response.cookies = self.cookies
+            response.version = version
+            response.body = self._body
+            if encoding is not None:
+                response.set_encoding(encoding, level=level)
+            if b'Content-Length' not in response.headers:
+                response.headers[b'Content-Length'] = len(response)
+            buffers = (response.to_head_bytes()[:-2], response.body)
+            self._frozen[key] = buffers
+        return buffers
+
+    def to_head_bytes(self, extra_headers: bytes=b'') -> bytes:
         parts = [b'HTTP/%b %d %b' % (self.version, self.status_code, self.status)]
         if self.headers:
             parts.append(self.headers.to_bytes())
         if self.cookies:
             parts.append(self.cookies.to_bytes(set_cookie=True))
+        if extra_headers:
+            parts.append(extra_headers)
+        parts.append(b'')
         parts.append(b'')
-        parts.append(self.body)
         return b'\r\n'.join(parts)
 
     def __repr__(self):
@@ -35,7 +105,54 @@ class HttpResponse(HttpMessage):
 
 
 class TemplateHttpResponse(HttpResponse):
+    __slots__ = ("template_info",)
+
     def __init__(self, headers: typing.Dict[bytes, typing.Union[bytes, typing.Iterable[bytes]]]=None,
                  status_code: int = 0, status: bytes = b''):
         self.template_info = {}  # typing.Dict[str, typing.Any]
         HttpResponse.__init__(self, headers, status_code, status)
+
+
+class StreamingHttpResponse(HttpResponse):
+    __slots__ = ("body_iterator",)
+
+    def __init__(self, body_iterator: typing.Union[typing.Iterable[bytes], typing.AsyncIterable[bytes]],
+                 headers: typing.Dict[bytes, typing.Union[bytes, typing.Iterable[bytes]]]=None,
+                 status_code: int=0, status: bytes=b''):
+        """
+        HttpResponse with a body that is produced while it is being sent.
+        The body is sent with Transfer-Encoding: chunked on HTTP/1.1 unless a
+        Content-Length header is set, on HTTP/1.0 the connection is closed
+        to mark the end of the body.
+        :param body_iterator: Iterable or async iterable of chunks of the body.
+        """
+        HttpResponse.__init__(self, headers, status_code, status)
+        self.body_iterator = body_iterator
+
+    def __repr__(self):
+        return "<StreamingHttpResponse status={} status_code={} headers={}>".format(self.status, self.status_code, self.headers)
+
+
+class FileHttpResponse(HttpResponse):
+    __slots__ = ("path", "segments", "trailer")
+
+    def __init__(self, path: str, segments: typing.List[typing.Tuple[bytes, int, int]], trailer: bytes=b'',
+                 headers: typing.Dict[bytes, typing.Union[bytes, typing.Iterable[bytes]]]=None,
+                 status_code: int=200, status: bytes=b'OK'):
+        """
+        HttpResponse with a body that is sent from a file without reading it into memory.
+        The Content-Length header must be set to the total length of the body.
+        :param path: Path of the file to send.
+        :param segments: List of bytes to write before a segment of the file,
+                         offset of the segment and number of bytes in the segment.
+        :param trailer: Bytes to write after the last segment.
+        """
+        HttpResponse.__init__(self, headers, status_code, status)
+        self.path = path
+        self.segments = segments
+        self.trailer = trailer
+
+    def __repr__(self):
+        return "<FileHttpResponse path={} status={} status_code={} headers={}>".format(
+            self.path, self.status, self.status_code, self.headers
+        )
@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import typing
+
+__all__ = [
+    "HttpBodyStream"
+]
+_DEFAULT_STREAM_LIMIT = 65536
+
+
+class HttpBodyStream:
+    def __init__(self, loop: asyncio.AbstractEventLoop, limit: int=_DEFAULT_STREAM_LIMIT,
+                 pause_reading: typing.Optional[typing.Callable[[], None]]=None,
+                 resume_reading: typing.Optional[typing.Callable[[], None]]=None):
+        """
+        Body of an HttpMessage that is delivered in chunks as it is received.
+        Iterate over it with `async for chunk in stream` or read it whole with `await stream.read()`.
+        :param loop: Event loop that the stream is fed from.
+        :param limit: Number of buffered bytes at which pause_reading is called.
+        :param pause_reading: Called when the buffered data exceeds the limit.
+        :param resume_reading: Called when the buffered data is consumed.
+        """
+        self._loop = loop
+        self._limit = limit
+        self._pause_reading = pause_reading
+        self._resume_reading = resume_reading
+        self._chunks = collections.deque()  # type: typing.Deque[bytes]
+        self._buffered = 0
+        self._paused = False
+        self._eof = False
+        self._discard = False
+        self._exception = None  # type: typing.Optional[Exception]
+        self._waiter = None  # type: typing.Optional[asyncio.Future]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        chunk = await self.read_chunk()
+        if chunk == b'':
+            raise StopAsyncIteration
+        return chunk
+
+    def at_eof(self) -> bool:
+        return self._eof and not self._chunks
+
+    async def read_chunk(self) -> bytes:
+        """
+        Reads the next chunk of the body as it was received.
+        :return: Chunk of the body or b'' if the body is complete.
+        """
+        while not self._chunks:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                return b''
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        chunk = self._chunks.popleft()
+        self._buffered -= len(chunk)
+        if self._paused and self._buffered <= self._limit:
+            self._paused = False
+            if self._resume_reading is not None:
+                self._resume_reading()
+        return chunk
+
+    async def read(self) -> bytes:
+        """
+        Reads the remaining body into memory.
+        :return: The rest of the body.
+        """
+        chunks = []
+        async for chunk in self:
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    # Interface for the protocol feeding the stream.
+
+    def discard(self) -> None:
+        """
+        Throws away buffered and future data, used once the reader of the stream is done.
+        :return: None
+        """
+        self._discard = True
+        self._chunks.clear()
+        self._buffered = 0
+        if self._paused:
+            self._paused = False
+            if self._resume_reading is not None:
+                self._resume_reading()
+
+    def feed_data(self, data: bytes) -> None:
+        if not data or self._discard:
+            return
+        self._chunks.append(data)
+        self._buffered += len(data)
+        self._wake_waiter()
+        if not self._paused and self._buffered > self._limit:
+            self._paused = True
+            if self._pause_reading is not None:
+                self._pause_reading()
+
+    def feed_eof(self) -> None:
+        self._eof = True
+        self._wake_waiter()
+
+    def set_exception(self, exception: Exception) -> None:
+        self._exception = exception
+        self._wake_waiter()
+
+    def _wake_waiter(self) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
@@ -1,13 +1,60 @@
-import re
+import collections.abc
 import typing
 
 __all__ = [
+    "HttpQuery",
     "HttpUrl"
 ]
-_QUERY_REGEX = re.compile(b'([^=&]+)=([^=&]+)')
+
+
+class HttpQuery(collections.abc.Mapping):
+    __slots__ = ("_values",)
+
+    def __init__(self, query_string: bytes=b''):
+        """
+        Multi-value mapping of the parameters of a query string. Looking up a key
+        gives its last value, getall() gives every value. Parameters without
+        a value, such as a in ?a&b=1, have the value b''.
+        :param query_string: Query string without the leading ?.
+        """
+        self._values = {}  # type: typing.Dict[bytes, typing.List[bytes]]
+        for pair in query_string.split(b'&'):
+            if pair:
+                key, _, val = pair.partition(b'=')
+                if key in self._values:
+                    self._values[key].append(val)
+                else:
+                    self._values[key] = [val]
+
+    def __getitem__(self, key: bytes) -> bytes:
+        return self._values[key][-1]
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._values
+
+    def __repr__(self):
+        return "<HttpQuery {}>".format(self._values)
+
+    def getall(self, key: bytes, default: typing.Optional[typing.List[bytes]]=None) -> typing.Optional[typing.List[bytes]]:
+        """
+        Gets every value of a parameter in the order they appear in the query string.
+        :param key: Parameter to get the values of.
+        :param default: Returned if the parameter isn't in the query string.
+        :return: List of values of the parameter.
+        """
+        return self._values.get(key, default)
 
 
 class HttpUrl:
+    __slots__ = ("raw", "schema", "host", "port", "path", "query_string", "fragment", "user_info",
+                 "_query", "_match_info", "_get_form")
+
     def __init__(self, raw: bytes=b'', schema: bytes=b'', host: bytes=b'', port: int=-1, path: bytes=b'',
                  query: bytes=b'', fragment: bytes=b'', user_info: bytes=b''):
         self.raw = raw
@@ -15,16 +62,34 @@ class HttpUrl:
         self.host = host if host is not None else b''
         self.port = port if port is not None else -1
         self.path = path if (path is not None and path != b'') else b'/'
-        self.query = {key: val for key, val in _QUERY_REGEX.findall(b'' if query is None else query)}
+        self.query_string = query if query is not None else b''
         self.fragment = fragment if fragment is not None else b''
         self.user_info = user_info if user_info is not None else b''
-        self.match_info = {}  # type: typing.Dict[bytes, bytes]
+        self._query = None  # type: typing.Optional[HttpQuery]
+        self._match_info = None  # type: typing.Optional[typing.Dict[bytes, typing.Any]]
         self._get_form = self.path + ((b'?' + query) if query else b'')
 
+    @property
+    def query(self) -> HttpQuery:
+        # Most handlers never look at the query so it's only parsed on first access.
+        if self._query is None:
+            self._query = HttpQuery(self.query_string)
+        return self._query
+
+    @property
+    def match_info(self) -> typing.Dict[bytes, typing.Any]:
+        if self._match_info is None:
+            self._match_info = {}
+        return self._match_info
+
+    @match_info.setter
+    def match_info(self, match_info: typing.Dict[bytes, typing.Any]):
+        self._match_info = match_info
+
     def get(self) -> bytes:
         return self._get_form
 
     def __repr__(self):
         return "<HttpUrl raw={} schema={} host={} port={} path={} query={}, match_info={}, user_info={}>".format(
-            self.raw, self.schema, self.host, self.port, self.path, self.query, self.match_info, self.user_info
+            self.raw, self.schema, self.host, self.port, self.path, self.query_string, self.match_info, self.user_info
         )
@@ -1,5 +1,13 @@
 from . import middleware, websockets
+from .admission import *
+from .compression import *
+from .router import *
 from .server import *
+from .static import *
 
 __all__ = ["middleware", "websockets"] + \
-          server.__all__
+          admission.__all__ + \
+          compression.__all__ + \
+          router.__all__ + \
+          server.__all__ + \
+          static.__all__
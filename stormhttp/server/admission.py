@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import typing
+from .router import Route
+from ..primitives import HttpResponse
+
+__all__ = [
+    "AdmissionController"
+]
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: typing.Optional[int]=None, max_queue: int=128,
+                 queue_timeout: float=1.0, retry_after: int=1):
+        """
+        Limits the number of requests that the Server handles at once. Requests over the
+        limit wait in a bounded queue for up to queue_timeout seconds, requests that find
+        the queue full or time out are answered with a 503 Service Unavailable right away.
+        Routes can have their own limit, see Server.add_route().
+        :param max_in_flight: Maximum number of requests handled at once or None for no global limit.
+        :param max_queue: Maximum number of requests waiting to be handled.
+        :param queue_timeout: Number of seconds a request waits to be handled before it's shed.
+        :param retry_after: Value of the Retry-After header of the 503 in seconds.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.overloaded_response = HttpResponse(
+            status_code=503, status=b'Service Unavailable', headers={b'Retry-After': b'%d' % retry_after}
+        ).freeze()
+        self._route_in_flight = collections.Counter()  # type: typing.Dict[Route, int]
+        self._queue = collections.deque()  # type: typing.Deque[typing.Tuple[Route, asyncio.Future]]
+        self._queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    def acquire(self, route: Route) -> typing.Union[bool, asyncio.Future]:
+        """
+        Tries to admit a request to a route.
+        :param route: Route of the request.
+        :return: True if the request is admitted, False if it's shed or a Future that
+                 resolves to True once the request is admitted or False if it times out.
+        """
+        # Requests still queued while there is capacity are waiting on their route's own limit.
+        if self._has_capacity(route):
+            self._admit(route)
+            return True
+        if self._queue_depth >= self.max_queue:
+            self.shed += 1
+            return False
+
+        # Waiters time out in the order they were queued, so expired ones collect at the front.
+        queue = self._queue
+        while queue and queue[0][1].done():
+            queue.popleft()
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        queue.append((route, waiter))
+        self._queue_depth += 1
+        loop.call_later(self.queue_timeout, self._expire, waiter)
+        return waiter
+
+    def release(self, route: Route) -> None:
+        """
+        Marks a request as handled and admits waiting requests that now fit.
+        :param route: Route of the request.
+        :return: None
+        """
+        self.in_flight -= 1
+        self._route_in_flight[route] -= 1
+
+        queue = self._queue
+        blocked = []
+        while queue and (self.max_in_flight is None or self.in_flight < self.max_in_flight):
+            waiting_route, waiter = queue.popleft()
+            if waiter.done():
+                continue
+            if not self._has_capacity(waiting_route):
+                blocked.append((waiting_route, waiter))
+                continue
+            self._queue_depth -= 1
+            self._admit(waiting_route)
+            waiter.set_result(True)
+
+        # Requests for routes at their own limit keep their place in the queue.
+        queue.extendleft(reversed(blocked))
+
+    def abandon(self, route: Route, waiter: asyncio.Future) -> None:
+        """
+        Gives up on a queued request whose handling was cancelled,
+        releasing the request if it had already been admitted.
+        :param route: Route of the request.
+        :param waiter: Future returned by acquire().
+        :return: None
+        """
+        if waiter.cancelled() or not waiter.done():
+            waiter.cancel()
+            self._queue_depth -= 1
+        elif waiter.result():
+            self.release(route)
+
+    def _has_capacity(self, route: Route) -> bool:
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return False
+        return route.max_in_flight is None or self._route_in_flight[route] < route.max_in_flight
+
+    def _admit(self, route: Route) -> None:
+        self.in_flight += 1
+        self._route_in_flight[route] += 1
+        self.admitted += 1
+
+    def _expire(self, waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            self._queue_depth -= 1
+            self.timed_out += 1
+            self.shed += 1
+            waiter.set_result(False)
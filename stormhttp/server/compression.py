@@ -0,0 +1,102 @@
+import typing
+from ..primitives import HttpRequest
+from ..primitives.message import _SUPPORTED_ENCODINGS
+
+__all__ = [
+    "CompressionPolicy"
+]
+# Content types that are already compressed. Entries ending in / match every subtype.
+_DEFAULT_SKIP_CONTENT_TYPES = (
+    b'audio/', b'video/', b'image/jpeg', b'image/png', b'image/gif', b'image/webp', b'image/avif',
+    b'font/woff', b'font/woff2', b'application/zip', b'application/gzip', b'application/x-gzip',
+    b'application/x-bzip2', b'application/x-xz', b'application/x-7z-compressed',
+    b'application/x-rar-compressed', b'application/pdf', b'application/octet-stream'
+)
+_DEFAULT_DYNAMIC_LEVELS = {b'br': 4, b'gzip': 6, b'deflate': 6}
+_DEFAULT_STATIC_LEVELS = {b'br': 11, b'gzip': 9, b'deflate': 9}
+_DEFAULT_SATURATED_LEVELS = {b'br': 1, b'gzip': 1, b'deflate': 1}
+
+
+class CompressionPolicy:
+    def __init__(self, min_length: int=1400,
+                 skip_content_types: typing.Iterable[bytes]=_DEFAULT_SKIP_CONTENT_TYPES,
+                 content_type_min_lengths: typing.Optional[typing.Dict[bytes, int]]=None,
+                 dynamic_levels: typing.Optional[typing.Dict[bytes, int]]=None,
+                 static_levels: typing.Optional[typing.Dict[bytes, int]]=None,
+                 saturated_levels: typing.Optional[typing.Dict[bytes, int]]=None,
+                 saturated_loop_lag: float=0.05):
+        """
+        Decides which responses the Server compresses and how hard. Dynamic responses are
+        compressed for every request so they use cheaper levels than static (frozen) responses
+        that are compressed once. While the event loop is saturated dynamic responses are
+        compressed with the cheapest levels.
+        :param min_length: Bodies of this many bytes or fewer aren't compressed.
+        :param skip_content_types: Content types that are never compressed, entries ending in / match every subtype.
+        :param content_type_min_lengths: Minimum lengths for specific content types that override min_length.
+        :param dynamic_levels: Compression level per encoding for dynamic responses.
+        :param static_levels: Compression level per encoding for static responses.
+        :param saturated_levels: Compression level per encoding for dynamic responses while the loop is saturated.
+        :param saturated_loop_lag: Event loop lag in seconds at which the loop counts as saturated.
+        """
+        self.min_length = min_length
+        self.skip_content_types = set()  # type: typing.Set[bytes]
+        self.skip_content_type_prefixes = []  # type: typing.List[bytes]
+        for content_type in skip_content_types:
+            if content_type.endswith(b'/'):
+                self.skip_content_type_prefixes.append(content_type.lower())
+            else:
+                self.skip_content_types.add(content_type.lower())
+        self.content_type_min_lengths = {
+            content_type.lower(): length for content_type, length in (content_type_min_lengths or {}).items()
+        }
+        self.dynamic_levels = dict(_DEFAULT_DYNAMIC_LEVELS if dynamic_levels is None else dynamic_levels)
+        self.static_levels = dict(_DEFAULT_STATIC_LEVELS if static_levels is None else static_levels)
+        self.saturated_levels = dict(_DEFAULT_SATURATED_LEVELS if saturated_levels is None else saturated_levels)
+        self.saturated_loop_lag = saturated_loop_lag
+
+    def should_compress(self, content_type: typing.Optional[bytes], length: int) -> bool:
+        """
+        Checks whether a body should be compressed at all.
+        :param content_type: Value of the Content-Type header or None.
+        :param length: Length of the body in bytes.
+        :return: True if the body should be compressed.
+        """
+        if length <= self.min_length and not self.content_type_min_lengths:
+            return False
+        if content_type is None:
+            return length > self.min_length
+        content_type = content_type.partition(b';')[0].strip().lower()
+        if content_type in self.skip_content_types:
+            return False
+        for prefix in self.skip_content_type_prefixes:
+            if content_type.startswith(prefix):
+                return False
+        return length > self.content_type_min_lengths.get(content_type, self.min_length)
+
+    def level(self, encoding: bytes, is_static: bool=False, loop_lag: float=0.0) -> typing.Optional[int]:
+        """
+        Gets the compression level to encode a body with.
+        :param encoding: Content-Encoding the body is encoded with.
+        :param is_static: True if the encoded body is reused for many requests.
+        :param loop_lag: Current lag of the event loop in seconds.
+        :return: Compression level or None for the encoding's default.
+        """
+        if is_static:
+            return self.static_levels.get(encoding, None)
+        if loop_lag >= self.saturated_loop_lag:
+            return self.saturated_levels.get(encoding, None)
+        return self.dynamic_levels.get(encoding, None)
+
+    def negotiate(self, request: HttpRequest, content_type: typing.Optional[bytes], length: int) -> typing.Optional[bytes]:
+        """
+        Chooses the Content-Encoding to compress a body with from the request's Accept-Encoding header.
+        :param request: Request the body is sent in response to.
+        :param content_type: Value of the Content-Type header or None.
+        :param length: Length of the body in bytes.
+        :return: Encoding or None if the body should be sent as it is.
+        """
+        if b'Accept-Encoding' in request.headers and self.should_compress(content_type, length):
+            for encoding, qvalue in request.headers.qlist(b'Accept-Encoding'):
+                if encoding in _SUPPORTED_ENCODINGS and qvalue > 0:
+                    return None if encoding == b'identity' else encoding
+        return None
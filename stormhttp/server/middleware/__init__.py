@@ -1,11 +1,13 @@
 from .abc import *
 from .cors import *
 from .cache import *
+from .coalescing import *
 from .sessions import *
 from .templating import *
 
 __all__ = abc.__all__ + \
           cors.__all__ + \
           cache.__all__ + \
+          coalescing.__all__ + \
           sessions.__all__ + \
           templating.__all__
@@ -1,6 +1,7 @@
 import abc
 import types
 import typing
+from ..router import Route
 from ...primitives import HttpRequest, HttpResponse
 
 __all__ = [
@@ -18,12 +19,36 @@ class AbstractMiddleware(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def after_handler(self, request: HttpRequest, response: HttpResponse) -> typing.Optional[types.CoroutineType]:
+    def after_handler(self, request: HttpRequest, response: HttpResponse) -> typing.Union[types.CoroutineType, typing.Optional[HttpResponse]]:
+        """
+        Called with the response of the handler, after_handler() of the middlewares
+        is called in the reverse order that before_handler() was called in.
+        :param request: Request that was handled.
+        :param response: Response of the handler or of a later middleware.
+        :return: None or an HttpResponse to replace the response with.
+        """
         pass
 
     def should_be_applied(self, request: HttpRequest):
         return self.all_routes or request.url.path in self.routes
 
+    def should_be_applied_to_route(self, route: Route) -> typing.Optional[bool]:
+        """
+        Decides whether the middleware applies to a route when the Server compiles
+        the route's middleware chain. Returns None if the decision depends on the
+        request, in which case should_be_applied() is called for every request.
+        Middlewares that override should_be_applied() are always asked per request.
+        :param route: Route that is being compiled.
+        :return: True or False if known ahead of time, otherwise None.
+        """
+        if type(self).should_be_applied is not AbstractMiddleware.should_be_applied:
+            return None
+        if self.all_routes:
+            return True
+        if not route.is_static:
+            return None
+        return route.normalized_path in self.routes or route.normalized_path + b'/' in self.routes
+
     def add_route(self, route: bytes, *args, **kwargs):
         self.routes.add(route)
         route = route.rstrip(b'/')
@@ -1,12 +1,17 @@
+import collections
 import datetime
+import hashlib
+import time
 import typing
 from . import AbstractMiddleware
-from ...primitives import HttpRequest, HttpResponse
-from ...primitives.cookies import _COOKIE_EXPIRE_FORMAT
+from ..static import _etag_in_list, _parse_http_date
+from ...primitives import FileHttpResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from ...primitives.message import _SUPPORTED_ENCODINGS
 
 __all__ = [
     "CacheControlMiddleware",
     "CacheControlPolicy",
+    "ResponseCacheMiddleware",
     "CACHE_CONTROL_PUBLIC",
     "CACHE_CONTROL_PRIVATE",
     "CACHE_CONTROL_NO_CACHE"
@@ -19,14 +24,31 @@ _CACHE_METHODS = {b'GET'}
 # Cache-Control max-age should not be greater than 1 year. RFC-compliant browsers may ignore values beyond.
 # See http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.9.3 for more information.
 _MAX_AGE_MAXIMUM_VALUE = 31536000
+_BODY_ETAG_DIGEST_SIZE = 8
+_BODY_ETAG_MEMO_SIZE = 1024
+
+_RESPONSE_CACHE_STATUS_CODES = {200, 203, 204, 300, 301, 308, 404, 410}
+_RESPONSE_CACHE_UNCACHEABLE = (b'no-store', b'private', b'no-cache')
+_RESPONSE_CACHE_DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# Rough size of a cache entry without its bodies, used for the size bound.
+_RESPONSE_CACHE_ENTRY_OVERHEAD = 512
 
 
 class CacheControlPolicy:
     def __init__(self, cache_setting: bytes=CACHE_CONTROL_PRIVATE, max_age: int=None,
                  etag: typing.Callable[[HttpRequest], bytes]=None,
                  last_modified: typing.Callable[[HttpRequest], datetime.datetime]=None,
-                 expires: typing.Callable[[HttpRequest], datetime.datetime]=None):
-
+                 expires: typing.Callable[[HttpRequest], datetime.datetime]=None,
+                 auto_etag: bool=False, weak_etag: bool=True):
+        """
+        :param cache_setting: Value of the Cache-Control header.
+        :param max_age: Optional max-age of the Cache-Control header in seconds.
+        :param etag: Optional function that returns the ETag for a request.
+        :param last_modified: Optional function that returns the last modification time for a request.
+        :param expires: Optional function that returns the expiry time for a request.
+        :param auto_etag: If True and etag isn't given, derives the ETag from a hash of the response body.
+        :param weak_etag: If True, automatic ETags are weak so they stay valid when the body is compressed.
+        """
         self.cache_setting = cache_setting
         self.max_age = max_age
         if self.max_age is not None and self.max_age > _MAX_AGE_MAXIMUM_VALUE:
@@ -34,22 +56,28 @@ class CacheControlPolicy:
         self.etag = etag
         self.last_modified = last_modified
         self.expires = expires
+        self.auto_etag = auto_etag
+        self.weak_etag = weak_etag
 
-        self.cached_etag = None  # type: bytes
-        self.cached_last_modified = None  # type: datetime.datetime
         self.cache_control_header = self.cache_setting
         if self.max_age is not None:
             self.cache_control_header += b', max-age=%d' % max_age
 
-        self.not_modified = HttpResponse(status=b'Not Modified', status_code=304)
-        self.not_modified.headers[b'Cache-Control'] = self.cache_control_header
+    def not_modified(self, etag: typing.Optional[bytes], last_modified: typing.Optional[datetime.datetime]) -> HttpResponse:
+        response = HttpResponse(status=b'Not Modified', status_code=304)
+        response.headers[b'Cache-Control'] = self.cache_control_header
+        if etag is not None:
+            response.headers[b'Etag'] = etag
+        if last_modified is not None:
+            response.headers[b'Last-Modified'] = last_modified
+        return response
 
 
 class CacheControlMiddleware(AbstractMiddleware):
     def __init__(self, default: CacheControlPolicy):
         self.cache_policies = {}  # type: typing.Dict[bytes, CacheControlPolicy]
         self.default_policy = default  # type: CacheControlPolicy
-        self._request_to_policy = {}  # type: typing.Dict[HttpRequest, CacheControlPolicy]
+        self._body_etags = {}  # type: typing.Dict[bytes, typing.Tuple[HttpResponse, bytes]]
         AbstractMiddleware.__init__(self)
 
     def add_route(self, route: bytes, cache_policy: CacheControlPolicy):
@@ -67,46 +95,279 @@ class CacheControlMiddleware(AbstractMiddleware):
 
     def before_handler(self, request: HttpRequest) -> typing.Optional[HttpResponse]:
         cache_policy = self.cache_policies.get(request.url.path, self.default_policy)
-        self._request_to_policy[request] = cache_policy
+        etag = None
+        last_modified = None
 
-        # Etag / If-None-Match
-        if cache_policy.etag is not None and b'If-None-Match' in request.headers:
-            cache_policy.cached_etag = cache_policy.etag(request)
-            if cache_policy.cached_etag in request.headers[b'If-None-Match']:
-                cache_policy.not_modified.headers[b'Etag'] = cache_policy.cached_etag
-                return cache_policy.not_modified
+        # Etag / If-None-Match, which takes precedence over If-Modified-Since.
+        if b'If-None-Match' in request.headers:
+            if cache_policy.etag is not None:
+                etag = cache_policy.etag(request)
+                if _etag_in_list(etag, request.headers[b'If-None-Match']):
+                    return cache_policy.not_modified(etag, None)
 
         # Last-Modifed / If-Modified-Since
-        if cache_policy.last_modified is not None and b'If-Modified-Since' in request.headers:
-            cache_policy.cached_last_modified = cache_policy.last_modified(request)
-            if datetime.datetime.strptime(request.headers[b'If-Modified-Since'][0].decode("utf-8"),
-                                          _COOKIE_EXPIRE_FORMAT) > cache_policy.cached_last_modified:
-                cache_policy.not_modified.headers[b'Last-Modified'] = cache_policy.cached_last_modified
-                return cache_policy.not_modified
+        elif cache_policy.last_modified is not None and b'If-Modified-Since' in request.headers:
+            last_modified = cache_policy.last_modified(request)
+            since = _parse_http_date(request.headers[b'If-Modified-Since'][0])
+            if since is not None and last_modified <= since:
+                return cache_policy.not_modified(None, last_modified)
 
-    def after_handler(self, request: HttpRequest, response: HttpResponse):
-        if request in self._request_to_policy:
-            cache_policy = self._request_to_policy[request]
-            response.headers[b'Cache-Control'] = cache_policy.cache_control_header
+        # Validators are kept on the request as concurrent requests share the policy.
+        if etag is not None or last_modified is not None:
+            request.cache_validators = (etag, last_modified)
 
-            # Etag / If-None-Match
+    def after_handler(self, request: HttpRequest, response: HttpResponse) -> typing.Optional[HttpResponse]:
+        cache_policy = self.cache_policies.get(request.url.path, self.default_policy)
+        etag, last_modified = request.cache_validators or (None, None)
+        response.headers[b'Cache-Control'] = cache_policy.cache_control_header
+
+        # Etag / If-None-Match
+        if etag is None:
             if cache_policy.etag is not None:
-                if cache_policy.cached_etag is None:
-                    cache_policy.cached_etag = cache_policy.etag(request)
-                response.headers[b'Etag'] = cache_policy.cached_etag
-
-            # Last-Modified / If-Modified-Since
-            if cache_policy.last_modified is not None:
-                if cache_policy.cached_last_modified is None:
-                    cache_policy.cached_last_modified = cache_policy.last_modified(request)
-                response.headers[b'Last-Modified'] = cache_policy.cached_last_modified
-
-            if cache_policy.expires is not None:
-                expire_time = cache_policy.expires(request)
-                if isinstance(expire_time, datetime.datetime):
-                    response.headers[b'Expires'] = expire_time
-                else:
-                    response.headers[b'Expires'] = b'0'
-
-            # Get rid of the request -> policy association.
-            del self._request_to_policy[request]
+                etag = cache_policy.etag(request)
+            elif cache_policy.auto_etag and 200 <= response.status_code < 300 and \
+                    not isinstance(response, (StreamingHttpResponse, FileHttpResponse)):
+                etag = self._body_etag(request.url.path, response, cache_policy.weak_etag)
+        if etag is not None:
+            response.headers[b'Etag'] = etag
+
+        # Last-Modified / If-Modified-Since
+        if cache_policy.last_modified is not None:
+            if last_modified is None:
+                last_modified = cache_policy.last_modified(request)
+            response.headers[b'Last-Modified'] = last_modified
+
+        if cache_policy.expires is not None:
+            expire_time = cache_policy.expires(request)
+            if isinstance(expire_time, datetime.datetime):
+                response.headers[b'Expires'] = expire_time
+            else:
+                response.headers[b'Expires'] = b'0'
+
+        # An ETag that is only known once the body exists is checked here,
+        # the 304 replaces the response before the body is compressed or written.
+        if etag is not None and cache_policy.etag is None and b'If-None-Match' in request.headers and \
+           _etag_in_list(etag, request.headers[b'If-None-Match']):
+            return cache_policy.not_modified(etag, last_modified)
+
+    def _body_etag(self, path: bytes, response: HttpResponse, weak: bool) -> bytes:
+        """
+        Derives an ETag from a hash of the response body. The ETag of a frozen response
+        is memoized per path so its body is hashed once, other bodies are hashed every time.
+        :return: The ETag.
+        """
+        body = response.body
+        frozen = response if response.is_frozen() else response.frozen_source
+        if frozen is not None and frozen.body is not body:
+            frozen = None
+        memoized = self._body_etags.get(path, None)
+        if frozen is not None and memoized is not None and memoized[0] is frozen:
+            etag = memoized[1]
+        else:
+            etag = b'"%b"' % hashlib.blake2b(body, digest_size=_BODY_ETAG_DIGEST_SIZE).hexdigest().encode("utf-8")
+            if frozen is not None:
+                if len(self._body_etags) >= _BODY_ETAG_MEMO_SIZE:
+                    self._body_etags.clear()
+                self._body_etags[path] = (frozen, etag)
+        return b'W/' + etag if weak else etag
+
+
+def _vary_value(request: HttpRequest, name: bytes) -> bytes:
+    # The parser moves the Cookie header out of the headers and into the cookies.
+    if name == b'COOKIE':
+        return request.cookies.to_bytes() if request.cookies else b''
+    return b','.join(request.headers.get(name, ()))
+
+
+class _CachedResponse:
+    def __init__(self, response: HttpResponse, expires: float, stale_until: float):
+        self.status_code = response.status_code
+        self.status = response.status
+        self.headers = response.headers.copy()
+        self.bodies = {b'identity': response.body}  # type: typing.Dict[bytes, bytes]
+        self.pending = None  # type: typing.Optional[HttpResponse]
+        self.expires = expires
+        self.stale_until = stale_until
+        self.revalidating = False
+        self.size = len(response) + _RESPONSE_CACHE_ENTRY_OVERHEAD
+
+
+class ResponseCacheMiddleware(AbstractMiddleware):
+    def __init__(self, max_size: int=_RESPONSE_CACHE_DEFAULT_MAX_SIZE, ttl: float=5.0,
+                 stale_while_revalidate: float=0.0, cache_cookies: bool=False):
+        """
+        Stores responses of GET requests in memory and answers requests from the stored responses
+        without running the handler. Responses are keyed on the method, path, query and the values of
+        the request headers named by the response's Vary header. The bodies that the server compresses
+        are kept per Content-Encoding so a body is compressed once per stored response.
+        Once a response has expired, for up to stale_while_revalidate seconds the first request runs
+        the handler to refresh it while all other requests are answered with the stale response.
+        :param max_size: Maximum number of bytes of responses to store, least recently used responses are evicted first.
+        :param ttl: Default number of seconds a response is stored for.
+        :param stale_while_revalidate: Default number of seconds a stale response can be used while it's refreshed.
+        :param cache_cookies: If True, requests with cookies are cached as well. Their responses
+                              should have Vary: Cookie unless they are the same for every user.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.cache_cookies = cache_cookies
+        self.route_ttls = {}  # type: typing.Dict[bytes, typing.Tuple[float, float]]
+        self.size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vary = {}  # type: typing.Dict[typing.Tuple[bytes, bytes], typing.Tuple[bytes, ...]]
+        # Number of stored entries per method and URL, the Vary names are dropped with the last one.
+        self._vary_entries = {}  # type: typing.Dict[typing.Tuple[bytes, bytes], int]
+        self._entries = collections.OrderedDict()  # type: typing.Dict[typing.Tuple, _CachedResponse]
+        AbstractMiddleware.__init__(self)
+
+    def add_route(self, route: bytes, ttl: float=None, stale_while_revalidate: float=None):
+        ttls = (self.ttl if ttl is None else ttl,
+                self.stale_while_revalidate if stale_while_revalidate is None else stale_while_revalidate)
+        self.routes.add(route)
+        self.route_ttls[route] = ttls
+        route = route.rstrip(b'/')
+        if len(route):
+            self.routes.add(route)
+            self.route_ttls[route] = ttls
+
+    def clear(self) -> None:
+        self._vary.clear()
+        self._vary_entries.clear()
+        self._entries.clear()
+        self.size = 0
+
+    def should_be_applied(self, request: HttpRequest):
+        return request.method in _CACHE_METHODS and b'Authorization' not in request.headers and \
+               (self.cache_cookies or not request.cookies) and (self.all_routes or request.url.path in self.routes)
+
+    def before_handler(self, request: HttpRequest) -> typing.Optional[HttpResponse]:
+        key = self._request_key(request)
+        entry = self._entries.get(key, None) if key is not None else None
+        if entry is None or b'no-cache' in request.headers.get_first(b'Cache-Control', b''):
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        if now >= entry.expires:
+            if now >= entry.stale_until:
+                self._remove(key)
+                self.misses += 1
+                return None
+            if not entry.revalidating:
+                # This request refreshes the response, others get the stale one meanwhile.
+                entry.revalidating = True
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        self._entries.move_to_end(key)
+        return self._build_response(request, key, entry)
+
+    def after_handler(self, request: HttpRequest, response: HttpResponse):
+        if response.status_code not in _RESPONSE_CACHE_STATUS_CODES or response.cookies or \
+           isinstance(response, (StreamingHttpResponse, FileHttpResponse)):
+            return
+        cache_control = b','.join(response.headers.get(b'Cache-Control', []))
+        for directive in _RESPONSE_CACHE_UNCACHEABLE:
+            if directive in cache_control:
+                return
+
+        vary = []
+        for header_value in response.headers.get(b'Vary', []):
+            for name in header_value.split(b','):
+                name = name.strip().upper()
+                if name == b'*':
+                    return
+                # Accept-Encoding is handled by keeping a body per Content-Encoding.
+                if name and (name != b'ACCEPT-ENCODING' or b'Content-Encoding' in response.headers):
+                    vary.append(name)
+        primary_key = (request.method, request.url.get())
+        key = primary_key + tuple(_vary_value(request, name) for name in vary)
+
+        ttl, stale_while_revalidate = self.route_ttls.get(request.url.path, (self.ttl, self.stale_while_revalidate))
+        expires = time.monotonic() + ttl
+        self._remove(key)
+        entry = _CachedResponse(response, expires, expires + stale_while_revalidate)
+        if entry.size > self.max_size:
+            return
+        self._vary[primary_key] = tuple(vary)
+        self._vary_entries[primary_key] = self._vary_entries.get(primary_key, 0) + 1
+        self._entries[key] = entry
+        self.size += entry.size
+        self._evict()
+
+    def _request_key(self, request: HttpRequest) -> typing.Optional[typing.Tuple]:
+        primary_key = (request.method, request.url.get())
+        vary = self._vary.get(primary_key, None)
+        if vary is None:
+            return None
+        if not vary:
+            return primary_key
+        return primary_key + tuple(_vary_value(request, name) for name in vary)
+
+    def _build_response(self, request: HttpRequest, key: typing.Tuple, entry: _CachedResponse) -> HttpResponse:
+        response = HttpResponse(status_code=entry.status_code, status=entry.status)
+        response.headers = entry.headers.copy()
+        body = entry.bodies[b'identity']
+
+        # Keep the body that the server compressed for the previous response.
+        pending = entry.pending
+        if pending is not None:
+            entry.pending = None
+            encoding = pending.headers.get_first(b'Content-Encoding')
+            if encoding is not None and encoding not in entry.bodies:
+                encoded = pending.body
+                entry.bodies[encoding] = encoded
+                entry.size += len(encoded)
+                self.size += len(encoded)
+                self._evict(key)
+
+        if b'Content-Encoding' not in response.headers and b'Accept-Encoding' in request.headers:
+            for encoding, qvalue in request.headers.qlist(b'Accept-Encoding'):
+                if encoding == b'identity':
+                    break
+                if encoding in _SUPPORTED_ENCODINGS and qvalue > 0:
+                    if encoding in entry.bodies:
+                        body = entry.bodies[encoding]
+                        response.headers[b'Content-Encoding'] = encoding
+                    else:
+                        # The server compresses this response like any other, in its compression
+                        # executor if the body is large, and the next hit keeps the compressed body.
+                        entry.pending = response
+                    break
+        response.body = body
+        response.headers[b'Content-Length'] = len(body)
+        return response
+
+    def _remove(self, key: typing.Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            self._entry_removed(key)
+
+    def _evict(self, keep: typing.Optional[typing.Tuple]=None) -> None:
+        while self.size > self.max_size and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            if key == keep:
+                # The entry in use is the most recently used one, it's only evicted alone.
+                self._entries[key] = entry
+                if len(self._entries) == 1:
+                    break
+                continue
+            self.size -= entry.size
+            self.evictions += 1
+            self._entry_removed(key)
+
+    def _entry_removed(self, key: typing.Tuple) -> None:
+        primary_key = key[:2]
+        count = self._vary_entries[primary_key] - 1
+        if count:
+            self._vary_entries[primary_key] = count
+        else:
+            del self._vary_entries[primary_key]
+            del self._vary[primary_key]
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import typing
+from . import AbstractMiddleware
+from ...primitives import FileHttpResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+
+__all__ = [
+    "CoalescingMiddleware"
+]
+_COALESCE_METHODS = {b'GET'}
+_DEFAULT_COALESCE_TIMEOUT = 10.0
+
+
+def _default_key(request: HttpRequest) -> typing.Optional[typing.Hashable]:
+    # Requests that carry credentials may get responses for that user only.
+    # The Cookie header is moved out of the headers by the parser so the cookies are checked instead.
+    if b'Authorization' in request.headers or request.cookies:
+        return None
+    return request.method, request.url.get()
+
+
+def _copy_response(response: HttpResponse) -> HttpResponse:
+    return response if response.is_frozen() else response.copy()
+
+
+class CoalescingMiddleware(AbstractMiddleware):
+    def __init__(self, key: typing.Callable[[HttpRequest], typing.Optional[typing.Hashable]]=None,
+                 timeout: float=_DEFAULT_COALESCE_TIMEOUT):
+        """
+        Groups concurrent requests with the same key so that only the first one runs the
+        handler and every other one is answered with a copy of its response. Requests that
+        wait longer than the timeout run the handler themselves, as do requests whose
+        first request produced a streaming or file response or a response with cookies.
+        :param key: Function that returns the key of a request or None to not coalesce the request.
+                    The default key is the method, path and query of requests without credentials.
+        :param timeout: Number of seconds to wait for the first request's response.
+        """
+        self.key = _default_key if key is None else key
+        self.timeout = timeout
+        self.coalesced = 0
+        self._in_flight = {}  # type: typing.Dict[typing.Hashable, typing.Tuple[HttpRequest, asyncio.Future, float]]
+        AbstractMiddleware.__init__(self)
+
+    def should_be_applied(self, request: HttpRequest):
+        return request.method in _COALESCE_METHODS and (self.all_routes or request.url.path in self.routes)
+
+    async def before_handler(self, request: HttpRequest) -> typing.Optional[HttpResponse]:
+        key = self.key(request)
+        if key is None:
+            return None
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        in_flight = self._in_flight.get(key, None)
+
+        # A request that has been in-flight longer than the timeout
+        # has most likely failed, so the next request replaces it.
+        if in_flight is None or now - in_flight[2] >= self.timeout:
+            future = loop.create_future()
+            self._in_flight[key] = (request, future, now)
+            # If the handler raises or is cancelled after_handler() isn't called, so
+            # the waiting requests are released once the first request's task ends.
+            task = asyncio.current_task()
+            if task is not None:
+                task.add_done_callback(functools.partial(self._on_first_request_done, key, future))
+            return None
+
+        _, future, started = in_flight
+        try:
+            response = await asyncio.wait_for(asyncio.shield(future), started + self.timeout - now)
+        except asyncio.TimeoutError:
+            return None
+        if response is None:
+            return None
+        self.coalesced += 1
+        return _copy_response(response)
+
+    def after_handler(self, request: HttpRequest, response: HttpResponse):
+        key = self.key(request)
+        in_flight = self._in_flight.get(key, None) if key is not None else None
+        if in_flight is None or in_flight[0] is not request:
+            return
+        del self._in_flight[key]
+        future = in_flight[1]
+        if not future.done():
+            if response.cookies or isinstance(response, (StreamingHttpResponse, FileHttpResponse)):
+                future.set_result(None)
+            else:
+                future.set_result(_copy_response(response))
+
+    def _on_first_request_done(self, key: typing.Hashable, future: asyncio.Future, _: asyncio.Task) -> None:
+        in_flight = self._in_flight.get(key, None)
+        if in_flight is not None and in_flight[1] is future:
+            del self._in_flight[key]
+        if not future.done():
+            future.set_result(None)
@@ -0,0 +1,178 @@
+import re
+import typing
+import uuid
+from ..primitives import HttpResponse
+
+__all__ = [
+    "Route",
+    "Router"
+]
+_PARAMETER_REGEX = re.compile(b'^<(?:([a-zA-Z_][a-zA-Z0-9_]*):)?([a-zA-Z_][a-zA-Z0-9_]*)>$')
+_PATH_CONVERTER = b'path'
+
+
+def _convert_str(segment: bytes) -> bytes:
+    return segment
+
+
+def _convert_int(segment: bytes) -> int:
+    if not segment.isdigit():
+        raise ValueError("Segment is not an integer.")
+    return int(segment)
+
+
+def _convert_uuid(segment: bytes) -> uuid.UUID:
+    try:
+        return uuid.UUID(segment.decode("ascii"))
+    except UnicodeDecodeError:
+        raise ValueError("Segment is not a UUID.")
+
+
+_DEFAULT_CONVERTERS = {
+    b'str': _convert_str,
+    b'int': _convert_int,
+    b'uuid': _convert_uuid
+}
+
+
+def _split_path(path: bytes) -> typing.List[bytes]:
+    return [step for step in path.strip(b'/').split(b'/') if step != b'']
+
+
+class Route:
+    def __init__(self, path: bytes, is_static: bool=True):
+        self.path = path
+        self.normalized_path = b'/' + b'/'.join(_split_path(path))
+        self.is_static = is_static
+        self.parameter_names = ()  # type: typing.Tuple[bytes, ...]
+        self.handlers = {}  # type: typing.Dict[bytes, typing.Callable]
+        self.stream_methods = set()  # type: typing.Set[bytes]
+        self.max_in_flight = None  # type: typing.Optional[int]
+        self.cancel_on_disconnect = True
+
+        # Filled in by the Server when the route is compiled.
+        self.async_handlers = frozenset()  # type: typing.FrozenSet[bytes]
+        self.middleware_chain = ()  # type: typing.Tuple[typing.Tuple, ...]
+        self.method_not_allowed = None  # type: HttpResponse
+        self.generation = -1
+
+    def __repr__(self):
+        return "<Route path={} methods={}>".format(self.path, list(self.handlers.keys()))
+
+
+class _RouterNode:
+    def __init__(self):
+        self.static = {}  # type: typing.Dict[bytes, _RouterNode]
+        # Parameters share one child per converter, their names are kept on the Route.
+        self.dynamic = []  # type: typing.List[typing.Tuple[bytes, typing.Callable, _RouterNode]]
+        self.path_tail = None  # type: typing.Optional[Route]
+        self.route = None  # type: typing.Optional[Route]
+
+
+class Router:
+    def __init__(self):
+        self.converters = dict(_DEFAULT_CONVERTERS)  # type: typing.Dict[bytes, typing.Callable[[bytes], typing.Any]]
+        self._root = _RouterNode()
+        self._static_routes = {}  # type: typing.Dict[typing.Tuple[bytes, ...], Route]
+        self.routes = []  # type: typing.List[Route]
+
+    def add(self, path: bytes) -> Route:
+        """
+        Compiles a path into the router and returns the Route for it.
+        Segments of the form <name> or <converter:name> are parameters. Built-in
+        converters are str (default), int, uuid and path. A path parameter
+        matches the remaining tail of the path and must be the last segment.
+        Static segments always take priority over parameters. Paths that only
+        differ in the names of their parameters can't be told apart and conflict.
+        :param path: Path to compile.
+        :return: Route for the path, the same Route is returned for equivalent paths.
+        """
+        steps = _split_path(path)
+        current = self._root
+        is_static = True
+        names = []
+        for index, step in enumerate(steps):
+            parameter = _PARAMETER_REGEX.match(step)
+            if parameter is None:
+                if step not in current.static:
+                    current.static[step] = _RouterNode()
+                current = current.static[step]
+                continue
+
+            is_static = False
+            converter_name = parameter.group(1) or b'str'
+            names.append(parameter.group(2))
+            if converter_name == _PATH_CONVERTER:
+                if index != len(steps) - 1:
+                    raise ValueError("Path parameter <{}> must be the last segment of {}.".format(step, path))
+                if current.path_tail is None:
+                    current.path_tail = Route(path, is_static=False)
+                    current.path_tail.parameter_names = tuple(names)
+                    self.routes.append(current.path_tail)
+                elif current.path_tail.parameter_names != tuple(names):
+                    raise ValueError("Parameters of {} conflict with an existing route.".format(path))
+                return current.path_tail
+            if converter_name not in self.converters:
+                raise ValueError("Unknown converter {} in {}.".format(converter_name, path))
+
+            for dynamic_converter, _, node in current.dynamic:
+                if dynamic_converter == converter_name:
+                    current = node
+                    break
+            else:
+                node = _RouterNode()
+                current.dynamic.append((converter_name, self.converters[converter_name], node))
+                current = node
+
+        if current.route is None:
+            current.route = Route(path, is_static=is_static)
+            current.route.parameter_names = tuple(names)
+            self.routes.append(current.route)
+            if is_static:
+                self._static_routes[tuple(steps)] = current.route
+        elif current.route.parameter_names != tuple(names):
+            raise ValueError("Parameters of {} conflict with an existing route.".format(path))
+        return current.route
+
+    def resolve(self, path: bytes) -> typing.Tuple[typing.Optional[Route], typing.Dict[bytes, typing.Any]]:
+        """
+        Finds the Route for a request path.
+        :param path: Request path to resolve.
+        :return: Tuple of the matched Route or None and the converted match info values.
+        """
+        steps = _split_path(path)
+        route = self._static_routes.get(tuple(steps), None)
+        if route is not None:
+            return route, {}
+        values = []
+        route = self._match(self._root, steps, 0, values)
+        if route is None:
+            return None, {}
+        return route, dict(zip(route.parameter_names, values))
+
+    def _match(self, node: _RouterNode, steps: typing.List[bytes], index: int,
+               values: typing.List[typing.Any]) -> typing.Optional[Route]:
+        if index == len(steps):
+            return node.route
+        step = steps[index]
+
+        # Static segments are tried first, then parameters in order of registration of their converter.
+        child = node.static.get(step, None)
+        if child is not None:
+            route = self._match(child, steps, index + 1, values)
+            if route is not None:
+                return route
+        for _, converter, child in node.dynamic:
+            try:
+                value = converter(step)
+            except ValueError:
+                continue
+            values.append(value)
+            route = self._match(child, steps, index + 1, values)
+            if route is not None:
+                return route
+            values.pop()
+        if node.path_tail is not None:
+            values.append(b'/'.join(steps[index:]))
+            return node.path_tail
+        return None
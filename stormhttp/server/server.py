@@ -1,21 +1,202 @@
 import asyncio
 import base64
-import datetime
+import collections
+import concurrent.futures
+import email.utils
+import functools
 import hashlib
-import re
+import os
+import signal
+import socket
 import ssl as _ssl
+import time
 import typing
 import httptools
+from .admission import AdmissionController
+from .compression import CompressionPolicy
 from .middleware import AbstractMiddleware
+from .router import Route, Router
+from .static import StaticFileHandler
 from .websockets import AbstractWebSocketProtocol, SUPPORTED_WEBSOCKET_VERSIONS, WEBSOCKET_SECRET_KEY
-from ..primitives import HttpParser, HttpRequest, HttpResponse
-from ..primitives.message import _SUPPORTED_ENCODINGS
+from ..errors import HttpPayloadTooLargeError
+from ..primitives import FileHttpResponse, HttpBodyStream, HttpHeaders, HttpParser, HttpRequest, HttpResponse, StreamingHttpResponse
+from ..primitives.message import _transcode_body
 
 __all__ = [
     "ServerHttpProtocol",
     "Server"
 ]
-_MATCH_INFO_REGEX = re.compile(b'^<([a-zA-Z_][a-zA-Z0-9_]*)>$')
+_SUPPORTS_REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+_WORKER_RESTART_DELAY = 1.0
+_LISTEN_BACKLOG = 1024
+_SENDFILE_FALLBACK_CHUNK_SIZE = 262144
+_LOOP_LAG_INTERVAL = 0.1
+_TIMEOUT_RESOLUTION = 1.0
+_PARSE_IDLE = 0
+_PARSE_HEADERS = 1
+_PARSE_BODY = 2
+_NOT_FOUND_RESPONSE = HttpResponse(status_code=404, status=b'Not Found').freeze()
+_PAYLOAD_TOO_LARGE_RESPONSE = HttpResponse(
+    status_code=413, status=b'Payload Too Large', headers={b'Connection': b'close'}
+).freeze()
+
+
+class _PipelinedWriter:
+    """
+    Transport stand-in for a pipelined request that isn't the oldest
+    request in-flight on its connection. Writes are buffered until
+    all earlier responses on the connection have been written.
+    """
+    def __init__(self, protocol, is_head: bool=False):
+        self.protocol = protocol  # type: ServerHttpProtocol
+        self.transport = protocol.transport
+        self.is_head = is_head
+        self.is_done = False
+        self._buffer = []  # type: typing.List[bytes]
+        self._closing = False
+        self._head_waiter = None  # type: typing.Optional[asyncio.Future]
+
+    def write(self, data: bytes) -> None:
+        if self.is_head:
+            self.transport.write(data)
+        else:
+            self._buffer.append(data)
+
+    def writelines(self, list_of_data: typing.Iterable[bytes]) -> None:
+        for data in list_of_data:
+            self.write(data)
+
+    def close(self) -> None:
+        if self.is_head:
+            self.transport.close()
+        else:
+            self._closing = True
+
+    def is_closing(self) -> bool:
+        return self._closing or self.transport.is_closing()
+
+    def get_extra_info(self, name: str, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    async def drain(self) -> None:
+        """
+        Waits until all earlier responses have been written and the
+        transport's write buffer is below its low water mark.
+        :return: None
+        """
+        if not self.is_head:
+            if self._head_waiter is None:
+                self._head_waiter = self.protocol.loop.create_future()
+            await self._head_waiter
+        await self.protocol.drain()
+
+    def make_head(self) -> None:
+        self.is_head = True
+        if self._buffer:
+            self.transport.writelines(self._buffer)
+            self._buffer = []
+        if self._closing:
+            self.transport.close()
+        if self._head_waiter is not None and not self._head_waiter.done():
+            self._head_waiter.set_result(None)
+
+
+class _ResponseHeaderCache:
+    """
+    Pre-serialized headers that are added to the head of every response: Server,
+    any default headers of the Server and a Date header that is formatted at most
+    once per second. Responses that set one of these headers themselves keep theirs.
+    """
+    def __init__(self, headers: HttpHeaders):
+        self._headers = headers
+        self._keys = tuple(headers.keys())
+        self._static = headers.to_bytes() if headers else b''
+        self._second = -1
+        self._date = b''
+        self._fragment = b''
+
+    def fragment(self, response_headers: HttpHeaders) -> bytes:
+        """
+        Gets the header lines to splice into the head of a response.
+        :param response_headers: Headers of the response.
+        :return: Header lines separated by CRLF.
+        """
+        now = int(time.time())
+        if now != self._second:
+            self._second = now
+            self._date = b'DATE: ' + email.utils.formatdate(now, usegmt=True).encode("utf-8")
+            self._fragment = self._static + b'\r\n' + self._date if self._static else self._date
+        if not response_headers:
+            return self._fragment
+
+        overridden = [key for key in self._keys if key in response_headers]
+        if b'DATE' in response_headers:
+            overridden.append(b'DATE')
+        if not overridden:
+            return self._fragment
+        parts = [b'%b: %b' % (key, val) for key in self._keys if key not in overridden
+                 for val in self._headers[key]]
+        if b'DATE' not in overridden:
+            parts.append(self._date)
+        return b'\r\n'.join(parts)
+
+
+class _TimeoutWheel:
+    """
+    Checks the timeouts of every connection of a Server with a single timer that ticks
+    once per resolution while any connection has a deadline. Connections wait in a bucket
+    per tick and are only moved to a later bucket once their bucket is reached, so
+    extending a deadline, which happens for every request, is just an attribute write.
+    """
+    def __init__(self, server, resolution: float=_TIMEOUT_RESOLUTION):
+        self.server = server  # type: Server
+        self.resolution = resolution
+        self._buckets = {}  # type: typing.Dict[int, typing.List[ServerHttpProtocol]]
+        self._next_tick = 0
+        self._handle = None  # type: typing.Optional[asyncio.TimerHandle]
+
+    def schedule(self, protocol) -> None:
+        """
+        Makes sure a connection is checked no later than the tick after its deadline.
+        :param protocol: ServerHttpProtocol with a deadline.
+        :return: None
+        """
+        if self._handle is None:
+            self._next_tick = int(self.server.loop.time() / self.resolution)
+            self._handle = self.server.loop.call_at((self._next_tick + 1) * self.resolution, self._sweep)
+        tick = max(int(protocol._deadline / self.resolution), self._next_tick)
+        if protocol._timer_tick is not None and protocol._timer_tick <= tick:
+            return
+        protocol._timer_tick = tick
+        bucket = self._buckets.get(tick, None)
+        if bucket is None:
+            bucket = self._buckets[tick] = []
+        bucket.append(protocol)
+
+    def _sweep(self) -> None:
+        loop = self.server.loop
+        now = loop.time()
+        current = int(now / self.resolution)
+        first, self._next_tick = self._next_tick, current + 1
+        for tick in range(first, current + 1):
+            bucket = self._buckets.pop(tick, None)
+            if bucket is None:
+                continue
+            for protocol in bucket:
+                # Connections that moved to an earlier bucket were handled there.
+                if protocol._timer_tick != tick:
+                    continue
+                protocol._timer_tick = None
+                if protocol._deadline is None:
+                    continue
+                if protocol._deadline <= now:
+                    protocol._on_timeout()
+                else:
+                    self.schedule(protocol)
+        if self._buckets:
+            self._handle = loop.call_at((current + 1) * self.resolution, self._sweep)
+        else:
+            self._handle = None
 
 
 class ServerHttpProtocol(asyncio.Protocol):
@@ -23,237 +204,1176 @@ class ServerHttpProtocol(asyncio.Protocol):
         self.server = server  # type: Server
         self.loop = server.loop
         self.transport = None  # type: asyncio.WriteTransport
-        self._version = None
-        self._request = HttpRequest()
-        self._parser = HttpParser(self._request)
+        self._request = self._new_request()
+        self._completed_requests = []  # type: typing.List[HttpRequest]
+        self._parser = HttpParser(self._request, self._on_request_complete, self._on_request_headers_complete)
+        self._pipeline = collections.deque()  # type: typing.Deque[_PipelinedWriter]
+        self._reading_paused = False
+        self._writing_paused = False
+        self._body_stream_paused = False
+        self._drain_waiters = []  # type: typing.List[asyncio.Future]
+        self._tasks = {}  # type: typing.Dict[asyncio.Task, HttpRequest]
+        self._rejected_request = None  # type: typing.Optional[HttpRequest]
+        self._connection_lost = False
         self._websocket_protocol = None  # type AbstractWebSocketProtocol
+        self._parse_state = _PARSE_IDLE
+        self._requests_received = 0
+        self._requests_exhausted = False
+        self._timeout = None  # type: typing.Optional[float]
+        self._deadline = None  # type: typing.Optional[float]
+        self._timer_tick = None  # type: typing.Optional[int]
 
     def connection_made(self, transport: asyncio.WriteTransport):
         self.transport = transport
+        self.server._connection_made(self)
+        if self.server._loop_lag_handle is None:
+            self.server._monitor_loop_lag()
+        if self.server.write_buffer_high is not None:
+            transport.set_write_buffer_limits(high=self.server.write_buffer_high, low=self.server.write_buffer_low)
+        self._set_timeout(self.server.header_timeout)
+
+    def connection_lost(self, exc: typing.Optional[Exception]):
+        self._connection_lost = True
+        self._deadline = None
+        self.server._connection_lost(self)
+        self._writing_paused = False
+        self._wake_drain_waiters(ConnectionResetError("Connection lost.") if exc is None else exc)
+        if self._request.body_stream is not None:
+            self._request.body_stream.set_exception(ConnectionResetError("Connection lost."))
+
+        # Nobody is left to read the responses, so stop handlers that can safely be stopped.
+        router = self.server.router
+        for task, request in list(self._tasks.items()):
+            route, _ = router.resolve(request.url.path)
+            if route is None or route.cancel_on_disconnect:
+                task.cancel()
+
+    @property
+    def is_disconnected(self) -> bool:
+        return self._connection_lost
+
+    def pause_writing(self):
+        self._writing_paused = True
+        self._update_reading()
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._wake_drain_waiters()
+        self._update_reading()
+
+    async def drain(self) -> None:
+        """
+        Waits until the transport's write buffer is below its low water mark.
+        Handlers writing large amounts of data should await this between writes.
+        :return: None
+        """
+        if self._connection_lost:
+            raise ConnectionResetError("Connection lost.")
+        if not self._writing_paused:
+            return
+        waiter = self.loop.create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def _wake_drain_waiters(self, exc: typing.Optional[Exception]=None) -> None:
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+
+    def _update_reading(self) -> None:
+        """
+        Stops reading from the socket while the write buffer is full, too many
+        pipelined requests are in-flight or a streamed body isn't being consumed.
+        :return: None
+        """
+        if self._connection_lost:
+            return
+        should_pause = self._writing_paused or self._body_stream_paused or \
+            len(self._pipeline) >= self.server.pipeline_depth
+        if should_pause != self._reading_paused:
+            self._reading_paused = should_pause
+            if should_pause:
+                self.transport.pause_reading()
+            else:
+                self.transport.resume_reading()
+
+    def _set_timeout(self, timeout: typing.Optional[float]) -> None:
+        self._timeout = timeout
+        if timeout is None:
+            self._deadline = None
+        else:
+            self._deadline = self.loop.time() + timeout
+            self.server._timeouts.schedule(self)
+
+    def _on_timeout(self) -> None:
+        # While reading is paused the connection is waiting on the server, not on the client.
+        if self._reading_paused:
+            self._set_timeout(self._timeout)
+        else:
+            self.transport.close()
+
+    def _update_idle(self) -> None:
+        """
+        Starts the keep-alive timeout once every request on the connection is
+        answered, or closes the connection if it served its maximum number of requests.
+        :return: None
+        """
+        if self._parse_state != _PARSE_IDLE or self._connection_lost or self._websocket_protocol is not None:
+            return
+        if self._pipeline:
+            self._set_timeout(None)
+        elif self._requests_exhausted:
+            self.transport.close()
+        else:
+            self._set_timeout(self.server.keep_alive_timeout)
 
     def data_received(self, data: bytes):
         if self._websocket_protocol is not None:
             self._websocket_protocol.data_received(data)
+            return
+        if self._requests_exhausted:
+            return
+        if self._parse_state == _PARSE_IDLE:
+            self._parse_state = _PARSE_HEADERS
+            self._set_timeout(self.server.header_timeout)
+        elif self._parse_state == _PARSE_BODY and self._deadline is not None:
+            # The body timeout limits the time between chunks of the body, not the whole upload.
+            self._deadline = self.loop.time() + self._timeout
+
+        try:
+            self._parser.feed_data(data)
+            max_body_size = self.server.max_body_size
+            if max_body_size is not None and self._parse_state == _PARSE_BODY and \
+               not self._requests_exhausted and len(self._request) > max_body_size:
+                self._reject_request(self._request)
+        except httptools.HttpParserUpgrade:
+            # The upgrade request is completed before the exception is raised.
+            upgrade_request = self._completed_requests.pop()
+            self._dispatch_completed()
+            self._upgrade(upgrade_request)
+            if self._websocket_protocol is not None:
+                self._set_timeout(None)
         else:
-            if self._request is None:
-                self._request = HttpRequest()
-                self._parser.set_target(self._request)
-            try:
-                self._parser.feed_data(data)
-            except httptools.HttpParserUpgrade:
-
-                # Do the WebSocket handshake.
-                if b'websocket' in self._request.headers.get(b'Upgrade', [])[0] and \
-                   self._request.headers.get(b'Sec-WebSocket-Version', [b''])[0] in SUPPORTED_WEBSOCKET_VERSIONS:
-
-                    # If the server_origins has entries, then check Origin header.
-                    if self.server.server_origins:
-                        bad_origin = False
-                        if b'Origin' not in self._request.headers:
-                            bad_origin = True
-                        else:
-                            for entry, _ in self._request.headers.qlist(b'Origin'):
-                                if entry in self.server.server_origins:
-                                    break
-                            else:
-                                bad_origin = True
-                        if bad_origin:
-                            response = HttpResponse(
-                                status_code=403,
-                                status=b'Forbidden',
-                                headers={
-                                    b'Date': datetime.datetime.utcnow(),
-                                    b'Server': self.server.server_header
-                                }
-                            )
-                            response.version = self._request.version
-                            self.transport.write(response.to_bytes())
-
-                    # Calculate the combined Sec-WebSocket-Key and GUID for the Sec-WebSocket-Accept key.
-                    websocket_combine_key = self._request.headers[b'Sec-WebSocket-Key'][0] + WEBSOCKET_SECRET_KEY
-                    websocket_accept_key = base64.b64encode(hashlib.sha1(websocket_combine_key).digest())
-
-                    upgrade_response = HttpResponse(
-                        status_code=101,
-                        status=b'Switching Protocols',
-                        headers={
-                            b'Connection': b'Upgrade',
-                            b'Upgrade': b'websocket',
-                            b'Sec-WebSocket-Accept': websocket_accept_key,
-                            b'Date': datetime.datetime.utcnow(),
-                            b'Server': self.server.server_header
-                        }
-                    )
+            self._dispatch_completed()
+
+    def _on_request_headers_complete(self, request: HttpRequest) -> None:
+        if self._requests_exhausted:
+            return
+        self._parse_state = _PARSE_BODY
+        self._set_timeout(self.server.body_timeout)
 
-                    # HTTP version is not parsed before the HttpParserUpgrade exception is thrown. Must
-                    upgrade_response.version = self._version if self._version is not None else b'1.1'
-                    self.transport.write(upgrade_response.to_bytes())
-                    self._websocket_protocol = self.server.websocket_protocol(self.server, self.transport)
+        # Bodies that are announced to be over the limit are rejected before they're received.
+        max_body_size = self.server.max_body_size
+        if max_body_size is not None and request.content_length is not None and request.content_length > max_body_size:
+            self._reject_request(request)
+            return
+        request.body_spool_size = self.server.body_spool_size
+
+        # Requests with a streamed body are dispatched before the body is parsed.
+        if self.server.should_stream_body(request):
+            request.body_stream = HttpBodyStream(
+                self.loop, self.server.body_stream_limit,
+                self._pause_body_stream, self._resume_body_stream
+            )
+            self._completed_requests.append(request)
+
+    def _on_request_complete(self, request: HttpRequest) -> HttpRequest:
+        self._request = self._new_request()
+        if self._requests_exhausted:
+            return self._request
+        max_body_size = self.server.max_body_size
+        if max_body_size is not None and len(request) > max_body_size:
+            self._reject_request(request)
+            return self._request
+        self._parse_state = _PARSE_IDLE
+        if request.body_stream is None:
+            self._completed_requests.append(request)
+        self._requests_received += 1
+        max_requests = self.server.max_requests_per_connection
+        if self.server._shutting_down or (max_requests is not None and self._requests_received >= max_requests):
+            self._requests_exhausted = True
+        return self._request
+
+    def _reject_request(self, request: HttpRequest) -> None:
+        """
+        Answers a request whose body is over Server.max_body_size with a 413 once all earlier
+        requests are answered. The connection is closed after the 413 as the rest of the body
+        would have to be read to parse any further requests. Requests with a streamed body
+        are already dispatched, so their stream fails with HttpPayloadTooLargeError instead.
+        :param request: HttpRequest to reject.
+        :return: None
+        """
+        self._requests_exhausted = True
+        self._rejected_request = request
+        self._parse_state = _PARSE_IDLE
+        if request.body_stream is not None:
+            request.body_stream.discard()
+            request.body_stream.set_exception(HttpPayloadTooLargeError("Request body is over Server.max_body_size."))
+        else:
+            self._completed_requests.append(request)
+
+    def _new_request(self) -> HttpRequest:
+        pool = self.server._request_pool
+        return pool.pop() if pool else HttpRequest()
+
+    def _recycle_request(self, request: HttpRequest) -> None:
+        """
+        Resets a request whose response has been written and returns it to the Server's
+        request pool. Requests with a streamed body are still referenced by their stream.
+        :param request: HttpRequest to recycle.
+        :return: None
+        """
+        pool = self.server._request_pool
+        if request.body_stream is None and len(pool) < self.server.request_pool_size:
+            request.reset()
+            pool.append(request)
+
+    def _pause_body_stream(self) -> None:
+        self._body_stream_paused = True
+        self._update_reading()
+
+    def _resume_body_stream(self) -> None:
+        self._body_stream_paused = False
+        self._update_reading()
+
+    def _dispatch_completed(self) -> None:
+        """
+        Dispatches every request that completed during the last call to feed_data().
+        Responses are written in the order the requests were received even if
+        their handlers complete out of order.
+        :return: None
+        """
+        completed, self._completed_requests = self._completed_requests, []
+        for request in completed:
+            request.connection = self
+
+            # The oldest request in-flight writes straight to the transport.
+            if self._pipeline:
+                writer = _PipelinedWriter(self)
+                self._pipeline.append(writer)
+            else:
+                writer = self.transport
+
+            if request is self._rejected_request:
+                response = self.server._write_response(request, _PAYLOAD_TOO_LARGE_RESPONSE, writer, False)
+                writer.close()
+            else:
+                try:
+                    response = self.server.dispatch(request, writer)
+                except Exception as error:
+                    self._request_failed(error, writer)
+                    response = None
+
+            if response is None or isinstance(response, HttpResponse):
+                if writer is not self.transport:
+                    self._request_done(writer, request)
+                elif request.body_stream is not None:
+                    request.body_stream.discard()
+                if response is not None and request is not self._rejected_request:
+                    self._recycle_request(request)
+            else:
+                if writer is self.transport:
+                    writer = _PipelinedWriter(self, is_head=True)
+                    self._pipeline.append(writer)
+                task = self.loop.create_task(response)
+                self._tasks[task] = request
+                task.add_done_callback(functools.partial(self._request_done, writer, request))
+
+        self._update_reading()
+        self._update_idle()
+
+    def _request_done(self, writer: _PipelinedWriter, request: HttpRequest, task: typing.Optional[asyncio.Task]=None) -> None:
+        if task is not None:
+            del self._tasks[task]
+            if not task.cancelled() and task.exception() is not None:
+                if request is self._rejected_request and isinstance(task.exception(), HttpPayloadTooLargeError):
+                    # The handler stopped reading a streamed body that went over the limit.
+                    self.server._write_response(request, _PAYLOAD_TOO_LARGE_RESPONSE, writer, False)
+                    writer.close()
                 else:
+                    self._request_failed(task.exception(), writer)
+
+        # Any part of a streamed body that the handler didn't read is thrown away.
+        if request.body_stream is not None:
+            request.body_stream.discard()
+
+        writer.is_done = True
+        pipeline = self._pipeline
+        while pipeline and pipeline[0].is_done:
+            pipeline.popleft()
+            if pipeline:
+                pipeline[0].make_head()
+        if self._reading_paused:
+            self._update_reading()
+        self._update_idle()
+
+        # Failed and cancelled requests may still be referenced by middlewares that didn't finish.
+        if task is not None and not task.cancelled() and task.exception() is None:
+            self._recycle_request(request)
+
+    def _request_failed(self, error: Exception, writer: typing.Union[asyncio.WriteTransport, _PipelinedWriter]) -> None:
+        self.loop.call_exception_handler({
+            "message": "Unhandled exception while dispatching request.",
+            "exception": error,
+            "protocol": self
+        })
+
+        # The response may be partially written so the connection can't be reused.
+        writer.close()
+
+    def _upgrade(self, request: HttpRequest) -> None:
+
+        # Do the WebSocket handshake.
+        if b'websocket' in request.headers.get_first(b'Upgrade', b'') and \
+           request.headers.get_first(b'Sec-WebSocket-Version', b'') in SUPPORTED_WEBSOCKET_VERSIONS:
+
+            # If the server_origins has entries, then check Origin header.
+            if self.server.server_origins:
+                bad_origin = False
+                if b'Origin' not in request.headers:
+                    bad_origin = True
+                else:
+                    for entry, _ in request.headers.qlist(b'Origin'):
+                        if entry in self.server.server_origins:
+                            break
+                    else:
+                        bad_origin = True
+                if bad_origin:
                     response = HttpResponse(
-                        status_code=501,
-                        status=b'Not Implemented',
-                        headers={
-                            b'Date': datetime.datetime.utcnow(),
-                            b'Server': self.server.server_header
-                        }
+                        status_code=403,
+                        status=b'Forbidden'
                     )
-                    response.version = self._request.version
-                    self.transport.write(response.to_bytes())
-            else:
-                if self._request.is_complete():
-                    if self._version is None:
-                        self._version = self._request.version
-                    self.loop.create_task(self.server.route_request(self._request, self.transport))
-                    self._request = None
+                    response.version = request.version
+                    self.transport.write(response.to_bytes(self.server._header_cache.fragment(response.headers)))
+                    return
+
+            # Calculate the combined Sec-WebSocket-Key and GUID for the Sec-WebSocket-Accept key.
+            websocket_combine_key = request.headers[b'Sec-WebSocket-Key'][0] + WEBSOCKET_SECRET_KEY
+            websocket_accept_key = base64.b64encode(hashlib.sha1(websocket_combine_key).digest())
+
+            upgrade_response = HttpResponse(
+                status_code=101,
+                status=b'Switching Protocols',
+                headers={
+                    b'Connection': b'Upgrade',
+                    b'Upgrade': b'websocket',
+                    b'Sec-WebSocket-Accept': websocket_accept_key
+                }
+            )
+            upgrade_response.version = request.version if request.version else b'1.1'
+            self.transport.write(upgrade_response.to_bytes(
+                self.server._header_cache.fragment(upgrade_response.headers)
+            ))
+            self._websocket_protocol = self.server.websocket_protocol(self.server, self.transport)
+        else:
+            response = HttpResponse(
+                status_code=501,
+                status=b'Not Implemented'
+            )
+            response.version = request.version
+            self.transport.write(response.to_bytes(self.server._header_cache.fragment(response.headers)))
 
 
 class Server:
     def __init__(self, loop: typing.Optional[asyncio.AbstractEventLoop]=None):
         self.loop = asyncio.get_event_loop() if loop is None else loop
-        self._prefix = {}  # type: typing.Dict[bytes, typing.Any]
+        self.router = Router()
         self.middlewares = []  # type: typing.List[AbstractMiddleware]
-        self.min_compression_length = 1400
+        self._generation = 0
+        self.compression_policy = CompressionPolicy()
+        self.loop_lag = 0.0
+        self._loop_lag_deadline = None  # type: typing.Optional[float]
+        self._loop_lag_handle = None  # type: typing.Optional[asyncio.TimerHandle]
+        self.pipeline_depth = 16
+        self.write_buffer_high = None  # type: typing.Optional[int]
+        self.write_buffer_low = None  # type: typing.Optional[int]
+        self.body_stream_limit = 65536
+        self.max_body_size = None  # type: typing.Optional[int]
+        self.body_spool_size = 1048576  # type: typing.Optional[int]
+        self.executor_compression_length = 65536
+        self.compression_workers = 2
+        self.compression_executor = None  # type: typing.Optional[concurrent.futures.Executor]
+        self.keep_alive_timeout = 75.0  # type: typing.Optional[float]
+        self.header_timeout = 30.0  # type: typing.Optional[float]
+        # Seconds without receiving any body data, a slow upload that keeps sending isn't cut off.
+        self.body_timeout = 60.0  # type: typing.Optional[float]
+        self.max_requests_per_connection = None  # type: typing.Optional[int]
+        self.max_connections = None  # type: typing.Optional[int]
+        self.connection_count = 0
+        self.shutdown_timeout = 30.0
+        self._connections = set()  # type: typing.Set[ServerHttpProtocol]
+        self._shutting_down = False
+        self._drained = None  # type: typing.Optional[asyncio.Future]
+        # Requests are reused once their response is written, so handlers and middlewares
+        # must not keep references to them afterwards. Set to 0 to disable pooling.
+        self.request_pool_size = 256
+        self._request_pool = []  # type: typing.List[HttpRequest]
+        self.admission = None  # type: typing.Optional[AdmissionController]
+        self._timeouts = _TimeoutWheel(self)
+        self._listeners = []  # type: typing.List[asyncio.AbstractServer]
+        self._listen_sockets = []  # type: typing.List[socket.socket]
+        self._listen_ssl = None  # type: typing.Optional[_ssl.SSLContext]
+        self._accept_paused = False
+        self._stream_body_routes = False
 
         from .. import __version__
         self.server_version = __version__
-        self.server_header = b'Stormhttp/' + __version__.encode("utf-8")
+        self._server_header = b'Stormhttp/' + __version__.encode("utf-8")
+        self._default_headers = HttpHeaders()
+        self._header_cache = None  # type: _ResponseHeaderCache
+        self._refresh_header_cache()
         self.server_origins = []
         self.websocket_protocol = None
 
-    def run(self, host: str, port: int=None, ssl: _ssl.SSLContext=None):
+    @property
+    def min_compression_length(self) -> int:
+        return self.compression_policy.min_length
+
+    @min_compression_length.setter
+    def min_compression_length(self, min_compression_length: int) -> None:
+        self.compression_policy.min_length = min_compression_length
+
+    @property
+    def server_header(self) -> bytes:
+        return self._server_header
+
+    @server_header.setter
+    def server_header(self, server_header: bytes) -> None:
+        self._server_header = server_header
+        self._refresh_header_cache()
+
+    def add_default_header(self, key: bytes, val: typing.Union[bytes, typing.Iterable[bytes]]) -> None:
+        """
+        Adds a header that is sent with every response that doesn't set the header itself.
+        Default headers are serialized once and not for every response.
+        :param key: Header key.
+        :param val: Header value.
+        :return: None
+        """
+        self._default_headers[key] = val
+        self._refresh_header_cache()
+
+    def _refresh_header_cache(self) -> None:
+        headers = HttpHeaders()
+        if self._server_header:
+            headers[b'Server'] = self._server_header
+        headers.update(self._default_headers)
+        self._header_cache = _ResponseHeaderCache(headers)
+
+    def run(self, host: str, port: int=None, ssl: _ssl.SSLContext=None, workers: int=1,
+            reuse_port: typing.Optional[bool]=None):
+        """
+        Runs the server until interrupted. If workers is greater than one the
+        process forks that many worker processes, each with their own event loop,
+        and supervises them: crashed workers are restarted and SIGINT / SIGTERM
+        are forwarded to the workers, which finish their in-flight requests with
+        shutdown() before they exit.
+        :param host: Host to listen on.
+        :param port: Port to listen on. Default is 8080 for HTTP and 8443 for HTTPS.
+        :param ssl: Optional SSLContext to serve HTTPS.
+        :param workers: Number of worker processes to fork.
+        :param reuse_port: If True each worker binds its own listener with SO_REUSEPORT,
+                           if False all workers share a single pre-bound listener.
+                           Default is to use SO_REUSEPORT when the platform supports it.
+        :return: None
+        """
         if port is None:
             if ssl is None:
                 port = 8080
             else:
                 port = 8443
-        print("===== Running on {}://{}:{}/ (Stormhttp/{})=====\n(Press Ctrl+C to quit)".format(
+        print("===== Running on {}://{}:{}/ (Stormhttp/{}){}=====\n(Press Ctrl+C to quit)".format(
             "http" if ssl is None else "https",
-            host, port, self.server_version
+            host, port, self.server_version,
+            " with {} workers".format(workers) if workers > 1 else ""
         ))
+        self.compile_routes()
+        if workers <= 1:
+            try:
+                self._listeners = [self.loop.run_until_complete(
+                    self.loop.create_server(lambda: ServerHttpProtocol(self), host, port, ssl=ssl)
+                )]
+                self._listen_ssl = ssl
+                self.loop.run_forever()
+            except KeyboardInterrupt:
+                pass
+        else:
+            if reuse_port is None:
+                reuse_port = _reuse_port_available()
+            sock = None if reuse_port else _create_listen_socket(host, port)
+            self._supervise_workers(workers, host, port, ssl, sock)
+
+    def _supervise_workers(self, workers: int, host: str, port: int, ssl: typing.Optional[_ssl.SSLContext],
+                           sock: typing.Optional[socket.socket]) -> None:
+        """
+        Forks the worker processes and restarts any that exit until
+        the parent receives SIGINT or SIGTERM.
+        :param workers: Number of worker processes to keep alive.
+        :param host: Host for workers to bind to if they bind their own listener.
+        :param port: Port for workers to bind to if they bind their own listener.
+        :param ssl: Optional SSLContext to serve HTTPS.
+        :param sock: Pre-bound listening socket to share or None to bind with SO_REUSEPORT.
+        :return: None
+        """
+        children = {}  # type: typing.Dict[int, float]
+        shutting_down = False
+
+        def shutdown(signum, _):
+            nonlocal shutting_down
+            shutting_down = True
+            for child in children:
+                try:
+                    os.kill(child, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        previous_handlers = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
         try:
-            self.loop.run_until_complete(self.loop.create_server(lambda: ServerHttpProtocol(self), host, port, ssl=ssl))
+            for _ in range(workers):
+                children[self._fork_worker(host, port, ssl, sock)] = time.monotonic()
+            while children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                started = children.pop(pid, None)
+                if started is None or shutting_down:
+                    continue
+
+                # Throttle restarts so a worker that crashes on start-up doesn't spin the parent.
+                if time.monotonic() - started < _WORKER_RESTART_DELAY:
+                    time.sleep(_WORKER_RESTART_DELAY)
+                if not shutting_down:
+                    children[self._fork_worker(host, port, ssl, sock)] = time.monotonic()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            if sock is not None:
+                sock.close()
+
+    def _fork_worker(self, host: str, port: int, ssl: typing.Optional[_ssl.SSLContext],
+                     sock: typing.Optional[socket.socket]) -> int:
+        """
+        Forks a single worker process that runs its own event loop.
+        :return: PID of the worker process in the parent.
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+
+        exit_code = 0
+        try:
+            # Only the parent reacts to Ctrl+C, workers are stopped by the forwarded SIGTERM.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.loop = _new_event_loop(self.loop)
+            asyncio.set_event_loop(self.loop)
+            if sock is None:
+                sock = _create_listen_socket(host, port, reuse_port=True)
+            self.loop.add_signal_handler(signal.SIGTERM, self._on_worker_sigterm)
+            self._listeners = [self.loop.run_until_complete(
+                self.loop.create_server(lambda: ServerHttpProtocol(self), sock=sock, ssl=ssl)
+            )]
+            self._listen_ssl = ssl
             self.loop.run_forever()
-        except KeyboardInterrupt:
-            pass
+            for listener in self._listeners:
+                listener.close()
+                self.loop.run_until_complete(listener.wait_closed())
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
 
-    def add_route(self, path: bytes, method: bytes, handler: typing.Callable[[HttpRequest], HttpResponse]) -> None:
-        prefix_branch = self._traverse_prefix_autofill(path)
-        if b'/' in prefix_branch:
-            if method in prefix_branch[b'/']:
-                raise ValueError("Route {} {} already exists.".format(method, path))
-            prefix_branch[b'/'][method] = handler
-        else:
-            prefix_branch[b'/'] = {method: handler}
+    async def shutdown(self, timeout: typing.Optional[float]=None) -> None:
+        """
+        Stops accepting connections and lets every connection finish the requests it has
+        received, closing each connection once it is idle. Connections that are still open
+        after the timeout are closed, which cancels their handlers.
+        :param timeout: Seconds to wait for connections to finish. Default is Server.shutdown_timeout.
+        :return: None
+        """
+        self._shutting_down = True
+        self._accept_paused = True
+        for listener in self._listeners:
+            listener.close()
+        self._listeners = []
+        for sock in self._listen_sockets:
+            sock.close()
+        self._listen_sockets = []
+
+        # Connections that are receiving a request stop after it, see _on_request_complete().
+        for protocol in list(self._connections):
+            if protocol._parse_state == _PARSE_IDLE:
+                protocol._requests_exhausted = True
+                protocol._update_idle()
+        if self._connections:
+            self._drained = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self._drained, self.shutdown_timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                for protocol in list(self._connections):
+                    protocol.transport.close()
+            finally:
+                self._drained = None
+
+    def _on_worker_sigterm(self) -> None:
+        # Workers can get SIGTERM both from the parent and from whoever signalled the process group.
+        if not self._shutting_down:
+            self.loop.create_task(self.shutdown()).add_done_callback(lambda _: self.loop.stop())
+
+    def _connection_made(self, protocol: 'ServerHttpProtocol') -> None:
+        self._connections.add(protocol)
+        self.connection_count += 1
+        if self.max_connections is not None and self.connection_count >= self.max_connections:
+            self._pause_accepting()
+
+    def _connection_lost(self, protocol: 'ServerHttpProtocol') -> None:
+        self._connections.discard(protocol)
+        self.connection_count -= 1
+        if self._drained is not None and not self._connections and not self._drained.done():
+            self._drained.set_result(None)
+        if self._accept_paused and not self._shutting_down and \
+           (self.max_connections is None or self.connection_count < self.max_connections):
+            self._resume_accepting()
+
+    def _pause_accepting(self) -> None:
+        """
+        Stops accepting connections by closing the listeners. Duplicates of the listening
+        sockets are kept open so new connections wait in the backlog until accepting resumes.
+        :return: None
+        """
+        if self._accept_paused:
+            return
+        self._accept_paused = True
+        if not self._listen_sockets:
+            self._listen_sockets = [
+                socket.socket(sock.family, sock.type, sock.proto, fileno=os.dup(sock.fileno()))
+                for listener in self._listeners for sock in listener.sockets
+            ]
+        for listener in self._listeners:
+            listener.close()
+        self._listeners = []
+
+    def _resume_accepting(self) -> None:
+        if not self._accept_paused:
+            return
+        self._accept_paused = False
+        self.loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        for sock in self._listen_sockets:
+            listener = await self.loop.create_server(lambda: ServerHttpProtocol(self), sock=sock.dup(), ssl=self._listen_ssl)
+            if self._accept_paused:
+                # Paused again while the listener was being created.
+                listener.close()
+            else:
+                self._listeners.append(listener)
+
+    def add_route(self, path: bytes, method: bytes, handler: typing.Callable[[HttpRequest], HttpResponse],
+                  stream_body: bool=False, max_in_flight: typing.Optional[int]=None,
+                  cancel_on_disconnect: bool=True) -> None:
+        """
+        Adds a handler for a method on a path.
+        :param path: Path of the route, see Router.add() for parameter syntax.
+        :param method: HTTP method the handler responds to.
+        :param handler: Function or coroutine function that takes an HttpRequest and returns an HttpResponse.
+        :param stream_body: If True the handler is called as soon as the request headers are
+                            received and reads the body from request.body_stream.
+        :param max_in_flight: Maximum number of requests to the path handled at once when
+                              Server.admission is set, shared by every method of the path.
+        :param cancel_on_disconnect: If False the handlers of the path keep running after the client
+                                     disconnects, for example to finish writes that must not be interrupted.
+                                     Shared by every method of the path.
+        :return: None
+        """
+        route = self.router.add(path)
+        if method in route.handlers:
+            raise ValueError("Route {} {} already exists.".format(method, path))
+        route.handlers[method] = handler
+        if stream_body:
+            route.stream_methods.add(method)
+            self._stream_body_routes = True
+        if max_in_flight is not None:
+            route.max_in_flight = max_in_flight
+        if not cancel_on_disconnect:
+            route.cancel_on_disconnect = False
+        self._generation += 1
+
+    def add_static_route(self, prefix: bytes, directory: str, **kwargs) -> StaticFileHandler:
+        """
+        Serves the files in a directory under a path prefix.
+        :param prefix: Path prefix to serve the files under.
+        :param directory: Directory to serve files from.
+        :param kwargs: Options for the StaticFileHandler.
+        :return: The StaticFileHandler serving the directory.
+        """
+        kwargs.setdefault("compression_policy", self.compression_policy)
+        handler = StaticFileHandler(directory, **kwargs)
+        self.add_route(prefix.rstrip(b'/') + b'/<path:' + handler.match_info_key + b'>', b'GET', handler)
+        return handler
 
     def add_middleware(self, middleware: AbstractMiddleware):
         self.middlewares.append(middleware)
+        self._generation += 1
+
+    def should_stream_body(self, request: HttpRequest) -> bool:
+        """
+        Checks whether the body of a request is streamed to its handler.
+        :param request: HttpRequest with its headers parsed.
+        :return: True if the route streams the request body.
+        """
+        if not self._stream_body_routes:
+            return False
+        route, _ = self.router.resolve(request.url.path)
+        return route is not None and request.method in route.stream_methods
+
+    def compile_routes(self) -> None:
+        """
+        Compiles the middleware chain of every route. Routes are also compiled
+        lazily on their first request after a route or middleware is added, this
+        must be called if a middleware's routes are changed after that point.
+        :return: None
+        """
+        self._generation += 1
+        for route in self.router.routes:
+            self._compile_route(route)
+
+    def _compile_route(self, route: Route) -> None:
+        """
+        Resolves which middlewares apply to a route and whether each
+        handler and hook is a coroutine function so that dispatching a
+        request only has to walk a flat chain.
+        :param route: Route to compile.
+        :return: None
+        """
+        chain = []
+        for middleware in self.middlewares:
+            applies = middleware.should_be_applied_to_route(route)
+            if applies is False:
+                continue
+            chain.append((
+                None if applies else middleware.should_be_applied,
+                middleware.before_handler, asyncio.iscoroutinefunction(middleware.before_handler),
+                middleware.after_handler, asyncio.iscoroutinefunction(middleware.after_handler)
+            ))
+        route.middleware_chain = tuple(chain)
+        route.async_handlers = frozenset(
+            method for method, handler in route.handlers.items() if asyncio.iscoroutinefunction(handler)
+        )
+        route.method_not_allowed = HttpResponse(
+            status_code=405, status=b'Method Not Allowed', headers={b'Allow': b', '.join(list(route.handlers.keys()))}
+        ).freeze()
+        route.generation = self._generation
 
     async def route_request(self, request: HttpRequest, transport: asyncio.WriteTransport, get_response=False):
-        prefix_branch = self._traverse_prefix_nofill(request)
-        if prefix_branch is None:
-            response = HttpResponse(status_code=404, status=b'Not Found')
-        else:
-            is_head = False
-            if request.method == b'HEAD' and request.method not in prefix_branch and b'GET' in prefix_branch:
-                request.method = b'GET'
-                is_head = True
-            if request.method not in prefix_branch:
-                response = HttpResponse(status_code=405, status=b'Method Not Allowed')
-                response.headers[b'Allow'] = b', '.join(list(prefix_branch.keys()))
+        response = self.dispatch(request, transport)
+        if not isinstance(response, HttpResponse):
+            response = await response
+        if get_response:
+            return response
+
+    def dispatch(self, request: HttpRequest, transport: asyncio.WriteTransport) -> typing.Union[HttpResponse, typing.Awaitable[HttpResponse]]:
+        """
+        Routes a request and writes the response to the transport. Synchronous
+        middlewares and handlers are run inline, as soon as an asynchronous hook
+        or handler is reached a coroutine is returned that finishes the request.
+        :param request: HttpRequest to route.
+        :param transport: Transport to write the response to.
+        :return: The HttpResponse if it was written inline, otherwise a coroutine that returns it.
+        """
+        route, match_info = self.router.resolve(request.url.path)
+        if route is None:
+            return self._write_response(request, _NOT_FOUND_RESPONSE, transport, False)
+        if match_info:
+            request.url.match_info = match_info
+        if route.generation != self._generation:
+            self._compile_route(route)
+        handlers = route.handlers
+        is_head = False
+        if request.method == b'HEAD' and request.method not in handlers and b'GET' in handlers:
+            request.method = b'GET'
+            is_head = True
+        if request.method not in handlers:
+            return self._write_response(request, route.method_not_allowed, transport, is_head)
+
+        admission = self.admission
+        if admission is None:
+            return self._dispatch_route(request, transport, route, is_head)
+        admitted = admission.acquire(route)
+        if admitted is False:
+            return self._write_response(request, admission.overloaded_response, transport, is_head)
+        if admitted is not True:
+            return self._dispatch_queued(request, transport, route, is_head, admitted)
+        try:
+            pending = self._dispatch_route(request, transport, route, is_head)
+        except BaseException:
+            admission.release(route)
+            raise
+        if isinstance(pending, HttpResponse):
+            admission.release(route)
+            return pending
+        return self._release_after(pending, route)
+
+    def _dispatch_route(self, request: HttpRequest, transport: asyncio.WriteTransport, route: Route,
+                        is_head: bool) -> typing.Union[HttpResponse, typing.Awaitable[HttpResponse]]:
+        """
+        Applies the middlewares and the handler of a resolved route to a request.
+        :return: The HttpResponse if it was written inline, otherwise a coroutine that returns it.
+        """
+        handlers = route.handlers
+        response = None
+        applied_middleware = []
+        chain = route.middleware_chain
+        for index in range(len(chain)):
+            should_be_applied, before, before_is_async, after, after_is_async = chain[index]
+            if should_be_applied is not None and not should_be_applied(request):
+                continue
+            if before_is_async:
+                return self._dispatch_async(request, transport, route, is_head, applied_middleware, index)
+            response = before(request)
+            if response is not None:
+                break
+            applied_middleware.append((after, after_is_async))
+
+        # If we haven't gotten a response yet, do the handler.
+        if response is None:
+            if request.method in route.async_handlers:
+                return self._dispatch_async(request, transport, route, is_head, applied_middleware, len(chain))
+            response = handlers[request.method](request)
+
+        # Apply middlewares after_handler() in reverse order.
+        # This is mostly for AbstractTemplatingMiddlewares to work correctly.
+        # An after_handler() can return an HttpResponse to replace the response.
+        # Frozen responses are shared so the hooks get a copy they can modify.
+        if applied_middleware and response.is_frozen():
+            response = response.copy()
+        for position in range(len(applied_middleware) - 1, -1, -1):
+            after, after_is_async = applied_middleware[position]
+            if after_is_async:
+                return self._dispatch_async(request, transport, route, is_head, applied_middleware,
+                                            len(chain), response, position)
+            replacement = after(request, response)
+            if replacement is not None:
+                response = replacement
+
+        return self._write_response(request, response, transport, is_head)
+
+    async def _dispatch_async(self, request: HttpRequest, transport: asyncio.WriteTransport, route: Route,
+                              is_head: bool, applied_middleware: typing.List[typing.Tuple[typing.Callable, bool]],
+                              index: int, response: typing.Optional[HttpResponse]=None,
+                              after_position: typing.Optional[int]=None) -> HttpResponse:
+        """
+        Finishes dispatching a request from the first asynchronous link that dispatch() reached.
+        :param index: Position in the middleware chain to resume from, past the end of the chain for the handler.
+                      The middleware at this position has already been checked with should_be_applied().
+        :param response: Response from the handler if resuming with the after_handler() hooks.
+        :param after_position: Position in applied_middleware to resume the after_handler() hooks from.
+        :return: The HttpResponse that was written.
+        """
+        if after_position is None:
+            chain = route.middleware_chain
+            for position in range(index, len(chain)):
+                should_be_applied, before, before_is_async, after, after_is_async = chain[position]
+                if position != index and should_be_applied is not None and not should_be_applied(request):
+                    continue
+                if before_is_async:
+                    response = await before(request)
+                else:
+                    response = before(request)
+                if response is not None:
+                    break
+                applied_middleware.append((after, after_is_async))
+
+            if response is None:
+                if request.method in route.async_handlers:
+                    response = await route.handlers[request.method](request)
+                else:
+                    response = route.handlers[request.method](request)
+            after_position = len(applied_middleware) - 1
+
+        if after_position >= 0 and response.is_frozen():
+            response = response.copy()
+        for position in range(after_position, -1, -1):
+            after, after_is_async = applied_middleware[position]
+            if after_is_async:
+                replacement = await after(request, response)
             else:
-                response = None
-
-                # If the correct request handler is found, begin applying middlewares.
-                applied_middleware = []
-                if self.middlewares:
-                    for middleware in self.middlewares:
-                        if middleware.should_be_applied(request):
-                            if asyncio.iscoroutinefunction(middleware.before_handler):
-                                response = await middleware.before_handler(request)
-                            else:
-                                response = middleware.before_handler(request)
-                            if response is not None:
-                                break
-                            applied_middleware.insert(0, middleware)
-
-                # If we haven't gotten a response yet, do the handler.
-                if response is None:
-                    handler = prefix_branch[request.method]
-                    if asyncio.iscoroutinefunction(handler):
-                        response = await handler(request)
-                    else:
-                        response = handler(request)
+                replacement = after(request, response)
+            if replacement is not None:
+                response = replacement
+
+        written = self._write_response(request, response, transport, is_head)
+        if not isinstance(written, HttpResponse):
+            written = await written
+        return written
+
+    async def _dispatch_queued(self, request: HttpRequest, transport: asyncio.WriteTransport, route: Route,
+                               is_head: bool, waiter: asyncio.Future) -> HttpResponse:
+        """
+        Waits for a queued request to be admitted before dispatching it.
+        :param waiter: Future returned by AdmissionController.acquire().
+        :return: The HttpResponse that was written.
+        """
+        admission = self.admission
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            admission.abandon(route, waiter)
+            raise
+        if not admitted:
+            response = admission.overloaded_response
+        else:
+            try:
+                response = self._dispatch_route(request, transport, route, is_head)
+                if not isinstance(response, HttpResponse):
+                    response = await response
+                return response
+            finally:
+                admission.release(route)
+        written = self._write_response(request, response, transport, is_head)
+        if not isinstance(written, HttpResponse):
+            written = await written
+        return written
+
+    async def _release_after(self, pending: typing.Awaitable[HttpResponse], route: Route) -> HttpResponse:
+        try:
+            return await pending
+        finally:
+            self.admission.release(route)
 
-                # Apply middlewares after_handler() in reverse order.
-                # This is mostly for AbstractTemplatingMiddlewares to work correctly.
-                if applied_middleware:
-                    for middleware in applied_middleware:
-                        if asyncio.iscoroutinefunction(middleware.after_handler):
-                            await middleware.after_handler(request, response)
-                        else:
-                            middleware.after_handler(request, response)
+    def _monitor_loop_lag(self) -> None:
+        """
+        Measures how late the event loop runs a callback that is scheduled at a fixed
+        interval. Server.loop_lag is the lag of the latest measurement in seconds.
+        :return: None
+        """
+        now = self.loop.time()
+        if self._loop_lag_deadline is not None:
+            self.loop_lag = max(0.0, now - self._loop_lag_deadline)
+        self._loop_lag_deadline = now + _LOOP_LAG_INTERVAL
+        self._loop_lag_handle = self.loop.call_at(self._loop_lag_deadline, self._monitor_loop_lag)
 
-            if is_head:
-                response.body = b''
+    def _write_response(self, request: HttpRequest, response: HttpResponse, transport: asyncio.WriteTransport,
+                        is_head: bool) -> typing.Union[HttpResponse, typing.Awaitable[HttpResponse]]:
+        if isinstance(response, StreamingHttpResponse):
+            return self._write_streaming_response(request, response, transport, is_head)
+        if isinstance(response, FileHttpResponse):
+            return self._write_file_response(request, response, transport, is_head)
+        if response.is_frozen():
+            encoding = self._negotiate_encoding(request, response)
+            head, body = response.frozen_buffers(
+                request.version, encoding,
+                None if encoding is None else self.compression_policy.level(encoding, is_static=True)
+            )
+            fragment = self._header_cache.fragment(response.headers)
+            head = head + fragment + b'\r\n\r\n' if fragment else head + b'\r\n'
+            if body and not is_head:
+                transport.writelines((head, body))
+            else:
+                transport.write(head)
+            return response
+        if is_head:
+            response.body = b''
 
         # Apply headers to the response that are always applied.
         response.version = request.version
-        if len(response) > self.min_compression_length and b'Accept-Encoding' in request.headers:
-            for encoding, _ in request.headers.qlist(b'Accept-Encoding'):
-                if encoding in _SUPPORTED_ENCODINGS:
-                    response.set_encoding(encoding)
-                    break
+        encoding = self._negotiate_encoding(request, response)
+        if encoding is not None:
+            level = self.compression_policy.level(encoding, loop_lag=self.loop_lag)
+            if len(response) > self.executor_compression_length:
+                return self._write_compressed_response(response, transport, encoding, level)
+            response.set_encoding(encoding, level=level)
         if b'Content-Length' not in response.headers:
             response.headers[b'Content-Length'] = len(response)
-        if b'Date' not in response.headers:
-            response.headers[b'Date'] = datetime.datetime.utcnow()
-        if b'Server' not in response.headers:
-            response.headers[b'Server'] = self.server_header
 
-        transport.write(response.to_bytes())
+        transport.writelines(response.to_buffers(self._header_cache.fragment(response.headers)))
+        return response
 
-        if get_response:
-            return response
+    async def _write_compressed_response(self, response: HttpResponse, transport: asyncio.WriteTransport,
+                                         encoding: bytes, level: typing.Optional[int]) -> HttpResponse:
+        """
+        Compresses a large body in the compression executor so that the event
+        loop keeps serving other requests, then writes the response.
+        :return: The HttpResponse that was written.
+        """
+        executor = self.compression_executor
+        if executor is None:
+            executor = self.compression_executor = concurrent.futures.ThreadPoolExecutor(self.compression_workers)
+        body = response.body
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor) and not isinstance(body, bytes):
+            body = bytes(body)
+        response.body = await self.loop.run_in_executor(executor, _transcode_body, body, b'identity', encoding, level)
+        response.headers[b'Content-Length'] = len(response)
+        response.headers[b'Content-Encoding'] = encoding
+        transport.writelines(response.to_buffers(self._header_cache.fragment(response.headers)))
+        return response
 
-    def _traverse_prefix_autofill(self, path: bytes) -> typing.Dict[bytes, typing.Any]:
+    def _negotiate_encoding(self, request: HttpRequest, response: HttpResponse) -> typing.Optional[bytes]:
         """
-        Traverses the prefix trie and returns the resulting leaf.
-        This method also automatically fills in branches where needed to reach the path.
-        :param path: Path to traverse.
-        :return: Leaf node of the prefix trie.
+        Chooses the Content-Encoding to compress a response's body with according to the compression policy.
+        Responses that already have a Content-Encoding, such as pre-compressed files, are left alone, as are
+        partial responses whose ranges refer to the body as it is.
+        :return: Encoding or None if the body should be sent as it is.
         """
-        path = path.strip(b'/').split(b'/')
-        current = self._prefix
-        for step in path:
-            if step == b'':
-                continue
-            if step not in current:
-                current[step] = {}
-            current = current[step]
-        return current
-
-    def _traverse_prefix_nofill(self, request: HttpRequest) -> typing.Optional[typing.Dict[bytes, typing.Any]]:
-        """
-        Traverses the prefix trie and returns the resulting leaf.
-        This method does not fill in branches. Returns None if the leaf cannot be found.
-        This method also fills the request.match_info values.
-        :param request: HttpRequest to traverse the path for and fill in match_info values.
-        :return: Leaf node of the prefix trie.
-        """
-        path = request.url.path.strip(b'/').split(b'/')
-        current = self._prefix
-        for step in path:
-            if step == b'':
-                continue
-            if step not in current:
-                if len(current) == 1:
-                    pos_match_info = list(current.keys())[0]
-                    match_info = _MATCH_INFO_REGEX.match(pos_match_info)
-                    if match_info is not None:
-                        request.url.match_info[match_info.group(1)] = step
-                        current = current[pos_match_info]
-                        continue
-                return None
-            current = current[step]
-        return current.get(b'/', None)
+        if response.status_code == 206 or b'Content-Encoding' in response.headers or \
+           b'Content-Range' in response.headers:
+            return None
+        return self.compression_policy.negotiate(request, response.headers.get_first(b'Content-Type'), len(response))
+
+    async def _write_streaming_response(self, request: HttpRequest, response: StreamingHttpResponse,
+                                        transport: asyncio.WriteTransport, is_head: bool) -> StreamingHttpResponse:
+        """
+        Writes the head of a StreamingHttpResponse and then each chunk of the body as it's
+        produced, waiting for the transport to drain between chunks.
+        :return: The StreamingHttpResponse that was written.
+        """
+        response.version = request.version
+        chunked = False
+        close_connection = False
+        if b'Content-Length' not in response.headers:
+            if request.version == b'1.1':
+                chunked = True
+                response.headers[b'Transfer-Encoding'] = b'chunked'
+            else:
+                close_connection = True
+                response.headers[b'Connection'] = b'close'
+        transport.write(response.to_head_bytes(self._header_cache.fragment(response.headers)))
+
+        if isinstance(transport, _PipelinedWriter):
+            drain = transport.drain
+        elif request.connection is not None:
+            drain = request.connection.drain
+        else:
+            drain = None
+
+        body_iterator = response.body_iterator
+        if is_head:
+            if hasattr(body_iterator, "aclose"):
+                await body_iterator.aclose()
+        elif hasattr(body_iterator, "__aiter__"):
+            async for chunk in body_iterator:
+                if chunk:
+                    transport.writelines((b'%x\r\n' % len(chunk), chunk, b'\r\n') if chunked else (chunk,))
+                    if drain is not None:
+                        await drain()
+        else:
+            for chunk in body_iterator:
+                if chunk:
+                    transport.writelines((b'%x\r\n' % len(chunk), chunk, b'\r\n') if chunked else (chunk,))
+                    if drain is not None:
+                        await drain()
+
+        if chunked and not is_head:
+            transport.write(b'0\r\n\r\n')
+        if close_connection:
+            transport.close()
+        return response
+
+    async def _write_file_response(self, request: HttpRequest, response: FileHttpResponse,
+                                   transport: asyncio.WriteTransport, is_head: bool) -> FileHttpResponse:
+        """
+        Writes the head of a FileHttpResponse and then sends the segments of the
+        file with sendfile() if the event loop and transport support it.
+        :return: The FileHttpResponse that was written.
+        """
+        response.version = request.version
+        transport.write(response.to_head_bytes(self._header_cache.fragment(response.headers)))
+        if is_head:
+            return response
+
+        with open(response.path, "rb") as file:
+            for prefix, offset, count in response.segments:
+                if prefix:
+                    transport.write(prefix)
+                await self._sendfile(request, transport, file, offset, count)
+        if response.trailer:
+            transport.write(response.trailer)
+        return response
+
+    async def _sendfile(self, request: HttpRequest, transport: asyncio.WriteTransport,
+                        file: typing.BinaryIO, offset: int, count: int) -> None:
+        if isinstance(transport, _PipelinedWriter):
+            drain = transport.drain
+            # sendfile() bypasses the writer's buffer so wait for earlier responses first.
+            await drain()
+            transport = transport.transport
+        elif request.connection is not None:
+            drain = request.connection.drain
+        else:
+            drain = None
+
+        try:
+            await self.loop.sendfile(transport, file, offset, count)
+            return
+        except (AttributeError, NotImplementedError):
+            pass
+
+        # Event loop doesn't support sendfile() so read the file in chunks.
+        file.seek(offset)
+        while count > 0:
+            chunk = file.read(min(count, _SENDFILE_FALLBACK_CHUNK_SIZE))
+            if not chunk:
+                break
+            count -= len(chunk)
+            transport.write(chunk)
+            if drain is not None:
+                await drain()
+
+
+def _reuse_port_available() -> bool:
+    """
+    Checks whether the platform accepts SO_REUSEPORT on a TCP socket.
+    :return: True if SO_REUSEPORT can be used.
+    """
+    if not _SUPPORTS_REUSE_PORT:
+        return False
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _create_listen_socket(host: str, port: int, reuse_port: bool=False) -> socket.socket:
+    """
+    Creates a non-blocking listening socket bound to the host and port.
+    :param host: Host to bind to.
+    :param port: Port to bind to.
+    :param reuse_port: If True sets SO_REUSEPORT so multiple processes can bind the same port.
+    :return: Listening socket.
+    """
+    family, socktype, proto, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+    )[0]
+    sock = socket.socket(family, socktype, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.listen(_LISTEN_BACKLOG)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _new_event_loop(loop: asyncio.AbstractEventLoop) -> asyncio.AbstractEventLoop:
+    """
+    Creates a fresh event loop of the same type as the given loop.
+    Used by forked workers, which can't share the parent's selector.
+    :param loop: Event loop of the parent process.
+    :return: New event loop.
+    """
+    try:
+        return loop.__class__()
+    except TypeError:
+        return asyncio.new_event_loop()
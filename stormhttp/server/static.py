@@ -0,0 +1,317 @@
+import collections
+import datetime
+import functools
+import mimetypes
+import os
+import stat as _stat
+import typing
+import urllib.parse
+import uuid
+from .compression import CompressionPolicy
+from ..primitives import FileHttpResponse, HttpRequest, HttpResponse
+from ..primitives.cookies import _COOKIE_EXPIRE_FORMAT
+from ..primitives.message import _transcode_body
+
+__all__ = [
+    "StaticFileHandler"
+]
+_PRECOMPRESSED_VARIANTS = ((b'br', ".br"), (b'gzip', ".gz"))
+_DEFAULT_CONTENT_TYPE = b'application/octet-stream'
+_DEFAULT_CACHE_FILE_LIMIT = 65536
+_MAX_RANGES = 16
+_HTTP_DATE_CACHE_SIZE = 256
+
+
+class StaticFileHandler:
+    def __init__(self, directory: str, precompressed: bool=True, cache_max_size: int=0,
+                 cache_file_limit: int=_DEFAULT_CACHE_FILE_LIMIT, match_info_key: bytes=b'filename',
+                 compression_policy: CompressionPolicy=None):
+        """
+        Request handler that serves files from a directory. Files are sent with sendfile()
+        where the event loop supports it. Supports ETag / Last-Modified validators, single
+        and multiple byte ranges with If-Range, and pre-compressed .br / .gz siblings of
+        files that are chosen by the request's Accept-Encoding header. Files in the in-memory
+        cache without a pre-compressed sibling are compressed once per Content-Encoding and
+        each encoding has its own ETag, byte ranges refer to the encoded file.
+        :param directory: Directory to serve files from.
+        :param precompressed: If True, serve pre-compressed siblings of files when they exist.
+        :param cache_max_size: Maximum number of bytes of small files to keep in memory, 0 disables the cache.
+        :param cache_file_limit: Files larger than this many bytes are never kept in memory.
+        :param match_info_key: Key of the request's match_info that contains the file path.
+        :param compression_policy: Policy for compressing cached files, Server.add_static_route() passes the Server's.
+        """
+        self.directory = os.path.realpath(directory)
+        self.precompressed = precompressed
+        self.cache_max_size = cache_max_size
+        self.cache_file_limit = cache_file_limit
+        self.match_info_key = match_info_key
+        self.compression_policy = CompressionPolicy() if compression_policy is None else compression_policy
+        # Each entry has the file's mtime, size and contents and its contents per Content-Encoding.
+        self._cache = collections.OrderedDict()  # type: typing.Dict[str, typing.Tuple[int, int, bytes, typing.Dict[bytes, bytes]]]
+        self._cache_size = 0
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        path = self._resolve_path(request.url.match_info.get(self.match_info_key, b''))
+        file_stat = _stat_regular_file(path) if path is not None else None
+        if file_stat is None:
+            return HttpResponse(status_code=404, status=b'Not Found')
+
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type.encode("utf-8") if content_type is not None else _DEFAULT_CONTENT_TYPE
+        headers = {
+            b'Content-Type': content_type,
+            b'Accept-Ranges': b'bytes'
+        }
+
+        # Choose a pre-compressed variant of the file if the client accepts it.
+        encoding = b'identity'
+        headers[b'Vary'] = b'Accept-Encoding'
+        if self.precompressed:
+            if b'Accept-Encoding' in request.headers:
+                accepted = {item for item, qvalue in request.headers.qlist(b'Accept-Encoding') if qvalue > 0}
+                for variant_encoding, extension in _PRECOMPRESSED_VARIANTS:
+                    if variant_encoding in accepted:
+                        variant_stat = _stat_regular_file(path + extension)
+                        if variant_stat is not None:
+                            encoding = variant_encoding
+                            path += extension
+                            file_stat = variant_stat
+                            headers[b'Content-Encoding'] = encoding
+                            break
+
+        # Otherwise a cached file is compressed once per encoding.
+        data = self._read_cached(path, file_stat)
+        size = file_stat.st_size
+        if data is not None and encoding == b'identity':
+            dynamic_encoding = self.compression_policy.negotiate(request, content_type, size)
+            if dynamic_encoding is not None:
+                encoding = dynamic_encoding
+                data = self._read_cached_encoded(path, data, encoding)
+                headers[b'Content-Encoding'] = encoding
+
+        etag = b'"%x-%x%b"' % (file_stat.st_mtime_ns, size, b'' if encoding == b'identity' else b'-' + encoding)
+        if data is not None:
+            size = len(data)
+        last_modified = datetime.datetime.utcfromtimestamp(int(file_stat.st_mtime))
+        headers[b'Etag'] = etag
+        headers[b'Last-Modified'] = last_modified
+
+        if _is_not_modified(request, etag, last_modified):
+            return HttpResponse(headers=headers, status_code=304, status=b'Not Modified')
+
+        ranges = None
+        if b'Range' in request.headers and _if_range_matches(request, etag, last_modified):
+            ranges = _parse_ranges(request.headers[b'Range'][0], size)
+            if ranges is not None and not ranges:
+                headers[b'Content-Range'] = b'bytes */%d' % size
+                return HttpResponse(headers=headers, status_code=416, status=b'Range Not Satisfiable')
+
+        if not ranges:
+            if data is not None:
+                response = HttpResponse(headers=headers, status_code=200, status=b'OK')
+                response.body = data
+            else:
+                response = FileHttpResponse(path, [(b'', 0, size)], headers=headers)
+            response.headers[b'Content-Length'] = size
+            return response
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers[b'Content-Range'] = b'bytes %d-%d/%d' % (start, end, size)
+            if data is not None:
+                response = HttpResponse(headers=headers, status_code=206, status=b'Partial Content')
+                response.body = data[start:end + 1]
+            else:
+                response = FileHttpResponse(path, [(b'', start, end - start + 1)], headers=headers,
+                                            status_code=206, status=b'Partial Content')
+            response.headers[b'Content-Length'] = end - start + 1
+            return response
+
+        # Multiple ranges are sent as multipart/byteranges.
+        boundary = uuid.uuid4().hex.encode("utf-8")
+        segments = []
+        for start, end in ranges:
+            segments.append((
+                b'\r\n--%b\r\nContent-Type: %b\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+                    boundary, content_type, start, end, size
+                ),
+                start, end - start + 1
+            ))
+        trailer = b'\r\n--%b--\r\n' % boundary
+        headers[b'Content-Type'] = b'multipart/byteranges; boundary=%b' % boundary
+        if data is not None:
+            response = HttpResponse(headers=headers, status_code=206, status=b'Partial Content')
+            response.body = b''.join([
+                part for prefix, offset, count in segments for part in (prefix, data[offset:offset + count])
+            ]) + trailer
+        else:
+            response = FileHttpResponse(path, segments, trailer, headers=headers,
+                                        status_code=206, status=b'Partial Content')
+        response.headers[b'Content-Length'] = sum([len(prefix) + count for prefix, _, count in segments]) + len(trailer)
+        return response
+
+    def _resolve_path(self, relative: bytes) -> typing.Optional[str]:
+        """
+        Turns the requested path into a path on disk, refusing
+        any path that would escape the served directory.
+        :param relative: Path relative to the served directory, percent-encoded.
+        :return: Absolute path or None if the path isn't allowed.
+        """
+        try:
+            relative = urllib.parse.unquote_to_bytes(relative).decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+        if '\x00' in relative:
+            return None
+        path = os.path.realpath(os.path.join(self.directory, relative.lstrip("/")))
+        if not path.startswith(self.directory + os.sep):
+            return None
+        return path
+
+    def _read_cached(self, path: str, file_stat: os.stat_result) -> typing.Optional[bytes]:
+        """
+        Gets the contents of a small file from the in-memory cache, reading it
+        into the cache if it isn't there or was modified since it was cached.
+        :return: Contents of the file or None if the file isn't cacheable.
+        """
+        if file_stat.st_size > self.cache_file_limit or file_stat.st_size > self.cache_max_size:
+            return None
+        entry = self._cache.get(path, None)
+        if entry is not None:
+            mtime_ns, size, data, _ = entry
+            if mtime_ns == file_stat.st_mtime_ns and size == file_stat.st_size:
+                self._cache.move_to_end(path)
+                return data
+            del self._cache[path]
+            self._cache_size -= _entry_size(entry)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != file_stat.st_size:
+            return None
+        self._cache[path] = (file_stat.st_mtime_ns, file_stat.st_size, data, {})
+        self._cache_size += file_stat.st_size
+        self._evict()
+        return data
+
+    def _read_cached_encoded(self, path: str, data: bytes, encoding: bytes) -> bytes:
+        """
+        Gets the contents of a cached file in a Content-Encoding, encoding them on first use.
+        :param path: Path of the file that _read_cached() just returned the contents of.
+        :param data: Contents of the file.
+        :param encoding: Content-Encoding to encode the contents with.
+        :return: Encoded contents of the file.
+        """
+        entry = self._cache.get(path, None)
+        encoded = entry[3].get(encoding, None) if entry is not None else None
+        if encoded is None:
+            encoded = _transcode_body(data, b'identity', encoding, self.compression_policy.level(encoding, is_static=True))
+            if entry is not None:
+                entry[3][encoding] = encoded
+                self._cache_size += len(encoded)
+                self._evict()
+        return encoded
+
+    def _evict(self) -> None:
+        while self._cache_size > self.cache_max_size and self._cache:
+            _, entry = self._cache.popitem(last=False)
+            self._cache_size -= _entry_size(entry)
+
+
+def _entry_size(entry: typing.Tuple[int, int, bytes, typing.Dict[bytes, bytes]]) -> int:
+    return entry[1] + sum([len(encoded) for encoded in entry[3].values()])
+
+
+def _stat_regular_file(path: str) -> typing.Optional[os.stat_result]:
+    try:
+        file_stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return file_stat if _stat.S_ISREG(file_stat.st_mode) else None
+
+
+@functools.lru_cache(maxsize=_HTTP_DATE_CACHE_SIZE)
+def _parse_http_date(value: bytes) -> typing.Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.strptime(value.decode("utf-8"), _COOKIE_EXPIRE_FORMAT)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _etag_in_list(etag: bytes, header_values: typing.List[bytes]) -> bool:
+    """
+    Checks whether an ETag matches an If-None-Match header using the weak comparison.
+    :param etag: Strong or weak ETag.
+    :param header_values: Values of the If-None-Match header.
+    :return: True if the ETag matches.
+    """
+    if etag.startswith(b'W/'):
+        etag = etag[2:]
+    for header_value in header_values:
+        for candidate in header_value.split(b','):
+            candidate = candidate.strip()
+            if candidate.startswith(b'W/'):
+                candidate = candidate[2:]
+            if candidate == b'*' or candidate == etag:
+                return True
+    return False
+
+
+def _is_not_modified(request: HttpRequest, etag: bytes, last_modified: datetime.datetime) -> bool:
+    if b'If-None-Match' in request.headers:
+        return _etag_in_list(etag, request.headers[b'If-None-Match'])
+    if b'If-Modified-Since' in request.headers:
+        since = _parse_http_date(request.headers[b'If-Modified-Since'][0])
+        return since is not None and last_modified <= since
+    return False
+
+
+def _if_range_matches(request: HttpRequest, etag: bytes, last_modified: datetime.datetime) -> bool:
+    if b'If-Range' not in request.headers:
+        return True
+    if_range = request.headers[b'If-Range'][0].strip()
+    if if_range.startswith(b'"'):
+        return if_range == etag
+    return _parse_http_date(if_range) == last_modified
+
+
+def _parse_ranges(header: bytes, size: int) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+    """
+    Parses a Range header into a list of inclusive byte ranges.
+    :param header: Value of the Range header.
+    :param size: Size of the file in bytes.
+    :return: None if the header should be ignored, an empty list if
+             no range is satisfiable, otherwise the list of ranges.
+    """
+    unit, _, ranges_spec = header.partition(b'=')
+    if unit.strip() != b'bytes':
+        return None
+    ranges = []
+    specs = ranges_spec.split(b',')
+    if len(specs) > _MAX_RANGES:
+        return None
+    for spec in specs:
+        start, dash, end = spec.strip().partition(b'-')
+        if not dash:
+            return None
+        try:
+            if start:
+                start = int(start)
+                end = int(end) if end else start + size
+                if end < start:
+                    return None
+            else:
+                suffix = int(end)
+                if suffix <= 0:
+                    continue
+                start = max(size - suffix, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    return ranges
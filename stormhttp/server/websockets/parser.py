@@ -58,6 +58,8 @@ class WebSocketError(Exception):
         
         
 class WebSocketMessage:
+    __slots__ = ("message_code", "close_code", "payload", "frames", "_is_message_complete")
+
     def __init__(self, message_code: int=0, close_code: int=-1, payload: bytes=b''):
         self.message_code = message_code
         self.close_code = close_code
@@ -78,6 +80,7 @@ class WebSocketMessage:
         self.message_code = self.frames[-1].message_code
         self.close_code = self.frames[0].close_code
         self.payload = b''.join([frame.payload for frame in self.frames])
+        self.frames.clear()
 
     def to_bytes(self):
         self.to_frames()
@@ -109,6 +112,8 @@ class WebSocketMessage:
 
 
 class WebSocketFrame:
+    __slots__ = ("last_frame", "message_code", "payload", "close_code")
+
     def __init__(self, last_frame: int=0, message_code: int=0, payload: bytes=b'', close_code: int=-1):
         self.last_frame = last_frame
         self.message_code = message_code
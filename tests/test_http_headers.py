@@ -48,3 +48,44 @@ class TestHttpHeaders(unittest.TestCase):
         headers = HttpHeaders()
         headers[b'Accept'] = b'application/xml;q=0.9,text/html,*/*;q=0.8'
         self.assertEqual(headers.qlist(b'Accept'), [(b'text/html', 1.0), (b'application/xml', 0.9), (b'*/*', 0.8)])
+
+    def test_headers_add_and_get_first(self):
+        from stormhttp import HttpHeaders
+
+        headers = HttpHeaders()
+        headers.add(b'content-type', b'text/html')
+        headers.add(b'X-Custom', b'1')
+        headers.add(b'x-custom', b'2')
+        self.assertEqual(headers._index[b'CONTENT-TYPE'], b'text/html')
+        self.assertEqual(headers[b'Content-Type'], [b'text/html'])
+        self.assertEqual(headers[b'X-CUSTOM'], [b'1', b'2'])
+        self.assertEqual(headers.get_first(b'x-custom'), b'1')
+        self.assertIsNone(headers.get_first(b'Missing'))
+        self.assertEqual(dict(headers.items()), {b'CONTENT-TYPE': [b'text/html'], b'X-CUSTOM': [b'1', b'2']})
+
+        copy = headers.copy()
+        copy.add(b'X-Custom', b'3')
+        self.assertEqual(headers[b'X-Custom'], [b'1', b'2'])
+
+    def test_headers_get_returns_copy(self):
+        from stormhttp import HttpHeaders
+
+        headers = HttpHeaders()
+        headers.add(b'X-Single', b'1')
+        headers.add(b'X-Multi', b'1')
+        headers.add(b'X-Multi', b'2')
+        for key in (b'X-Single', b'X-Multi'):
+            headers[key].append(b'3')
+            headers.get(key).append(b'3')
+        self.assertEqual(headers[b'X-Single'], [b'1'])
+        self.assertEqual(headers[b'X-Multi'], [b'1', b'2'])
+
+    def test_headers_key_cache_bounded(self):
+        from stormhttp import HttpHeaders
+        from stormhttp.primitives.headers import _HEADER_KEY_CACHE_SIZE, _upper_header_key
+
+        headers = HttpHeaders()
+        for i in range(_HEADER_KEY_CACHE_SIZE * 2):
+            headers.add(b'x-random-%d' % i, b'')
+        self.assertLessEqual(_upper_header_key.cache_info().currsize, _HEADER_KEY_CACHE_SIZE)
+        self.assertIn(b'X-RANDOM-0', headers)
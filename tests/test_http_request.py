@@ -64,3 +64,82 @@ class TestHttpRequest(unittest.TestCase):
         parser = HttpParser(request)
         parser.feed_data(data)
         self.assertEqual(request.headers.get(b'Accept', None), [b'text/html', b'application/json'])
+
+    def test_reset_and_parser_reuse(self):
+        from stormhttp import HttpRequest, HttpParser
+
+        request = HttpRequest()
+        parser = HttpParser(request)
+        parser.feed_data(b'POST /a HTTP/1.1\r\nCookie: a=1\r\nContent-Length: 2\r\n\r\nab')
+        httptools_parser = parser._parser
+
+        # The httptools parser is reused for the next message on a keep-alive connection.
+        parser.set_target(HttpRequest())
+        self.assertIs(parser._parser, httptools_parser)
+        parser.feed_data(b'GET /b HTTP/1.0\r\n\r\n')
+        self.assertEqual(parser._message.url.path, b'/b')
+        parser.set_target(HttpRequest())
+        self.assertIsNot(parser._parser, httptools_parser)
+
+        request.reset()
+        self.assertEqual((request.method, request.url, len(request)), (b'', None, 0))
+        self.assertEqual((len(request.headers), len(request.cookies)), (0, 0))
+        self.assertFalse(request.is_complete())
+
+    def test_parse_buffers_dropped(self):
+        from stormhttp import HttpRequest, HttpParser
+
+        request = HttpRequest()
+        HttpParser(request).feed_data(b'POST / HTTP/1.1\r\nContent-Length: 4\r\n\r\ntest')
+        self.assertEqual(request.body, b'test')
+        self.assertIsNone(request._body_array)
+        self.assertFalse(hasattr(request, "__dict__"))
+        self.assertFalse(hasattr(request.url, "__dict__"))
+
+    def test_lazy_query_and_cookies(self):
+        from stormhttp import HttpRequest, HttpParser
+
+        request = HttpRequest()
+        HttpParser(request).feed_data(b'GET /?a=1&b&a=2&c=x=y HTTP/1.1\r\nHost: a.com\r\nCookie: a=1; b=2\r\n\r\n')
+        self.assertIsNone(request.url._query)
+        self.assertIsNotNone(request._raw_cookies)
+        self.assertNotIn(b'Cookie', request.headers)
+
+        self.assertEqual(request.url.query[b'a'], b'2')
+        self.assertEqual(request.url.query.getall(b'a'), [b'1', b'2'])
+        self.assertEqual(dict(request.url.query), {b'a': b'2', b'b': b'', b'c': b'x=y'})
+        self.assertEqual(request.url.match_info, {})
+
+        cookie = list(request.cookies.values())[0]
+        self.assertEqual((cookie.domain, cookie.values), (b'a.com', {b'a': b'1', b'b': b'2'}))
+        self.assertIsNone(request._raw_cookies)
+
+    def test_body_assembly(self):
+        from stormhttp import HttpRequest, HttpParser
+
+        # Known length in several chunks is assembled in a preallocated buffer.
+        request = HttpRequest()
+        parser = HttpParser(request)
+        parser.feed_data(b'POST / HTTP/1.1\r\nContent-Length: 8\r\n\r\nabcd')
+        parser.feed_data(b'efgh')
+        self.assertEqual(request.content_length, 8)
+        self.assertIsInstance(request.body_view, memoryview)
+        self.assertIs(request.body_view.obj, request._body_array)
+        self.assertIs(type(request.body), bytes)
+        self.assertEqual(request.body, b'abcdefgh')
+        self.assertEqual(request.to_bytes(), b'POST / HTTP/1.1\r\nCONTENT-LENGTH: 8\r\n\r\nabcdefgh')
+
+        # Bodies over the spool size are written to a file and memory-mapped.
+        request = HttpRequest()
+        request.body_spool_size = 4
+        parser = HttpParser(request)
+        parser.feed_data(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n')
+        self.assertIsNone(request._body_spool)
+        parser.feed_data(b'3\r\ndef\r\n0\r\n\r\n')
+        self.assertIsNotNone(request._body_spool)
+        self.assertEqual(bytes(request.body_view), b'abcdef')
+        self.assertIs(type(request.body), bytes)
+        self.assertEqual(request.body, b'abcdef')
+        self.assertEqual(request.body_string(), 'abcdef')
+        request.reset()
+        self.assertIsNone(request._body_spool)
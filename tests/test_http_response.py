@@ -45,3 +45,42 @@ class TestHttpResponse(unittest.TestCase):
         self.assertTrue(cookie.http_only)
         self.assertEqual(cookie.max_age, 10)
         self.assertEqual(cookie.expires, datetime.datetime.utcfromtimestamp(0))
+
+    def test_response_buffers(self):
+        from stormhttp import HttpResponse
+        response = HttpResponse()
+        response.version = b'1.1'
+        response.status = b'OK'
+        response.status_code = 200
+        self.assertEqual(response.to_buffers(), (b'HTTP/1.1 200 OK\r\n\r\n',))
+
+        body = memoryview(bytearray(b'test'))
+        response.body = body
+        head, buffer = response.to_buffers()
+        self.assertEqual(head, b'HTTP/1.1 200 OK\r\n\r\n')
+        self.assertIs(buffer, body)
+        self.assertEqual(response.to_bytes(), b'HTTP/1.1 200 OK\r\n\r\ntest')
+
+    def test_response_freeze(self):
+        import gzip
+        from stormhttp import HttpResponse
+        response = HttpResponse(status_code=200, status=b'OK').freeze()
+        response.body = b'x' * 2000
+        self.assertTrue(response.is_frozen())
+
+        head, body = response.frozen_buffers(b'1.1')
+        self.assertEqual(head, b'HTTP/1.1 200 OK\r\nCONTENT-LENGTH: 2000\r\n')
+        self.assertEqual(body, b'x' * 2000)
+        self.assertIs(response.frozen_buffers(b'1.1')[0], head)
+
+        head, body = response.frozen_buffers(b'1.0', b'gzip')
+        self.assertIn(b'CONTENT-ENCODING: gzip\r\n', head)
+        self.assertEqual(gzip.decompress(body), b'x' * 2000)
+        self.assertEqual(response.body, b'x' * 2000)
+        self.assertNotIn(b'Content-Encoding', response.headers)
+
+        copy = response.copy()
+        copy.headers[b'X-Copy'] = b'1'
+        self.assertFalse(copy.is_frozen())
+        self.assertIs(copy.body, response.body)
+        self.assertNotIn(b'X-Copy', response.headers)
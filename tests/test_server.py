@@ -7,6 +7,33 @@ class FakeTransport(asyncio.WriteTransport):
         pass
 
 
+class RecordingTransport(asyncio.WriteTransport):
+    def __init__(self):
+        asyncio.WriteTransport.__init__(self)
+        self.data = b''
+        self.reading = True
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.data += data
+
+    def writelines(self, list_of_data):
+        for data in list_of_data:
+            self.write(data)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
 class TestServer(unittest.TestCase):
     def test_single_route(self):
         import stormhttp
@@ -226,3 +253,717 @@ class TestServer(unittest.TestCase):
             self.assertEqual(request.url.match_info[b'matchme'], b'bar')
 
         asyncio.get_event_loop().run_until_complete(main())
+
+    def test_reuse_port_listen_sockets(self):
+        from stormhttp.server.server import _create_listen_socket, _reuse_port_available
+        if not _reuse_port_available():
+            self.skipTest("SO_REUSEPORT is not supported on this platform.")
+
+        first = _create_listen_socket("127.0.0.1", 0, reuse_port=True)
+        try:
+            port = first.getsockname()[1]
+            second = _create_listen_socket("127.0.0.1", port, reuse_port=True)
+            self.assertEqual(second.getsockname()[1], port)
+            second.close()
+        finally:
+            first.close()
+
+    def test_middleware_chain_compiled_per_route(self):
+        import stormhttp
+
+        class RecordingMiddleware(stormhttp.server.middleware.AbstractMiddleware):
+            def __init__(self):
+                stormhttp.server.middleware.AbstractMiddleware.__init__(self)
+                self.calls = []
+
+            def before_handler(self, request):
+                self.calls.append(request.url.path)
+
+            async def after_handler(self, request, response):
+                response.headers[b'X-Recorded'] = b'1'
+
+        async def main():
+            server = stormhttp.server.Server()
+
+            def handler(_):
+                return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+            server.add_route(b'/foo', b'GET', handler)
+            server.add_route(b'/bar', b'GET', handler)
+            middleware = RecordingMiddleware()
+            middleware.add_route(b'/foo')
+            server.add_middleware(middleware)
+
+            for path in (b'/foo', b'/bar', b'/foo/'):
+                request = stormhttp.HttpRequest()
+                request.url = stormhttp.HttpUrl(path=path)
+                request.method = b'GET'
+                request.version = b'1.1'
+                response = await server.route_request(request, FakeTransport(), get_response=True)
+                self.assertEqual(b'X-Recorded' in response.headers, path != b'/bar')
+
+            self.assertEqual(middleware.calls, [b'/foo', b'/foo/'])
+            self.assertEqual(len(server.router.resolve(b'/bar')[0].middleware_chain), 0)
+
+        asyncio.get_event_loop().run_until_complete(main())
+
+    def test_middleware_should_be_applied_overridden(self):
+        import stormhttp
+
+        class PostOnlyMiddleware(stormhttp.server.middleware.AbstractMiddleware):
+            def should_be_applied(self, request):
+                return request.method == b'POST'
+
+            def before_handler(self, request):
+                return stormhttp.HttpResponse(status=b'Forbidden', status_code=403)
+
+            def after_handler(self, request, response):
+                pass
+
+        server = stormhttp.server.Server()
+        handler = lambda _: stormhttp.HttpResponse(status=b'OK', status_code=200)
+        server.add_route(b'/', b'GET', handler)
+        server.add_route(b'/', b'POST', handler)
+        server.add_middleware(PostOnlyMiddleware())
+
+        for method, status_code in ((b'GET', 200), (b'POST', 403)):
+            request = stormhttp.HttpRequest()
+            request.url = stormhttp.HttpUrl(path=b'/')
+            request.method = method
+            request.version = b'1.1'
+            self.assertEqual(server.dispatch(request, FakeTransport()).status_code, status_code)
+
+    def test_dispatch_sync_inline(self):
+        import stormhttp
+
+        server = stormhttp.server.Server()
+
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'sync'
+            return response
+
+        async def async_handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'async'
+            return response
+
+        server.add_route(b'/sync', b'GET', handler)
+        server.add_route(b'/async', b'GET', async_handler)
+
+        request = stormhttp.HttpRequest()
+        request.url = stormhttp.HttpUrl(path=b'/sync')
+        request.method = b'GET'
+        request.version = b'1.1'
+        response = server.dispatch(request, FakeTransport())
+        self.assertIsInstance(response, stormhttp.HttpResponse)
+        self.assertEqual(response.body, b'sync')
+
+        request.url = stormhttp.HttpUrl(path=b'/async')
+        pending = server.dispatch(request, FakeTransport())
+        self.assertNotIsInstance(pending, stormhttp.HttpResponse)
+        response = asyncio.get_event_loop().run_until_complete(pending)
+        self.assertEqual(response.body, b'async')
+
+    def test_cached_response_headers(self):
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        server.server_header = b'Test'
+        server.add_default_header(b'X-Frame-Options', b'DENY')
+
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'ok'
+            return response
+
+        def override_handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200, headers={b'X-Frame-Options': b'SAMEORIGIN'})
+            response.body = b'ok'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        server.add_route(b'/override', b'GET', override_handler)
+
+        request = stormhttp.HttpRequest()
+        request.url = stormhttp.HttpUrl(path=b'/')
+        request.method = b'GET'
+        request.version = b'1.1'
+        transport = RecordingTransport()
+        response = server.dispatch(request, transport)
+        head = bytes(transport.data)
+        self.assertIn(b'\r\nSERVER: Test\r\n', head)
+        self.assertIn(b'\r\nX-FRAME-OPTIONS: DENY\r\n', head)
+        self.assertIn(b'\r\nDATE: ', head)
+        self.assertNotIn(b'DATE', response.headers)
+
+        request.url = stormhttp.HttpUrl(path=b'/override')
+        transport = RecordingTransport()
+        server.dispatch(request, transport)
+        head = bytes(transport.data)
+        self.assertIn(b'\r\nX-FRAME-OPTIONS: SAMEORIGIN\r\n', head)
+        self.assertNotIn(b'DENY', head)
+        self.assertIn(b'\r\nSERVER: Test\r\n', head)
+        self.assertEqual(head.count(b'DATE: '), 1)
+
+    def test_frozen_response(self):
+        import gzip
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        frozen = stormhttp.HttpResponse(status=b'OK', status_code=200).freeze()
+        frozen.body = b'x' * 2000
+        server.add_route(b'/', b'GET', lambda _: frozen)
+
+        for encoding in (b'gzip', b'identity'):
+            request = stormhttp.HttpRequest()
+            request.url = stormhttp.HttpUrl(path=b'/')
+            request.method = b'GET'
+            request.version = b'1.1'
+            request.headers[b'Accept-Encoding'] = encoding
+            transport = RecordingTransport()
+            self.assertIs(server.dispatch(request, transport), frozen)
+            head, _, body = bytes(transport.data).partition(b'\r\n\r\n')
+            self.assertIn(b'\r\nDATE: ', head)
+            if encoding == b'gzip':
+                self.assertEqual(gzip.decompress(body), frozen.body)
+            else:
+                self.assertEqual(body, frozen.body)
+        self.assertEqual(frozen.body, b'x' * 2000)
+
+    def test_frozen_response_after_handler(self):
+        import stormhttp
+
+        class UserMiddleware(stormhttp.server.middleware.AbstractMiddleware):
+            def before_handler(self, request: stormhttp.HttpRequest):
+                pass
+
+            def after_handler(self, request: stormhttp.HttpRequest, response: stormhttp.HttpResponse):
+                response.headers[b'X-User'] = request.headers[b'X-User']
+
+        server = stormhttp.server.Server()
+        frozen = stormhttp.HttpResponse(status=b'OK', status_code=200).freeze()
+        frozen.body = b'frozen'
+        server.add_route(b'/', b'GET', lambda _: frozen)
+        middleware = UserMiddleware()
+        middleware.all_routes = True
+        server.add_middleware(middleware)
+
+        for user in (b'alice', b'bob'):
+            request = stormhttp.HttpRequest()
+            request.url = stormhttp.HttpUrl(path=b'/')
+            request.method = b'GET'
+            request.version = b'1.1'
+            request.headers[b'X-User'] = user
+            transport = RecordingTransport()
+            response = server.dispatch(request, transport)
+            self.assertIsNot(response, frozen)
+            self.assertIn(b'\r\nX-USER: %b\r\n' % user, bytes(transport.data))
+            self.assertTrue(bytes(transport.data).endswith(b'\r\n\r\nfrozen'))
+        self.assertNotIn(b'X-User', frozen.headers)
+
+    def test_compression_executor(self):
+        import gzip
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        server.executor_compression_length = 10000
+
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'x' * 20000
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        request = stormhttp.HttpRequest()
+        request.url = stormhttp.HttpUrl(path=b'/')
+        request.method = b'GET'
+        request.version = b'1.1'
+        request.headers[b'Accept-Encoding'] = b'gzip'
+        transport = RecordingTransport()
+        pending = server.dispatch(request, transport)
+        self.assertNotIsInstance(pending, stormhttp.HttpResponse)
+        self.assertEqual(transport.data, b'')
+        response = server.loop.run_until_complete(pending)
+        self.assertIsNotNone(server.compression_executor)
+        head, _, body = bytes(transport.data).partition(b'\r\n\r\n')
+        self.assertIn(b'CONTENT-ENCODING: gzip', head)
+        self.assertIn(b'CONTENT-LENGTH: %d' % len(response), head)
+        self.assertEqual(gzip.decompress(body), b'x' * 20000)
+        server.compression_executor.shutdown()
+
+    def test_max_connections_pauses_accepting(self):
+        import stormhttp
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        server.max_connections = 1
+
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'ok'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        listener = loop.run_until_complete(
+            loop.create_server(lambda: stormhttp.server.ServerHttpProtocol(server), "127.0.0.1", 0)
+        )
+        server._listeners = [listener]
+        port = listener.sockets[0].getsockname()[1]
+
+        async def main():
+            _, first_writer = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            self.assertTrue(server._accept_paused)
+            self.assertEqual(server.connection_count, 1)
+
+            # The second connection waits in the backlog until the first one closes.
+            second_reader, second_writer = await asyncio.open_connection("127.0.0.1", port)
+            second_writer.write(b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            await asyncio.sleep(0.05)
+            self.assertEqual(server.connection_count, 1)
+
+            first_writer.close()
+            head = await asyncio.wait_for(second_reader.readuntil(b'\r\n\r\n'), 1.0)
+            self.assertTrue(head.startswith(b'HTTP/1.1 200 OK'))
+            self.assertEqual(server.connection_count, 1)
+            second_writer.close()
+
+        try:
+            loop.run_until_complete(main())
+        finally:
+            for listener in server._listeners:
+                listener.close()
+            for sock in server._listen_sockets:
+                sock.close()
+            loop.close()
+
+    def test_connection_timeouts(self):
+        import stormhttp
+        from stormhttp.server.server import _TimeoutWheel
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        server._timeouts = _TimeoutWheel(server, resolution=0.01)
+        server.header_timeout = 0.05
+        server.keep_alive_timeout = 0.05
+        server.body_timeout = 0.05
+        server.max_requests_per_connection = 2
+        server.add_route(b'/', b'GET', lambda _: stormhttp.HttpResponse(status=b'OK', status_code=200))
+        server.add_route(b'/', b'POST', lambda _: stormhttp.HttpResponse(status=b'OK', status_code=200))
+
+        def connect():
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            transport = RecordingTransport()
+            protocol.connection_made(transport)
+            return protocol, transport
+
+        async def main():
+            # Slow headers.
+            protocol, transport = connect()
+            protocol.data_received(b'GET / HTTP/1.1\r\nHost: loc')
+            await asyncio.sleep(0.1)
+            self.assertTrue(transport.closed)
+
+            # Keep-alive after a response.
+            protocol, transport = connect()
+            protocol.data_received(b'GET / HTTP/1.1\r\n\r\n')
+            self.assertFalse(transport.closed)
+            await asyncio.sleep(0.03)
+            protocol.data_received(b'GET / HTTP/1.1\r\n')
+            await asyncio.sleep(0.03)
+            self.assertFalse(transport.closed)
+            await asyncio.sleep(0.05)
+            self.assertTrue(transport.closed)
+
+            # Maximum number of requests.
+            protocol, transport = connect()
+            protocol.data_received(b'GET / HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\n')
+            self.assertTrue(transport.closed)
+            self.assertEqual(bytes(transport.data).count(b'HTTP/1.1 200 OK'), 2)
+
+            # Slow upload that keeps sending, then stalls.
+            protocol, transport = connect()
+            protocol.data_received(b'POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\n')
+            for _ in range(4):
+                await asyncio.sleep(0.03)
+                protocol.data_received(b'x')
+            self.assertFalse(transport.closed)
+            await asyncio.sleep(0.1)
+            self.assertTrue(transport.closed)
+
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+    def test_graceful_shutdown(self):
+        import stormhttp
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        cancelled = []
+
+        async def handler(request):
+            try:
+                await asyncio.sleep(float(request.url.query[b'sleep']))
+            except asyncio.CancelledError:
+                cancelled.append(request.url.query_string)
+                raise
+            return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+        server.add_route(b'/', b'GET', handler)
+
+        class ClosingTransport(RecordingTransport):
+            def close(self):
+                if not self.closed:
+                    loop.call_soon(self.protocol.connection_lost, None)
+                RecordingTransport.close(self)
+
+        def connect(data: bytes):
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            transport = ClosingTransport()
+            transport.protocol = protocol
+            protocol.connection_made(transport)
+            if data:
+                protocol.data_received(data)
+            return transport
+
+        async def main():
+            silent = connect(b'')
+            idle = connect(b'GET /?sleep=0 HTTP/1.1\r\n\r\n')
+            busy = connect(b'GET /?sleep=0.05 HTTP/1.1\r\n\r\n')
+            await asyncio.sleep(0.01)
+            self.assertFalse(idle.closed)
+
+            # Connections that haven't sent a request don't hold up the shutdown.
+            started = loop.time()
+            await server.shutdown(timeout=1.0)
+            self.assertLess(loop.time() - started, 0.5)
+            self.assertTrue(silent.closed)
+            self.assertTrue(idle.closed)
+            self.assertTrue(busy.closed)
+            self.assertIn(b'HTTP/1.1 200 OK', bytes(busy.data))
+            self.assertEqual(server.connection_count, 0)
+
+            # Connections that outlive the timeout are closed and their handlers cancelled.
+            slow = connect(b'GET /?sleep=10 HTTP/1.1\r\n\r\n')
+            await asyncio.sleep(0.01)
+            await server.shutdown(timeout=0.05)
+            await asyncio.sleep(0.01)
+            self.assertTrue(slow.closed)
+            self.assertEqual(cancelled, [b'sleep=10'])
+
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+    def test_cancel_on_disconnect(self):
+        import stormhttp
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        requests = []
+        cancelled = []
+
+        async def handler(request):
+            requests.append(request)
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                cancelled.append(request.url.path)
+                raise
+            return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+        server.add_route(b'/cancel', b'GET', handler)
+        server.add_route(b'/finish', b'GET', handler, cancel_on_disconnect=False)
+
+        async def main():
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(RecordingTransport())
+            protocol.data_received(b'GET /cancel HTTP/1.1\r\n\r\nGET /finish HTTP/1.1\r\n\r\n')
+            await asyncio.sleep(0)
+            self.assertFalse(requests[0].is_disconnected)
+
+            protocol.connection_lost(None)
+            self.assertTrue(requests[1].is_disconnected)
+            await asyncio.sleep(0.1)
+            self.assertEqual(cancelled, [b'/cancel'])
+            self.assertEqual(protocol._tasks, {})
+
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+    def test_request_pool(self):
+        import stormhttp
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        server.request_pool_size = 1
+        seen = []
+
+        def handler(request):
+            seen.append(id(request))
+            self.assertEqual(len(request.headers), 1)
+            return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+        server.add_route(b'/', b'GET', handler)
+        protocol = stormhttp.server.ServerHttpProtocol(server)
+        transport = RecordingTransport()
+        protocol.connection_made(transport)
+        protocol.data_received(b'GET / HTTP/1.1\r\nX-A: 1\r\n\r\n')
+        protocol.data_received(b'GET / HTTP/1.1\r\nX-B: 2\r\n\r\n')
+        protocol.data_received(b'GET / HTTP/1.1\r\nX-C: 3\r\n\r\n')
+        self.assertEqual(bytes(transport.data).count(b'HTTP/1.1 200 OK'), 3)
+        self.assertEqual(seen[0], seen[2])
+        self.assertEqual(len(server._request_pool), 1)
+        loop.close()
+
+    def test_max_body_size(self):
+        import stormhttp
+
+        loop = asyncio.new_event_loop()
+        server = stormhttp.server.Server(loop=loop)
+        server.max_body_size = 8
+        bodies = []
+
+        def handler(request):
+            bodies.append(bytes(request.body))
+            return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+        server.add_route(b'/', b'POST', handler)
+
+        def connect():
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            transport = RecordingTransport()
+            protocol.connection_made(transport)
+            return protocol, transport
+
+        # Rejected as soon as the headers announce a body over the limit.
+        protocol, transport = connect()
+        protocol.data_received(b'POST / HTTP/1.1\r\nContent-Length: 4\r\n\r\nabcd'
+                               b'POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n')
+        data = bytes(transport.data)
+        self.assertLess(data.index(b'200 OK'), data.index(b'413 Payload Too Large'))
+        self.assertTrue(transport.closed)
+
+        # Chunked bodies are rejected once they grow over the limit.
+        protocol, transport = connect()
+        protocol.data_received(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nabcde\r\n')
+        self.assertFalse(transport.closed)
+        protocol.data_received(b'5\r\nfghij\r\n')
+        self.assertIn(b'413 Payload Too Large', bytes(transport.data))
+        self.assertTrue(transport.closed)
+        self.assertEqual(bodies, [b'abcd'])
+        loop.close()
+
+    def test_dispatch_resumes_async_after_handler(self):
+        import stormhttp
+
+        class SyncMiddleware(stormhttp.server.middleware.AbstractMiddleware):
+            def before_handler(self, request):
+                pass
+
+            def after_handler(self, request, response):
+                response.body += b'-sync'
+
+        class AsyncMiddleware(stormhttp.server.middleware.AbstractMiddleware):
+            def before_handler(self, request):
+                pass
+
+            async def after_handler(self, request, response):
+                response.body += b'-async'
+
+        server = stormhttp.server.Server()
+
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'handler'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        for middleware in (SyncMiddleware(), AsyncMiddleware()):
+            middleware.all_routes = True
+            server.add_middleware(middleware)
+
+        request = stormhttp.HttpRequest()
+        request.url = stormhttp.HttpUrl(path=b'/')
+        request.method = b'GET'
+        request.version = b'1.1'
+        response = asyncio.get_event_loop().run_until_complete(server.dispatch(request, FakeTransport()))
+        self.assertEqual(response.body, b'handler-async-sync')
+
+    def test_pipelined_responses_in_order(self):
+        import stormhttp
+
+        async def main():
+            server = stormhttp.server.Server()
+            server.pipeline_depth = 2
+
+            async def slow_handler(_):
+                await asyncio.sleep(0.05)
+                response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+                response.body = b'slow'
+                return response
+
+            def fast_handler(_):
+                response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+                response.body = b'fast'
+                return response
+
+            server.add_route(b'/slow', b'GET', slow_handler)
+            server.add_route(b'/fast', b'GET', fast_handler)
+
+            transport = RecordingTransport()
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(transport)
+            protocol.data_received(b'GET /slow HTTP/1.1\r\n\r\nGET /fast HTTP/1.1\r\n\r\n')
+
+            self.assertEqual(transport.data, b'')
+            self.assertFalse(transport.reading)
+            await asyncio.sleep(0.1)
+            self.assertTrue(transport.reading)
+            self.assertLess(transport.data.index(b'slow'), transport.data.index(b'fast'))
+
+        asyncio.get_event_loop().run_until_complete(main())
+
+    def test_write_backpressure(self):
+        import stormhttp
+
+        async def main():
+            server = stormhttp.server.Server()
+            transport = RecordingTransport()
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(transport)
+
+            protocol.pause_writing()
+            self.assertFalse(transport.reading)
+            drain = asyncio.ensure_future(protocol.drain())
+            await asyncio.sleep(0)
+            self.assertFalse(drain.done())
+
+            protocol.resume_writing()
+            await drain
+            self.assertTrue(transport.reading)
+
+        asyncio.get_event_loop().run_until_complete(main())
+
+    def test_stream_request_body(self):
+        import stormhttp
+
+        async def main():
+            server = stormhttp.server.Server()
+            server.body_stream_limit = 4
+            chunks = []
+
+            async def handler(request):
+                async for chunk in request.body_stream:
+                    chunks.append(chunk)
+                response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+                response.body = b''.join(chunks)
+                return response
+
+            server.add_route(b'/upload', b'POST', handler, stream_body=True)
+
+            transport = RecordingTransport()
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(transport)
+            protocol.data_received(b'POST /upload HTTP/1.1\r\nContent-Length: 10\r\n\r\n01234')
+            await asyncio.sleep(0)
+            self.assertEqual(chunks, [b'01234'])
+
+            protocol.data_received(b'56789')
+            await asyncio.sleep(0.01)
+            self.assertEqual(chunks, [b'01234', b'56789'])
+            self.assertTrue(transport.data.endswith(b'\r\n\r\n0123456789'))
+            self.assertTrue(transport.reading)
+
+        asyncio.get_event_loop().run_until_complete(main())
+
+    def test_stream_request_body_max_body_size(self):
+        import stormhttp
+
+        async def main():
+            server = stormhttp.server.Server()
+            server.max_body_size = 8
+            chunks = []
+
+            async def handler(request):
+                async for chunk in request.body_stream:
+                    chunks.append(chunk)
+                return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+            server.add_route(b'/upload', b'POST', handler, stream_body=True)
+
+            transport = RecordingTransport()
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(transport)
+            protocol.data_received(b'POST /upload HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nabcde\r\n')
+            await asyncio.sleep(0)
+            self.assertEqual(chunks, [b'abcde'])
+
+            protocol.data_received(b'5\r\nfghij\r\n')
+            await asyncio.sleep(0.01)
+            self.assertEqual(chunks, [b'abcde'])
+            self.assertIn(b'413 Payload Too Large', bytes(transport.data))
+            self.assertNotIn(b'200 OK', bytes(transport.data))
+            self.assertTrue(transport.closed)
+
+            # Bodies that go over the limit within a single read are rejected the same way.
+            chunks.clear()
+            transport = RecordingTransport()
+            protocol = stormhttp.server.ServerHttpProtocol(server)
+            protocol.connection_made(transport)
+            protocol.data_received(b'POST /upload HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                   b'5\r\nabcde\r\n5\r\nfghij\r\n0\r\n\r\n')
+            await asyncio.sleep(0.01)
+            self.assertEqual(chunks, [])
+            self.assertIn(b'413 Payload Too Large', bytes(transport.data))
+            self.assertTrue(transport.closed)
+
+        asyncio.get_event_loop().run_until_complete(main())
+
+    def test_streaming_response(self):
+        import stormhttp
+
+        async def main():
+            server = stormhttp.server.Server()
+
+            async def body():
+                yield b'hello'
+                yield b''
+                yield b' world'
+
+            def handler(_):
+                return stormhttp.StreamingHttpResponse(body(), status=b'OK', status_code=200)
+
+            def sync_handler(_):
+                return stormhttp.StreamingHttpResponse(iter([b'a', b'b']), status=b'OK', status_code=200)
+
+            server.add_route(b'/', b'GET', handler)
+            server.add_route(b'/sync', b'GET', sync_handler)
+
+            request = stormhttp.HttpRequest()
+            request.url = stormhttp.HttpUrl(path=b'/')
+            request.method = b'GET'
+            request.version = b'1.1'
+            transport = RecordingTransport()
+            await server.route_request(request, transport)
+            head, body = transport.data.split(b'\r\n\r\n', 1)
+            self.assertIn(b'TRANSFER-ENCODING: chunked', head)
+            self.assertNotIn(b'CONTENT-LENGTH', head)
+            self.assertEqual(body, b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n')
+
+            request.url = stormhttp.HttpUrl(path=b'/sync')
+            request.version = b'1.0'
+            transport = RecordingTransport()
+            await server.route_request(request, transport)
+            head, body = transport.data.split(b'\r\n\r\n', 1)
+            self.assertIn(b'CONNECTION: close', head)
+            self.assertEqual(body, b'ab')
+            self.assertTrue(transport.closed)
+
+        asyncio.get_event_loop().run_until_complete(main())
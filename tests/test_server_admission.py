@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+
+
+class _NullTransport:
+    def write(self, _):
+        pass
+
+    def writelines(self, _):
+        pass
+
+
+def _request(path: bytes):
+    import stormhttp
+    request = stormhttp.HttpRequest()
+    request.url = stormhttp.HttpUrl(path=path)
+    request.method = b'GET'
+    request.version = b'1.1'
+    return request
+
+
+def _make_server(admission):
+    import stormhttp
+    loop = asyncio.get_event_loop()
+    server = stormhttp.server.Server()
+    server.admission = admission
+    release = loop.create_future()
+
+    async def slow(_):
+        await release
+        return stormhttp.HttpResponse(status=b'OK', status_code=200)
+
+    server.add_route(b'/slow', b'GET', slow)
+    server.add_route(b'/fast', b'GET', lambda _: stormhttp.HttpResponse(status=b'OK', status_code=200))
+    return server, loop, release
+
+
+class TestServerAdmission(unittest.TestCase):
+    def test_queue_and_shed(self):
+        import stormhttp
+        admission = stormhttp.server.AdmissionController(max_in_flight=1, max_queue=1)
+        server, loop, release = _make_server(admission)
+
+        first = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        queued = loop.create_task(server.dispatch(_request(b'/fast'), _NullTransport()))
+        shed = server.dispatch(_request(b'/fast'), _NullTransport())
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed.headers[b'Retry-After'], [b'1'])
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 1))
+
+        release.set_result(None)
+        self.assertEqual(loop.run_until_complete(first).status_code, 200)
+        self.assertEqual(loop.run_until_complete(queued).status_code, 200)
+        self.assertEqual((admission.in_flight, admission.admitted, admission.shed), (0, 2, 1))
+
+    def test_route_limit(self):
+        import stormhttp
+        admission = stormhttp.server.AdmissionController()
+        server, loop, release = _make_server(admission)
+        server.router.resolve(b'/slow')[0].max_in_flight = 1
+
+        first = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        second = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(server.dispatch(_request(b'/fast'), _NullTransport()).status_code, 200)
+        self.assertEqual((admission.in_flight, admission.queue_depth), (1, 1))
+
+        release.set_result(None)
+        loop.run_until_complete(asyncio.gather(first, second))
+        self.assertEqual((admission.in_flight, admission.queue_depth), (0, 0))
+
+    def test_queue_timeout(self):
+        import stormhttp
+        admission = stormhttp.server.AdmissionController(max_in_flight=1, queue_timeout=0.01)
+        server, loop, release = _make_server(admission)
+
+        first = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        queued = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        self.assertEqual(loop.run_until_complete(queued).status_code, 503)
+        self.assertEqual((admission.timed_out, admission.queue_depth), (1, 0))
+
+        release.set_result(None)
+        loop.run_until_complete(first)
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_cancelled_while_queued(self):
+        import stormhttp
+        admission = stormhttp.server.AdmissionController(max_in_flight=1)
+        server, loop, release = _make_server(admission)
+
+        first = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        queued = loop.create_task(server.dispatch(_request(b'/slow'), _NullTransport()))
+        loop.run_until_complete(asyncio.sleep(0))
+        queued.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            loop.run_until_complete(queued)
+        self.assertEqual(admission.queue_depth, 0)
+
+        release.set_result(None)
+        loop.run_until_complete(first)
+        self.assertEqual(admission.in_flight, 0)
@@ -0,0 +1,250 @@
+import unittest
+
+
+class FakeTransport:
+    def write(self, data: bytes):
+        pass
+
+    def writelines(self, list_of_data):
+        pass
+
+
+def _make_server(cache_middleware, body: bytes=b'cached', headers=None):
+    import stormhttp
+    server = stormhttp.server.Server()
+    calls = []
+
+    def handler(request: stormhttp.HttpRequest):
+        calls.append(request)
+        response = stormhttp.HttpResponse(status=b'OK', status_code=200, headers=headers)
+        response.body = body
+        return response
+
+    server.add_route(b'/', b'GET', handler)
+    server.add_middleware(cache_middleware)
+    return server, calls
+
+
+def _request(path: bytes=b'/', headers=None, cookies=None):
+    import stormhttp
+    request = stormhttp.HttpRequest()
+    request.url = stormhttp.HttpUrl(path=path)
+    request.method = b'GET'
+    request.version = b'1.1'
+    for key, val in (headers or {}).items():
+        request.headers[key] = val
+    if cookies:
+        cookie = stormhttp.HttpCookie()
+        cookie.values.update(cookies)
+        request.cookies.add(cookie)
+    return request
+
+
+class TestServerResponseCache(unittest.TestCase):
+    def test_cache_hit(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware()
+        cache.add_route(b'/')
+        server, calls = _make_server(cache)
+
+        first = server.dispatch(_request(), FakeTransport())
+        second = server.dispatch(_request(), FakeTransport())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIsNot(first, second)
+        self.assertEqual(second.body, b'cached')
+        self.assertEqual(second.status_code, 200)
+
+        server.dispatch(_request(headers={b'Cache-Control': b'no-cache'}), FakeTransport())
+        self.assertEqual(len(calls), 2)
+
+    def test_cache_vary(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware()
+        cache.add_route(b'/')
+        server, calls = _make_server(cache, headers={b'Vary': b'Accept-Language, Accept-Encoding'})
+
+        server.dispatch(_request(headers={b'Accept-Language': b'en'}), FakeTransport())
+        server.dispatch(_request(headers={b'Accept-Language': b'fr'}), FakeTransport())
+        server.dispatch(_request(headers={b'Accept-Language': b'en', b'Accept-Encoding': b'gzip'}), FakeTransport())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.hits, 1)
+
+    def test_cache_cookies(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware()
+        cache.add_route(b'/')
+        server, calls = _make_server(cache)
+
+        server.dispatch(_request(cookies={b'session': b'alice'}), FakeTransport())
+        server.dispatch(_request(cookies={b'session': b'alice'}), FakeTransport())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.hits, 0)
+
+    def test_cache_vary_cookie(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware(cache_cookies=True)
+        cache.add_route(b'/')
+        server, calls = _make_server(cache, headers={b'Vary': b'Cookie'})
+
+        server.dispatch(_request(cookies={b'session': b'alice'}), FakeTransport())
+        server.dispatch(_request(cookies={b'session': b'bob'}), FakeTransport())
+        server.dispatch(_request(cookies={b'session': b'alice'}), FakeTransport())
+        server.dispatch(_request(), FakeTransport())
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(cache.hits, 1)
+
+    def test_cache_compressed_variants(self):
+        import gzip
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware()
+        cache.add_route(b'/')
+        server, calls = _make_server(cache, body=b'x' * 5000)
+
+        server.dispatch(_request(), FakeTransport())
+        first = server.dispatch(_request(headers={b'Accept-Encoding': b'gzip'}), FakeTransport())
+        second = server.dispatch(_request(headers={b'Accept-Encoding': b'gzip'}), FakeTransport())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first.headers[b'Content-Encoding'], [b'gzip'])
+        self.assertIs(first.body, second.body)
+        self.assertEqual(gzip.decompress(first.body), b'x' * 5000)
+
+    def test_cache_compresses_in_executor(self):
+        import asyncio
+        import concurrent.futures
+        import gzip
+        import stormhttp
+
+        class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+            submitted = 0
+
+            def submit(self, *args, **kwargs):
+                CountingExecutor.submitted += 1
+                return concurrent.futures.ThreadPoolExecutor.submit(self, *args, **kwargs)
+
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware()
+        cache.add_route(b'/')
+        server, calls = _make_server(cache, body=b'x' * 5000)
+        server.executor_compression_length = 1000
+        server.compression_executor = CountingExecutor(1)
+
+        async def main():
+            return [await server.route_request(_request(headers={b'Accept-Encoding': b'gzip'}), FakeTransport(),
+                                               get_response=True) for _ in range(3)]
+
+        responses = asyncio.get_event_loop().run_until_complete(main())
+        server.compression_executor.shutdown()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(CountingExecutor.submitted, 2)
+        self.assertIs(responses[1].body, responses[2].body)
+        self.assertEqual([gzip.decompress(response.body) for response in responses], [b'x' * 5000] * 3)
+
+    def test_cache_stale_while_revalidate(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware(ttl=0.0, stale_while_revalidate=60.0)
+        cache.add_route(b'/')
+        server, calls = _make_server(cache)
+
+        server.dispatch(_request(), FakeTransport())
+        next(iter(cache._entries.values())).revalidating = True
+        response = server.dispatch(_request(), FakeTransport())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stale_hits, 1)
+        self.assertEqual(response.body, b'cached')
+
+        next(iter(cache._entries.values())).revalidating = False
+        server.dispatch(_request(), FakeTransport())
+        self.assertEqual(len(calls), 2)
+
+    def test_cache_eviction(self):
+        import stormhttp
+        cache = stormhttp.server.middleware.ResponseCacheMiddleware(max_size=2500)
+        cache.all_routes = True
+        server, calls = _make_server(cache, body=b'x' * 500)
+        server.add_route(b'/<name>', b'GET', server.router.resolve(b'/')[0].handlers[b'GET'])
+
+        for path in (b'/a', b'/b', b'/c'):
+            server.dispatch(_request(path), FakeTransport())
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.size, 2500)
+        server.dispatch(_request(b'/a'), FakeTransport())
+        server.dispatch(_request(b'/c'), FakeTransport())
+        self.assertEqual(len(calls), 4)
+
+        # Vary names are dropped along with the last response of their URL.
+        for i in range(100):
+            request = _request(b'/e')
+            request.url = stormhttp.HttpUrl(path=b'/e', query=b'r=%d' % i)
+            server.dispatch(request, FakeTransport())
+        self.assertEqual(len(cache._vary), len(cache._entries))
+        self.assertEqual(set(cache._vary_entries.values()), {1})
+
+
+class TestServerCacheControl(unittest.TestCase):
+    def test_auto_etag_not_modified(self):
+        import stormhttp
+        policy = stormhttp.server.middleware.CacheControlPolicy(stormhttp.server.middleware.CACHE_CONTROL_PUBLIC,
+                                                                max_age=60, auto_etag=True)
+        cache_control = stormhttp.server.middleware.CacheControlMiddleware(policy)
+        cache_control.add_route(b'/', policy)
+        frozen = stormhttp.HttpResponse(status=b'OK', status_code=200).freeze()
+        frozen.body = b'x' * 5000
+        server = stormhttp.server.Server()
+        server.add_route(b'/', b'GET', lambda _: frozen)
+        server.add_middleware(cache_control)
+
+        response = server.dispatch(_request(), FakeTransport())
+        etag = response.headers[b'Etag'][0]
+        self.assertTrue(etag.startswith(b'W/"'))
+        self.assertEqual(response.headers[b'Cache-Control'], [b'public, max-age=60'])
+
+        response = server.dispatch(_request(headers={b'If-None-Match': b'"other", ' + etag[2:]}), FakeTransport())
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers[b'Etag'], [etag])
+        self.assertEqual(len(response), 0)
+        self.assertIs(cache_control._body_etags[b'/'][0], frozen)
+        self.assertEqual(cache_control._body_etags[b'/'][1], etag[2:])
+
+        response = server.dispatch(_request(headers={b'If-None-Match': b'"other"'}), FakeTransport())
+        self.assertEqual(response.status_code, 200)
+
+        # Bodies of responses that aren't frozen are hashed every time and not kept.
+        def handler(_):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'dynamic'
+            return response
+
+        cache_control.add_route(b'/dynamic', policy)
+        server.add_route(b'/dynamic', b'GET', handler)
+        response = server.dispatch(_request(b'/dynamic'), FakeTransport())
+        self.assertTrue(response.headers[b'Etag'][0].startswith(b'W/"'))
+        self.assertNotIn(b'/dynamic', cache_control._body_etags)
+
+    def test_validators_per_request(self):
+        import datetime
+        import stormhttp
+        policy = stormhttp.server.middleware.CacheControlPolicy(
+            etag=lambda request: b'"%b"' % request.headers[b'X-Version'][0],
+            last_modified=lambda _: datetime.datetime(2016, 9, 1)
+        )
+        cache_control = stormhttp.server.middleware.CacheControlMiddleware(policy)
+        cache_control.add_route(b'/', policy)
+        server, calls = _make_server(cache_control)
+
+        response = server.dispatch(_request(headers={b'X-Version': b'1', b'If-None-Match': b'"1"'}), FakeTransport())
+        self.assertEqual(response.status_code, 304)
+        request = _request(headers={b'X-Version': b'2', b'If-None-Match': b'"1"'})
+        response = server.dispatch(request, FakeTransport())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers[b'Etag'], [b'"2"'])
+        self.assertEqual(request.cache_validators, (b'"2"', None))
+        request.reset()
+        self.assertIsNone(request.cache_validators)
+
+        response = server.dispatch(_request(headers={b'X-Version': b'3', b'If-Modified-Since': b'Thu, 01 Sep 2016 00:00:00 GMT'}),
+                                   FakeTransport())
+        self.assertEqual(response.status_code, 304)
+        response = server.dispatch(_request(headers={b'X-Version': b'3', b'If-Modified-Since': b'Wed, 31 Aug 2016 00:00:00 GMT'}),
+                                   FakeTransport())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
@@ -0,0 +1,156 @@
+import unittest
+
+
+class FakeTransport:
+    def write(self, data: bytes):
+        pass
+
+    def writelines(self, list_of_data):
+        pass
+
+
+def _request():
+    import stormhttp
+    request = stormhttp.HttpRequest()
+    request.url = stormhttp.HttpUrl(path=b'/')
+    request.method = b'GET'
+    request.version = b'1.1'
+    return request
+
+
+def _parsed_request(data: bytes):
+    import stormhttp
+    request = stormhttp.HttpRequest()
+    stormhttp.HttpParser(request).feed_data(data)
+    return request
+
+
+class TestServerCoalescing(unittest.TestCase):
+    def test_coalesce_concurrent_requests(self):
+        import asyncio
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        calls = []
+
+        async def handler(request: stormhttp.HttpRequest):
+            calls.append(request)
+            await asyncio.sleep(0.01)
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'coalesced'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        coalescing = stormhttp.server.middleware.CoalescingMiddleware()
+        coalescing.add_route(b'/')
+        server.add_middleware(coalescing)
+
+        async def main():
+            return await asyncio.gather(*[
+                server.route_request(_request(), FakeTransport(), get_response=True) for _ in range(5)
+            ])
+
+        responses = asyncio.get_event_loop().run_until_complete(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(coalescing.coalesced, 4)
+        self.assertEqual(len({id(response) for response in responses}), 5)
+        self.assertEqual([response.body for response in responses], [b'coalesced'] * 5)
+
+        responses = asyncio.get_event_loop().run_until_complete(main())
+        self.assertEqual(len(calls), 2)
+
+    def test_coalesce_timeout(self):
+        import asyncio
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        calls = []
+
+        async def handler(request: stormhttp.HttpRequest):
+            calls.append(request)
+            await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'slow'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        coalescing = stormhttp.server.middleware.CoalescingMiddleware(timeout=0.01)
+        coalescing.add_route(b'/')
+        server.add_middleware(coalescing)
+
+        async def main():
+            return await asyncio.gather(*[
+                server.route_request(_request(), FakeTransport(), get_response=True) for _ in range(2)
+            ])
+
+        responses = asyncio.get_event_loop().run_until_complete(main())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(coalescing.coalesced, 0)
+        self.assertEqual([response.body for response in responses], [b'slow'] * 2)
+
+    def test_requests_with_cookies_not_coalesced(self):
+        import asyncio
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        calls = []
+
+        async def handler(request: stormhttp.HttpRequest):
+            calls.append(request)
+            await asyncio.sleep(0.01)
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = request.cookies.all()[b'session']
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        coalescing = stormhttp.server.middleware.CoalescingMiddleware()
+        coalescing.add_route(b'/')
+        server.add_middleware(coalescing)
+
+        async def main():
+            return await asyncio.gather(*[
+                server.route_request(_parsed_request(
+                    b'GET / HTTP/1.1\r\nHost: localhost\r\nCookie: session=%b\r\n\r\n' % user
+                ), FakeTransport(), get_response=True) for user in (b'alice', b'bob')
+            ])
+
+        responses = asyncio.get_event_loop().run_until_complete(main())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(coalescing.coalesced, 0)
+        self.assertEqual([response.body for response in responses], [b'alice', b'bob'])
+
+    def test_first_request_cancelled(self):
+        import asyncio
+        import stormhttp
+
+        server = stormhttp.server.Server()
+        calls = []
+
+        async def handler(request: stormhttp.HttpRequest):
+            calls.append(request)
+            await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.body = b'second'
+            return response
+
+        server.add_route(b'/', b'GET', handler)
+        coalescing = stormhttp.server.middleware.CoalescingMiddleware(timeout=2.0)
+        coalescing.add_route(b'/')
+        server.add_middleware(coalescing)
+
+        async def main():
+            loop = asyncio.get_event_loop()
+            first = loop.create_task(server.route_request(_request(), FakeTransport(), get_response=True))
+            await asyncio.sleep(0.01)
+            second = loop.create_task(server.route_request(_request(), FakeTransport(), get_response=True))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            started = loop.time()
+            response = await second
+            return response, loop.time() - started
+
+        response, waited = asyncio.get_event_loop().run_until_complete(main())
+        self.assertLess(waited, 0.5)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.body, b'second')
+        self.assertEqual(coalescing._in_flight, {})
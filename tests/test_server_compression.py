@@ -0,0 +1,53 @@
+import unittest
+
+
+class TestServerCompression(unittest.TestCase):
+    def test_skip_content_types(self):
+        from stormhttp.server import CompressionPolicy
+        policy = CompressionPolicy(min_length=100)
+        self.assertTrue(policy.should_compress(b'application/json', 1000))
+        self.assertTrue(policy.should_compress(None, 1000))
+        self.assertFalse(policy.should_compress(b'application/json', 100))
+        self.assertFalse(policy.should_compress(b'image/JPEG', 1000))
+        self.assertFalse(policy.should_compress(b'video/mp4; codecs="avc1"', 1000))
+        self.assertTrue(policy.should_compress(b'image/svg+xml', 1000))
+
+    def test_content_type_min_lengths(self):
+        from stormhttp.server import CompressionPolicy
+        policy = CompressionPolicy(min_length=1000, content_type_min_lengths={b'text/html': 100})
+        self.assertTrue(policy.should_compress(b'text/html; charset=utf-8', 200))
+        self.assertFalse(policy.should_compress(b'text/plain', 200))
+
+    def test_levels(self):
+        from stormhttp.server import CompressionPolicy
+        policy = CompressionPolicy(saturated_loop_lag=0.1)
+        self.assertEqual(policy.level(b'br'), 4)
+        self.assertEqual(policy.level(b'br', is_static=True), 11)
+        self.assertEqual(policy.level(b'br', loop_lag=0.2), 1)
+        self.assertEqual(policy.level(b'br', is_static=True, loop_lag=0.2), 11)
+
+    def test_server_uses_policy(self):
+        import stormhttp
+
+        server = stormhttp.server.Server()
+
+        def handler(request):
+            response = stormhttp.HttpResponse(status=b'OK', status_code=200)
+            response.headers[b'Content-Type'] = request.url.match_info[b'type'].replace(b'-', b'/')
+            response.body = b'x' * 2000
+            return response
+
+        server.add_route(b'/<type>', b'GET', handler)
+        for content_type, compressed in ((b'text-plain', True), (b'image-png', False)):
+            request = stormhttp.HttpRequest()
+            request.url = stormhttp.HttpUrl(path=b'/' + content_type)
+            request.method = b'GET'
+            request.version = b'1.1'
+            request.headers[b'Accept-Encoding'] = b'gzip'
+            response = server.dispatch(request, _NullTransport())
+            self.assertEqual(b'Content-Encoding' in response.headers, compressed)
+
+
+class _NullTransport:
+    def writelines(self, _):
+        pass
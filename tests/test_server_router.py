@@ -0,0 +1,58 @@
+import unittest
+
+
+class TestServerRouter(unittest.TestCase):
+    def test_static_and_dynamic_siblings(self):
+        from stormhttp.server import Router
+        router = Router()
+        static = router.add(b'/users/me')
+        dynamic = router.add(b'/users/<user>')
+        nested = router.add(b'/users/<user>/posts')
+
+        self.assertEqual(router.resolve(b'/users/me'), (static, {}))
+        self.assertEqual(router.resolve(b'/users/bob'), (dynamic, {b'user': b'bob'}))
+        self.assertEqual(router.resolve(b'/users/me/posts'), (nested, {b'user': b'me'}))
+        self.assertEqual(router.resolve(b'/users/bob/comments'), (None, {}))
+
+    def test_parameterized_siblings(self):
+        from stormhttp.server import Router
+        router = Router()
+        posts = router.add(b'/<user>/posts')
+        likes = router.add(b'/<name>/likes')
+
+        self.assertEqual(router.resolve(b'/bob/posts'), (posts, {b'user': b'bob'}))
+        self.assertEqual(router.resolve(b'/bob/likes'), (likes, {b'name': b'bob'}))
+
+    def test_many_parameterized_siblings(self):
+        from stormhttp.server import Router
+        router = Router()
+        routes = [router.add(b'/<param%d>/action%d' % (i, i)) for i in range(1000)]
+
+        self.assertEqual(len(router._root.dynamic), 1)
+        self.assertEqual(router.resolve(b'/bob/action0'), (routes[0], {b'param0': b'bob'}))
+        self.assertEqual(router.resolve(b'/bob/action999'), (routes[999], {b'param999': b'bob'}))
+        self.assertEqual(router.resolve(b'/bob/action1000'), (None, {}))
+        with self.assertRaises(ValueError):
+            router.add(b'/<other>/action0')
+
+    def test_converters(self):
+        import uuid
+        from stormhttp.server import Router
+        router = Router()
+        by_id = router.add(b'/items/<int:item_id>')
+        by_uuid = router.add(b'/items/<uuid:item_uuid>')
+        files = router.add(b'/files/<path:filename>')
+        key = uuid.uuid4()
+
+        self.assertEqual(router.resolve(b'/items/42'), (by_id, {b'item_id': 42}))
+        self.assertEqual(router.resolve(b'/items/' + str(key).encode()), (by_uuid, {b'item_uuid': key}))
+        self.assertEqual(router.resolve(b'/items/abc'), (None, {}))
+        self.assertEqual(router.resolve(b'/files/a/b/c.txt'), (files, {b'filename': b'a/b/c.txt'}))
+
+    def test_invalid_routes(self):
+        from stormhttp.server import Router
+        router = Router()
+        with self.assertRaises(ValueError):
+            router.add(b'/<unknown:value>')
+        with self.assertRaises(ValueError):
+            router.add(b'/<path:value>/more')
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class RecordingTransport(asyncio.WriteTransport):
+    def __init__(self):
+        asyncio.WriteTransport.__init__(self)
+        self.data = b''
+
+    def write(self, data: bytes):
+        self.data += data
+
+
+class TestServerStatic(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "file.txt"), "wb") as f:
+            f.write(b'0123456789')
+        with open(os.path.join(self.directory, "file.txt.gz"), "wb") as f:
+            f.write(b'gzipped')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _request(self, server, path: bytes, headers=None):
+        import stormhttp
+        request = stormhttp.HttpRequest()
+        request.url = stormhttp.HttpUrl(path=path)
+        request.method = b'GET'
+        request.version = b'1.1'
+        if headers is not None:
+            for key, val in headers.items():
+                request.headers[key] = val
+        transport = RecordingTransport()
+        response = asyncio.get_event_loop().run_until_complete(server.route_request(request, transport, get_response=True))
+        return response, transport.data.split(b'\r\n\r\n', 1)[1]
+
+    def test_static_file(self):
+        import stormhttp
+        for cache_max_size in (0, 1024):
+            server = stormhttp.server.Server()
+            server.add_static_route(b'/static', self.directory, cache_max_size=cache_max_size)
+
+            response, body = self._request(server, b'/static/file.txt')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(body, b'0123456789')
+            self.assertEqual(response.headers[b'Content-Type'], [b'text/plain'])
+
+            response, _ = self._request(server, b'/static/file.txt', {b'If-None-Match': response.headers[b'Etag'][0]})
+            self.assertEqual(response.status_code, 304)
+
+            response, _ = self._request(server, b'/static/../file.txt')
+            self.assertEqual(response.status_code, 404)
+
+    def test_static_file_precompressed(self):
+        import stormhttp
+        server = stormhttp.server.Server()
+        server.add_static_route(b'/static', self.directory)
+        response, body = self._request(server, b'/static/file.txt', {b'Accept-Encoding': b'gzip, br'})
+        self.assertEqual(response.headers[b'Content-Encoding'], [b'gzip'])
+        self.assertEqual(body, b'gzipped')
+
+    def test_static_file_ranges(self):
+        import stormhttp
+        for cache_max_size in (0, 1024):
+            server = stormhttp.server.Server()
+            server.add_static_route(b'/static', self.directory, cache_max_size=cache_max_size)
+
+            response, body = self._request(server, b'/static/file.txt', {b'Range': b'bytes=2-4'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.headers[b'Content-Range'], [b'bytes 2-4/10'])
+            self.assertEqual(body, b'234')
+
+            response, body = self._request(server, b'/static/file.txt', {b'Range': b'bytes=0-1,-2'})
+            self.assertEqual(response.status_code, 206)
+            self.assertTrue(response.headers[b'Content-Type'][0].startswith(b'multipart/byteranges'))
+            self.assertEqual(len(body), int(response.headers[b'Content-Length'][0]))
+            self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', body)
+            self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', body)
+
+            response, _ = self._request(server, b'/static/file.txt', {b'Range': b'bytes=20-'})
+            self.assertEqual(response.status_code, 416)
+
+            response, body = self._request(server, b'/static/file.txt', {b'Range': b'bytes=2-4', b'If-Range': b'"stale"'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(body, b'0123456789')
+
+    def test_static_file_cached_compression(self):
+        import gzip
+        import stormhttp
+        content = b'0123456789abcdef' * 1000
+        with open(os.path.join(self.directory, "large.txt"), "wb") as f:
+            f.write(content)
+        server = stormhttp.server.Server()
+        handler = server.add_static_route(b'/static', self.directory, cache_max_size=65536)
+
+        response, identity = self._request(server, b'/static/large.txt')
+        self.assertEqual(identity, content)
+        identity_etag = response.headers[b'Etag'][0]
+
+        response, encoded = self._request(server, b'/static/large.txt', {b'Accept-Encoding': b'gzip'})
+        self.assertEqual(response.headers[b'Content-Encoding'], [b'gzip'])
+        self.assertEqual(gzip.decompress(encoded), content)
+        self.assertNotEqual(response.headers[b'Etag'][0], identity_etag)
+        self.assertIs(response.body, handler._read_cached_encoded(os.path.join(handler.directory, "large.txt"),
+                                                                  content, b'gzip'))
+
+        # Ranges of the encoded file are never compressed again.
+        response, body = self._request(server, b'/static/large.txt', {b'Accept-Encoding': b'gzip', b'Range': b'bytes=0-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers[b'Content-Range'], [b'bytes 0-9/%d' % len(encoded)])
+        self.assertEqual(body, encoded[:10])
+
+        response, body = self._request(server, b'/static/large.txt', {b'Accept-Encoding': b'gzip', b'Range': b'bytes=0-1,-2'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(body), int(response.headers[b'Content-Length'][0]))
+        self.assertIn(b'\r\n\r\n' + encoded[:2] + b'\r\n', body)
+
+        # A stale If-Range of the identity file gets the whole encoded file.
+        response, body = self._request(server, b'/static/large.txt', {
+            b'Accept-Encoding': b'gzip', b'Range': b'bytes=0-9', b'If-Range': identity_etag
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, encoded)